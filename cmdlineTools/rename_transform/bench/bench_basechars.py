@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+'''比较 BaseChars 和 BaseCharsProduct 逐个调用 encode/decode 和批量调用
+encode_many/decode_many 的吞吐量（并检查结果相同）。
+
+用法：
+    python bench_basechars.py [-n COUNT] [-s SIZE] [-r REPEAT]
+'''
+
+__author__  = 'ChenyangGao <https://chenyanggao.github.io/>'
+__version__ = (0, 0, 1)
+
+import sys
+
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'rename_transform'))
+
+from argparse import ArgumentParser
+from os import urandom
+from timeit import repeat
+
+from util.basechars import BaseChars, BaseCharsProduct
+from common.generate_method import BASE4CHARS
+
+
+def bench(name, per_call, batch, items, times):
+    assert per_call(items) == batch(items), 'The results of %s are different' % name
+    t1 = min(repeat(lambda: per_call(items), number=1, repeat=times))
+    t2 = min(repeat(lambda: batch(items), number=1, repeat=times))
+    print('%-38s %10.0f/s %10.0f/s  x%.1f' % (
+        name, len(items) / t1, len(items) / t2, t1 / t2))
+
+
+def main():
+    parser = ArgumentParser(description='比较逐个和批量编码、解码的吞吐量')
+    parser.add_argument('-n', '--count', type=int, default=100_000, help='值的个数，默认值是 100000')
+    parser.add_argument('-s', '--size', type=int, default=5, help='每个值的字节数，默认值是 5')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='重复次数，取最小值，默认值是 3')
+    args = parser.parse_args()
+
+    values = [urandom(args.size) for _ in range(args.count)]
+    print('%d values of %d bytes' % (args.count, args.size))
+    print('%-38s %12s %12s' % ('', 'per call', 'batch'))
+    for label, cls, chars in (
+        ('BaseChars(%s)' % BASE4CHARS, BaseChars, BASE4CHARS),
+        ('BaseChars(16 chars)', BaseChars, '0123456789ABCDEF'),
+        ('BaseChars(64 chars, fallback)', BaseChars,
+            'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+-'),
+        ('BaseCharsProduct(%s)' % BASE4CHARS, BaseCharsProduct, BASE4CHARS),
+        ('BaseCharsProduct(16 chars)', BaseCharsProduct, '0123456789ABCDEF'),
+    ):
+        bc = cls(chars)
+        encoded = bc.encode_many(values)
+        bench(label + '.encode', lambda l: list(map(bc.encode, l)), bc.encode_many,
+              values, args.repeat)
+        bench(label + '.decode', lambda l: list(map(bc.decode, l)), bc.decode_many,
+              encoded, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+'''比较 html 链接改写的单遍实现（main.rewrite_html，带缓存）和之前的实现
+（依次用 CRE_REF、CRE_EL_STYLE 和 CRE_INLINE_STYLE 扫描 3 遍，每个链接都重新解析）
+的吞吐量，测试用的 html 文件有 10 万个以上的链接。
+
+用法：
+    python bench_rewrite.py [-n LINKS] [-r REPEAT]
+'''
+
+__author__  = 'ChenyangGao <https://chenyanggao.github.io/>'
+__version__ = (0, 0, 1)
+
+import sys
+import posixpath
+
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'rename_transform'))
+
+from argparse import ArgumentParser
+from functools import partial
+from timeit import repeat
+from urllib.parse import unquote, urlparse, urlunparse
+
+# main 模块在导入时会创建命令行解析器，但只在作为脚本运行时才解析参数
+from main import (
+    make_link_rebaser, rel_ref, relative_path, rewrite_html,
+    CRE_EL_STYLE, CRE_INLINE_STYLE, CRE_PROT, CRE_REF, CRE_URL,
+)
+
+
+def legacy_rewrite_html(text: str, srcpath: str, repl_map: dict) -> str:
+    '之前的实现'
+    def url_repl(m):
+        try:
+            link = next(filter(None, m.groups()))
+        except StopIteration:
+            return m[0]
+        urlparts = urlparse(link)
+        link = unquote(urlparts.path)
+        if link in ('', '.') or CRE_PROT.match(link) is not None:
+            return m[0]
+        full_link = relative_path(link, srcpath, lib=posixpath)
+        if full_link in repl_map:
+            dest_href = rel_ref(srcpath, repl_map[full_link])
+            return 'url("%s")' % urlunparse(urlparts._replace(path=dest_href))
+        else:
+            return m[0]
+
+    def ref_repl(m):
+        link = m['link']
+        urlparts = urlparse(link)
+        link = unquote(urlparts.path)
+        if link in ('', '.') or CRE_PROT.match(link) is not None:
+            return m[0]
+        full_link = relative_path(link, srcpath, lib=posixpath)
+        if full_link in repl_map:
+            dest_href = rel_ref(srcpath, repl_map[full_link])
+            return m[1] + urlunparse(urlparts._replace(path=dest_href))
+        else:
+            return m[0]
+
+    def sub_url_in_html(text, cre=CRE_EL_STYLE):
+        ls_repl_part = []
+        for match in cre.finditer(text):
+            repl_part, n = CRE_URL.subn(url_repl, match[0])
+            if n > 0:
+                ls_repl_part.append((match.span(), repl_part))
+        if ls_repl_part:
+            text_parts = []
+            last_stop = 0
+            for (start, stop), repl_part in ls_repl_part:
+                text_parts.append(text[last_stop:start])
+                text_parts.append(repl_part)
+                last_stop = stop
+            else:
+                text_parts.append(text[last_stop:])
+            return ''.join(text_parts)
+        return text
+
+    text = CRE_REF.sub(ref_repl, text)
+    text = sub_url_in_html(text, CRE_EL_STYLE)
+    return sub_url_in_html(text, CRE_INLINE_STYLE)
+
+
+def make_html(n: int) -> str:
+    '产生一个含有约 n 个链接的 html 文件（图片、超链接、style 属性和 <style> 元素）'
+    parts = ['<html><head><style>p{background:url("../Images/bg.png")}</style></head><body>\n']
+    for i in range(n // 4):
+        k = i % 500
+        parts.append(
+            '<p class="c%d" style="background:url(../Images/p%d.jpg)">'
+            '<img src="../Images/p%d.jpg" alt="x"/>'
+            '<a href="c%d.xhtml#n%d">note</a> <a href="https://example.com/%d">ext</a></p>\n'
+            % (k, k, k, k, i, i))
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def main():
+    parser = ArgumentParser(description='比较 html 链接改写的吞吐量')
+    parser.add_argument('-n', '--links', type=int, default=120_000, help='链接的数量，默认值是 120000')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='重复次数，取最小值，默认值是 3')
+    args = parser.parse_args()
+
+    repl_map = {'Images/bg.png': 'Images/0.png'}
+    for k in range(500):
+        repl_map['Images/p%d.jpg' % k] = 'Images/%d.jpg' % (k + 1)
+        repl_map['Text/c%d.xhtml' % k] = 'Text/%d.xhtml' % (k + 1)
+    srcpath = 'Text/c0.xhtml'
+    text = make_html(args.links)
+
+    old = legacy_rewrite_html(text, srcpath, repl_map)
+    new = rewrite_html(text, partial(make_link_rebaser(repl_map), srcpath))
+    assert old == new, 'The results are different'
+
+    size = len(text.encode('utf-8')) / 1024 / 1024
+    print('%d links, %.1f MB' % (args.links, size))
+    for name, fn in (
+        ('legacy', lambda: legacy_rewrite_html(text, srcpath, repl_map)),
+        ('single-pass', lambda: rewrite_html(text, partial(make_link_rebaser(repl_map), srcpath))),
+    ):
+        elapsed = min(repeat(fn, number=1, repeat=args.repeat))
+        print('%-12s %8.3f s  %8.1f MB/s  %10.0f links/s' % (
+            name, elapsed, size / elapsed, args.links / elapsed))
+
+
+if __name__ == '__main__':
+    main()
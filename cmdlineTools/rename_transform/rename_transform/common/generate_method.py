@@ -7,8 +7,10 @@ __version__ = (0, 0, 2)
 
 import posixpath
 
+from collections import deque
 from functools import partial
-from typing import cast, Any, Callable, Dict, Mapping, Optional, Set, Union
+from hashlib import blake2b
+from typing import cast, Any, Callable, Deque, Dict, List, Mapping, Optional, Set, Tuple, Union
 from uuid import uuid4
 from warnings import warn
 
@@ -145,6 +147,80 @@ def get_random_bytes(
     return _
 
 
+@register
+@as_closure
+def get_permuted_bytes(
+    size: int = 5, 
+    seed: Any = None, 
+    batch: int = 1024, 
+    rounds: int = 4, 
+):
+    # 用 Feistel 网络构造 [0, 2**(8*size)) 上的一个置换（对任意的轮函数都是双射），
+    # 依次置换 1, 2, 3, ...，所以产生的值互不相同，不需要记住已产生的值
+    assert size > 0 and batch > 0 and rounds > 0
+    half_bits = size * 4
+    half_mask = (1 << half_bits) - 1
+    limit = 1 << (size * 8)
+    keys: Tuple[int, ...] = ()
+    buffer: Deque[bytes] = deque()
+    n = 0
+    def make_keys(seed):
+        nonlocal keys
+        if seed is None:
+            material = random_bytes(16)
+        elif isinstance(seed, (bytes, bytearray)):
+            material = bytes(seed)
+        else:
+            material = str(seed).encode('utf-8')
+        digest = blake2b(material, digest_size=8 * rounds).digest()
+        keys = tuple(int.from_bytes(digest[i:i+8], 'big') for i in range(0, len(digest), 8))
+    def permute(i: int) -> int:
+        left, right = i >> half_bits, i & half_mask
+        for k in keys:
+            t = (right ^ k) * 0x9E3779B97F4A7C15
+            left, right = right, left ^ ((t ^ (t >> 29)) & half_mask)
+        return (left << half_bits) | right
+    def fill():
+        nonlocal n
+        stop = min(n + batch, limit)
+        if n >= stop:
+            raise OverflowError(f'get_permuted_bytes has been exhausted, {size=}')
+        # 置换后为 0 的值会被跳过，因为编码后它是空字符串
+        buffer.extend(
+            v.to_bytes(size, 'big') for v in map(permute, range(n, stop)) if v)
+        n = stop
+    def reset():
+        nonlocal n
+        n = 1
+        buffer.clear()
+        if seed is None:
+            make_keys(None)
+    def set_seed(value):
+        '设置种子（None 表示随机），并重置'
+        nonlocal seed
+        seed = value
+        make_keys(seed)
+        reset()
+    def many(k: int) -> List[bytes]:
+        '一次产生至多 k 个值（剩余的值不足 k 个时，返回剩余的值）'
+        while len(buffer) < k and n < limit:
+            fill()
+        if not buffer:
+            fill()
+        return [buffer.popleft() for _ in range(min(k, len(buffer)))]
+    def _() -> bytes:
+        '用 Feistel 网络置换递增计数，产生一个指定长度的字节字符串，保证互不相同，相同的种子（--seed）产生相同的序列'
+        if not buffer:
+            fill()
+        return buffer.popleft()
+    make_keys(seed)
+    reset()
+    _.reset = reset # type: ignore
+    _.seed = set_seed # type: ignore
+    _.many = many # type: ignore
+    return _
+
+
 def make_generator(
     gen: Callable[..., Union[int, bytes, str]],
     doc: Optional[str] = None,
@@ -177,11 +253,27 @@ def make_bcp_generator(
     chars: str = BASE4CHARS,
     doc: Optional[str] = None,
     name: Optional[str] = None,
+    batch: int = 1024,
 ) -> Callable[..., str]:
     ac: int = argcount(gen)
     generate: Callable[..., str]
     bcp = BaseChars(chars)
-    if ac == 0:
+    many: Optional[Callable[[int], list]] = getattr(gen, 'many', None)
+    if ac == 0 and many is not None:
+        # gen 可以批量产生值，所以也批量编码（BaseChars.encode_many），
+        # 重置时要同时清空已编码的值
+        buffer: Deque[str] = deque()
+        def generate(attrib: Mapping[str, str]) -> str:
+            if not buffer:
+                buffer.extend(bcp.encode_many(many(batch)))
+            return buffer.popleft()
+        gen_reset = getattr(gen, 'reset', None)
+        if gen_reset is not None:
+            def reset():
+                buffer.clear()
+                gen_reset()
+            generate.reset = reset # type: ignore
+    elif ac == 0:
         def generate(attrib: Mapping[str, str]) -> str:
             return bcp.encode(gen())
     elif ac == 1:
@@ -0,0 +1,122 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+__author__  = 'ChenyangGao <https://chenyanggao.github.io/>'
+__version__ = (0, 0, 1)
+__all__ = ['Journal', 'DEFAULT_JOURNAL', 'MODE_RENAME', 'MODE_DRY_RUN']
+
+
+from datetime import datetime
+from json import dumps, loads
+from os import path, stat
+from typing import Dict, Optional, Set, Tuple
+
+
+# 指定 --resume 但未指定 --journal 时，使用的日志文件
+DEFAULT_JOURNAL = '.rename_transform.jsonl'
+# 处理方式：产生改名后的 ePub 文件，或者试运行（--dry-run）只产生改名计划的 JSON 文件
+MODE_RENAME = 'rename'
+MODE_DRY_RUN = 'dry-run'
+
+
+class Journal:
+    '''记录每个 ePub 文件处理结果的日志文件，每行是一条 JSON 记录，
+    只会追加写入，所以程序中途退出，也不会损坏已有的记录。
+
+    每个源文件以 (绝对路径, 大小, 修改时间) 为键，同一个源文件以最后一条记录为准。
+    如果源文件被改动了，之前的记录就不再有效。
+    每条记录还记下了处理方式 mode（MODE_RENAME 或 MODE_DRY_RUN），同一个源文件的
+    不同处理方式分别记录，只有处理方式相同的记录，才算已经处理过。
+    '''
+
+    def __init__(self, journal_path: str, mode: str = MODE_RENAME):
+        self.path = journal_path
+        self.mode = mode
+        # {(绝对路径, 处理方式): 记录}
+        self.records: Dict[Tuple[str, str], dict] = {}
+        self._outputs: Optional[Set[str]] = None
+        self._file = None
+
+    @staticmethod
+    def make_key(epub: str) -> Tuple[str, int, int]:
+        '源文件的键 (绝对路径, 大小, 修改时间)'
+        st = stat(epub)
+        return path.abspath(epub), st.st_size, st.st_mtime_ns
+
+    def load(self) -> 'Journal':
+        '读取已有的记录（忽略无法解析的行，例如被中断写入的最后一行）'
+        if not path.isfile(self.path):
+            return self
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = loads(line)
+                    self.records[(record['path'], record['mode'])] = record
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return self
+
+    def is_done(self, epub: str) -> bool:
+        '源文件是否已经以当前的处理方式被成功处理过（并且源文件未被改动，产生的文件也还在）'
+        try:
+            abspath, size, mtime_ns = self.make_key(epub)
+        except OSError:
+            return False
+        record = self.records.get((abspath, self.mode))
+        return (
+            record is not None
+            and record.get('status') == 'done'
+            and record.get('size') == size
+            and record.get('mtime_ns') == mtime_ns
+            and path.isfile(record.get('output') or '')
+        )
+
+    def is_output(self, epub: str) -> bool:
+        '文件是否是之前成功处理时产生的文件（不应该再被当作源文件处理）'
+        if self._outputs is None:
+            self._outputs = {
+                record['output'] for record in self.records.values()
+                if record.get('status') == 'done' and record.get('output')
+            }
+        return path.abspath(epub) in self._outputs
+
+    def record(
+        self, 
+        epub: str, 
+        output: Optional[str] = None, 
+        error: Optional[str] = None, 
+        elapsed: float = 0, 
+    ):
+        '追加一条记录，并立即写入文件'
+        try:
+            abspath, size, mtime_ns = self.make_key(epub)
+        except OSError:
+            abspath, size, mtime_ns = path.abspath(epub), -1, -1
+        record = {
+            'path': abspath,
+            'mode': self.mode,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'status': 'failed' if error is not None else 'done',
+            'output': output and path.abspath(output),
+            'error': error,
+            'elapsed': round(elapsed, 6),
+            'time': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.records[(abspath, self.mode)] = record
+        self._outputs = None
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
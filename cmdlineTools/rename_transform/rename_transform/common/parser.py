@@ -54,6 +54,9 @@ def make_parser(parser=None):
                         help='每处理完一个文件，就对产生文件名的函数进行重置')
     parser.add_argument('-m', '--method', default='0', 
                         help='产生文件名的策略 （输入数字或名字，默认值 0）\n' + METHODS_DOC)
+    parser.add_argument('--seed', 
+                        help='产生文件名的函数的种子（目前只有 get_permuted_bytes 接受），'
+                             '相同的种子总是产生相同的文件名')
     parser.add_argument('-n', '--encode-filenames', dest='encode_filenames', action='store_true', 
                         help='对文件名用一些字符的可重排列进行编码')
     parser.add_argument('-ch', '--chars', default=BASE4CHARS, 
@@ -63,5 +66,24 @@ def make_parser(parser=None):
                         help='对改动的文件名进行百分号 %% 转义')
     parser.add_argument('-x', '--suffix', default='-repack', 
                         help='已处理的 ePub 文件名为在原来的 ePub 文件名的扩展名前面添加后缀，默认值是 -repack')
+    parser.add_argument('-j', '--jobs', type=int, default=1, 
+                        help='并行处理 ePub 文件的进程数，默认值是 1，即逐个处理；如果小于等于 0，则使用 CPU 核数。'
+                             '每个进程分别使用自己的文件名生成器，指定 -raf 时，每处理完一个文件，就会重置它')
+    parser.add_argument('--journal', 
+                        help='日志文件的路径（JSONL 格式），每处理完一个 ePub 文件，就追加一条记录，'
+                             '包括源文件的路径、大小、修改时间，处理方式（是否试运行），处理结果（成功或失败）和产生的文件路径')
+    parser.add_argument('--resume', action='store_true', 
+                        help='读取日志文件，跳过已经以相同的处理方式（是否指定 --dry-run）成功处理过（且源文件未改动、产生的文件还在）的文件，'
+                             '失败的文件会被重新处理。如果未指定 --journal，则使用当前工作目录下的 '
+                             '.rename_transform.jsonl')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--dry-run', dest='dry_run', action='store_true', 
+                       help='试运行，不产生 ePub 文件，只把改名计划（包括改名映射、OPF 中列出的文件，'
+                            '以及每个文本文件中需要改写的链接数）保存为 JSON 文件，'
+                            '文件名为 ePub 文件名去掉扩展名后加上 .plan.json')
+    group.add_argument('--plan', 
+                       help='应用之前用 --dry-run 保存的改名计划（JSON 文件），不再解析 OPF 文件和产生文件名，'
+                            '可以应用到文件布局相同的多个 ePub 文件上，缺少计划中列出的文件的 ePub 文件会处理失败，不产生文件。'
+                            '此时 -m、-n、-ch、-s、-q 和 -raf 被忽略')
     return parser
 
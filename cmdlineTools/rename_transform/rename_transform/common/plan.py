@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+__author__  = 'ChenyangGao <https://chenyanggao.github.io/>'
+__version__ = (0, 0, 1)
+__all__ = ['RenamePlan', 'PLAN_SUFFIX', 'PLAN_VERSION']
+
+
+from json import dump, load
+from typing import Dict, NamedTuple, Optional
+
+
+# 试运行时，保存改名计划的文件名为 ePub 文件名去掉扩展名后再加上这个后缀
+PLAN_SUFFIX = '.plan.json'
+# 改名计划的格式的版本，格式不兼容时会增加
+PLAN_VERSION = 1
+
+
+class RenamePlan(NamedTuple):
+    '''对一个 ePub 文件的改名计划，可以保存为 JSON 文件，以后再应用到这个 ePub 文件，
+    或者其它文件布局相同的 ePub 文件上，不需要再解析 OPF 文件和产生文件名。'''
+    # OPF 文件的路径
+    opf_path: str
+    # 在 OPF 文件中列出的文件，{路径: media-type}
+    items: Dict[str, str]
+    # 改名映射，{原来的路径: 新的 href（如果指定了 -q，则经过了百分号转义）}
+    repl_map: Dict[str, str]
+    # 需要改写的文本文件，{路径: 其中需要改写的链接数}，只在试运行时统计
+    references: Optional[Dict[str, int]] = None
+    # 产生这个计划的 ePub 文件
+    source: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {'version': PLAN_VERSION, **self._asdict()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'RenamePlan':
+        version = data.get('version')
+        if version != PLAN_VERSION:
+            raise ValueError('Unsupported plan version: %r' % version)
+        return cls(
+            opf_path=data['opf_path'],
+            items=data['items'],
+            repl_map=data['repl_map'],
+            references=data.get('references'),
+            source=data.get('source'),
+        )
+
+    def dump(self, plan_path: str):
+        '保存为 JSON 文件'
+        with open(plan_path, 'w', encoding='utf-8') as f:
+            dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, plan_path: str) -> 'RenamePlan':
+        '从 JSON 文件读取'
+        with open(plan_path, encoding='utf-8') as f:
+            return cls.from_dict(load(f))
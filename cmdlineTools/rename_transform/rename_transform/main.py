@@ -15,23 +15,34 @@ if __name__ == '__main__':
 import posixpath
 
 from argparse import Namespace
-from os import path
+from contextlib import contextmanager
+from functools import partial
+from os import cpu_count, path, remove, replace
 from pkgutil import get_data
 from re import compile as re_compile, Match, Pattern
+from time import perf_counter
 from typing import (
-    cast, Callable, Collection, Dict, Final, List, 
-    Optional, Tuple, Union, 
+    cast, Any, Callable, Collection, Dict, Final, Iterator, List, 
+    NamedTuple, Optional, Tuple, Union, 
 )
 from urllib.parse import quote, unquote, urlparse, urlunparse
 from xml.etree.ElementTree import fromstring, Element
 from zipfile import ZipFile, ZipInfo
 
 from util.path import relative_path, add_stem_suffix
+from util.ziputils import copy_member
 from common.generate_method import NAME_GENERATORS, make_generator, make_bcp_generator
+from common.journal import Journal, DEFAULT_JOURNAL, MODE_DRY_RUN, MODE_RENAME
+from common.plan import RenamePlan, PLAN_SUFFIX
 
 
 ENCRYPTION_XML = cast(bytes, get_data('src', 'encryption.xml'))
 METHODS_LIST = list(NAME_GENERATORS.values())
+OPF_MIMETYPE = 'application/oebps-package+xml'
+# 需要改写其中链接的文本文件的类型
+TEXT_MIMETYPES: Final[frozenset] = frozenset((
+    OPF_MIMETYPE, 'application/x-dtbncx+xml', 'text/css', 'text/html', 'application/xhtml+xml', 
+))
 
 CRE_ITEM_IN_OPF: Final[Pattern] = re_compile('<item\s[^>]+?/>')
 CRE_NAME: Final[Pattern] = re_compile(
@@ -46,6 +57,96 @@ CRE_EL_STYLE: Final[Pattern] = re_compile(
     r'<style(?:\s[^>]*|)>((?s:.+?))</style>')
 CRE_INLINE_STYLE: Final[Pattern] = re_compile(
     r'<[^/][^>]*?\sstyle="([^"]+)"')
+# 一次扫描 html/xhtml 时的记号：<style> 元素，或者（可能带有 style 属性的）开始标签，
+# style 属性的值中可能含有 >
+CRE_HTML_TOKEN: Final[Pattern] = re_compile(
+    r'(?P<style_el><style(?:\s[^>]*|)>(?s:.+?)</style>)'
+    r'|<[^/<>](?:[^<>"]+|(?<=\sstyle=)"[^"]+"|")*')
+# 开始标签内的第 1 个 href 或 src 属性
+CRE_TAG_REF: Final[Pattern] = re_compile(r'([\s:](?:href|src)=")(?P<link>[^>"]+)')
+# 开始标签内的第 1 个 style 属性
+CRE_TAG_STYLE: Final[Pattern] = re_compile(r'\sstyle="[^"]+"')
+
+
+def rel_ref(src: str, ref: str) -> str:
+    '文件 src 中指向文件 ref 的相对路径'
+    # NOTE: ca means common ancestors
+    ca = posixpath.commonprefix((src, ref)).count('/')
+    return '../' * (src.count('/') - ca) + '/'.join(ref.split('/')[ca:])
+
+
+def make_link_rebaser(repl_map: Dict[str, str]) -> Callable[[str, str], Optional[str]]:
+    '''返回一个函数 rebase(srcpath, link)，把文件 srcpath 中的链接 link 改为指向改名后的文件，
+    如果不需要修改，则返回 None。结果按 (srcpath 所在文件夹, link) 缓存，
+    同一个文件夹下的文件中相同的链接，只需解析一次。'''
+    cache: Dict[Tuple[str, str], Optional[str]] = {}
+
+    def rebase(srcpath: str, link: str) -> Optional[str]:
+        key = (posixpath.dirname(srcpath), link)
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        new_link = None
+        urlparts = urlparse(link)
+        link_path = unquote(urlparts.path)
+        if link_path not in ('', '.') and CRE_PROT.match(link_path) is None:
+            full_link = relative_path(link_path, srcpath, lib=posixpath)
+            if full_link in repl_map:
+                dest_href = rel_ref(srcpath, repl_map[full_link])
+                new_link = urlunparse(urlparts._replace(path=dest_href))
+        cache[key] = new_link
+        return new_link
+
+    return rebase
+
+
+def _url_repl(m: Match, rebase: Callable[[str], Optional[str]]) -> str:
+    try:
+        link = next(filter(None, m.groups()))
+    except StopIteration:
+        return m[0]
+    new_link = rebase(link)
+    if new_link is None:
+        return m[0]
+    return 'url("%s")' % new_link
+
+
+def _ref_repl(m: Match, rebase: Callable[[str], Optional[str]]) -> str:
+    new_link = rebase(m['link'])
+    if new_link is None:
+        return m[0]
+    return m[1] + new_link
+
+
+def rewrite_css(text: str, rebase: Callable[[str], Optional[str]]) -> str:
+    '改写 css 中 url(...) 的链接，rebase(link) 返回新的链接或 None'
+    return CRE_URL.sub(lambda m: _url_repl(m, rebase), text)
+
+
+def rewrite_xml(text: str, rebase: Callable[[str], Optional[str]]) -> str:
+    '改写 xml（例如 OPF 和 NCX）中 href 和 src 属性的链接'
+    return CRE_REF.sub(lambda m: _ref_repl(m, rebase), text)
+
+
+def rewrite_html(text: str, rebase: Callable[[str], Optional[str]]) -> str:
+    '''改写 html/xhtml 中 href 和 src 属性、<style> 元素，以及 style 属性中的链接，
+    只需扫描一遍文本（等价于依次用 CRE_REF、CRE_EL_STYLE 和 CRE_INLINE_STYLE 改写）'''
+    url_repl = lambda m: _url_repl(m, rebase)
+    ref_repl = lambda m: _ref_repl(m, rebase)
+
+    def repl(m):
+        token = m[0]
+        if m['style_el'] is not None:
+            return CRE_URL.sub(url_repl, token)
+        token = CRE_TAG_REF.sub(ref_repl, token, 1)
+        style = CRE_TAG_STYLE.search(token)
+        if style is not None:
+            stop = style.end()
+            token = CRE_URL.sub(url_repl, token[:stop]) + token[stop:]
+        return token
+
+    return CRE_HTML_TOKEN.sub(repl, text)
 
 
 def get_elnode_attrib(elnode: Union[bytes, str, Element], /) -> dict:
@@ -149,6 +250,181 @@ def make_repl_map(
     return repl_map
 
 
+@contextmanager
+def _part_file(target: str) -> Iterator[str]:
+    # 先写入 target + '.part'，成功后再改名为 target，中途失败则删除，
+    # 所以 target 要么不存在，要么是完整的
+    part = target + '.part'
+    try:
+        yield part
+    except BaseException:
+        if path.exists(part):
+            remove(part)
+        raise
+    replace(part, target)
+
+
+def normalize_scan_dirs(scan_dirs: Optional[Collection[str]]) -> Optional[Tuple[str, ...]]:
+    '规范化 -s 参数：None 表示扫描所有文件夹，空元组表示不对文件改名，否则每个文件夹都以 / 结尾'
+    if scan_dirs is None or '.' in scan_dirs or '' in scan_dirs:
+        return None
+    return tuple(dir_ if dir_.endswith('/') else dir_ + '/' for dir_ in scan_dirs)
+
+
+def rewrite_text(text: str, mimetype: str, rebase: Callable[[str], Optional[str]]) -> str:
+    '按文件类型改写文本文件中的链接'
+    if mimetype == 'text/css':
+        return rewrite_css(text, rebase)
+    elif mimetype in ('text/html', 'application/xhtml+xml'):
+        return rewrite_html(text, rebase)
+    else:
+        return rewrite_xml(text, rebase)
+
+
+def make_plan(
+    epub_zipfile: ZipFile, 
+    generate: Callable[..., str] = lambda attrib: attrib['id'], 
+    scan_dirs: Optional[Collection[str]] = None, 
+    quote_names: bool = False, 
+    count_references: bool = False, 
+) -> RenamePlan:
+    '''解析 OPF 文件，产生改名计划。如果 count_references 为真，
+    还会统计每个文本文件中需要改写的链接数（需要读取所有文本文件）'''
+    opf_path = get_opf_path(epub_zipfile)
+    itemmap = get_opf_itemmap(epub_zipfile, opf_path)
+    repl_map = make_repl_map(
+        itemmap=itemmap, 
+        generate=generate,
+        scan_dirs=normalize_scan_dirs(scan_dirs),
+        quote_names=quote_names,
+    )
+    plan = RenamePlan(
+        opf_path=opf_path, 
+        items={href: attrib['media-type'] for href, attrib in itemmap.items()}, 
+        repl_map=repl_map, 
+    )
+    if not count_references:
+        return plan
+
+    references: Dict[str, int] = {}
+    if repl_map:
+        rebase_link = make_link_rebaser(repl_map)
+        for srcpath, mimetype in ((opf_path, OPF_MIMETYPE), *plan.items.items()):
+            if mimetype not in TEXT_MIMETYPES or srcpath not in epub_zipfile.NameToInfo:
+                continue
+            count = 0
+            def rebase(link, rebase=partial(rebase_link, srcpath)):
+                nonlocal count
+                new_link = rebase(link)
+                if new_link is not None:
+                    count += 1
+                return new_link
+            rewrite_text(epub_zipfile.read(srcpath).decode('utf-8'), mimetype, rebase)
+            if count:
+                references[srcpath] = count
+    return plan._replace(references=references)
+
+
+def apply_plan(
+    src_epub: ZipFile, 
+    tgt_epub: ZipFile, 
+    plan: RenamePlan, 
+    remove_encrypt_file: bool = False, 
+    add_encrypt_file: bool = False, 
+):
+    '按改名计划，把 src_epub 中的文件改名并改写链接后，写入 tgt_epub'
+    opf_path = plan.opf_path
+    items = plan.items
+    repl_map = plan.repl_map
+    if opf_path not in src_epub.NameToInfo:
+        raise Exception('OPF file not found: %r' % opf_path)
+    rebase_link = make_link_rebaser(repl_map)
+    has_encrypt_file: bool = False
+
+    for zipinfo in src_epub.filelist:
+        if zipinfo.is_dir():
+            continue
+
+        srcpath: str = zipinfo.filename
+        is_opf: bool = srcpath == opf_path
+
+        if not is_opf and srcpath not in items:
+            if srcpath.startswith('META-INF/'):
+                if srcpath == 'META-INF/encryption.xml':
+                    if remove_encrypt_file:
+                        continue
+                    else:
+                        has_encrypt_file = True
+            elif srcpath != 'mimetype':
+                print('⚠️ 跳过文件', srcpath, 
+                    '，因为它未在 %s 内被列出' % opf_path)
+                continue
+            copy_member(src_epub, zipinfo, tgt_epub)
+            continue
+
+        # 没有文件需要改名（例如 -s 未传任何参数），所有文件都原样复制
+        if not repl_map:
+            copy_member(src_epub, zipinfo, tgt_epub)
+            continue
+
+        mimetype = OPF_MIMETYPE if is_opf else items[srcpath]
+        tgtpath = unquote(repl_map.get(srcpath, srcpath))
+
+        # 只有文本文件才需要读取和改写，其它文件（以及内容未变的文本文件）
+        # 都直接复制压缩后的数据，只修改文件名
+        if mimetype in TEXT_MIMETYPES:
+            text = src_epub.read(zipinfo).decode('utf-8')
+            text_new = rewrite_text(text, mimetype, partial(rebase_link, srcpath))
+            if text != text_new:
+                content = text_new.encode('utf-8')
+                zipinfo.file_size = len(content)
+                zipinfo.filename = tgtpath
+                tgt_epub.writestr(zipinfo, content)
+                continue
+
+        copy_member(src_epub, zipinfo, tgt_epub, tgtpath)
+
+    if add_encrypt_file and not has_encrypt_file:
+        tgt_epub.writestr('META-INF/encryption.xml', ENCRYPTION_XML)
+
+
+def check_plan(src_epub: ZipFile, plan: RenamePlan):
+    '''检查改名计划能否应用到 src_epub 上：OPF 文件和计划中列出的文件都要存在，
+    否则抛出异常，以免产生缺少文件或者链接错误的 ePub 文件。
+    未在计划中列出的其它文件（例如 iTunesMetadata.plist），和按 OPF 文件改名时一样，会被跳过
+
+    Examples::
+        >>> from tempfile import TemporaryDirectory
+        >>> tempdir = TemporaryDirectory()
+        >>> epub_path = path.join(tempdir.name, 'book.epub')
+        >>> with ZipFile(epub_path, 'w') as zf:
+        ...     zf.writestr('mimetype', 'application/epub+zip')
+        ...     zf.writestr('META-INF/container.xml', '<container><rootfiles><rootfile '
+        ...         'full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+        ...         '</rootfiles></container>')
+        ...     zf.writestr('OEBPS/content.opf', '<package><manifest><item id="c1" '
+        ...         'href="Text/c1.xhtml" media-type="application/xhtml+xml"/></manifest></package>')
+        ...     zf.writestr('OEBPS/Text/c1.xhtml', '<html/>')
+        ...     zf.writestr('iTunesMetadata.plist', '<plist/>')
+        >>> plan = RenamePlan.load(plan_epub(epub_path))
+        >>> with ZipFile(rename_in_epub(epub_path, plan=plan)) as zf:
+        ...     sorted(zf.namelist())
+        ⚠️ 跳过文件 iTunesMetadata.plist ，因为它未在 OEBPS/content.opf 内被列出
+        ['META-INF/container.xml', 'OEBPS/Text/c1.xhtml', 'OEBPS/content.opf', 'mimetype']
+        >>> rename_in_epub(epub_path, plan=plan._replace(
+        ...     items={**plan.items, 'OEBPS/Text/c2.xhtml': 'application/xhtml+xml'}))
+        Traceback (most recent call last):
+            ...
+        Exception: Files in the plan not found: ['OEBPS/Text/c2.xhtml']
+        >>> tempdir.cleanup()
+    '''
+    if plan.opf_path not in src_epub.NameToInfo:
+        raise Exception('OPF file not found: %r' % plan.opf_path)
+    missing = [srcpath for srcpath in plan.items if srcpath not in src_epub.NameToInfo]
+    if missing:
+        raise Exception('Files in the plan not found: %r' % missing[:5])
+
+
 def rename_in_epub(
     epub_path: str, 
     generate: Callable[..., str] = lambda attrib: attrib['id'],
@@ -157,168 +433,113 @@ def rename_in_epub(
     remove_encrypt_file: bool = False,
     add_encrypt_file: bool = False,
     scan_dirs: Optional[Collection[str]] = None,
+    plan: Optional[RenamePlan] = None,
 ) -> str:
-    '对 ePub 内在 OPF 文件所在文件夹或子文件夹下的文件修改文件名'
+    '''对 ePub 内在 OPF 文件所在文件夹或子文件夹下的文件修改文件名。
+    如果指定了 plan，则检查文件布局相同后直接应用这个改名计划，不再解析 OPF 文件和产生文件名'''
     epub_path2 = add_stem_suffix(epub_path, stem_suffix)
-    has_encrypt_file: bool = False
-    is_empty_scan_dirs = scan_dirs == []
-
-    def normalize_dirname(dir_: str) -> str:
-        if dir_.endswith('/'):
-            return dir_
-        return dir_ + '/'
-
-    def rel_ref(src, ref):
-        # NOTE: ca means common ancestors
-        ca = posixpath.commonprefix((src, ref)).count('/')
-        return '../' * (src.count('/') - ca) + '/'.join(ref.split('/')[ca:])
-
-    def url_repl(m):
-        try:
-            link = next(filter(None, m.groups()))
-        except StopIteration:
-            return m[0]
-        urlparts = urlparse(link)
-        link = unquote(urlparts.path)
-        if link in ('', '.') or CRE_PROT.match(link) is not None:
-            return m[0]
-        full_link = relative_path(link, srcpath, lib=posixpath)
-        if full_link in repl_map:
-            dest_href = rel_ref(srcpath, repl_map[full_link])
-            return 'url("%s")' % urlunparse(urlparts._replace(path=dest_href))
+    with _part_file(epub_path2) as epub_part, \
+            ZipFile(epub_path, mode='r') as src_epub, \
+            ZipFile(epub_part, mode='w') as tgt_epub:
+        if plan is None:
+            plan = make_plan(
+                src_epub, 
+                generate=generate,
+                scan_dirs=scan_dirs,
+                quote_names=quote_names,
+            )
         else:
-            return m[0]
+            check_plan(src_epub, plan)
+        apply_plan(
+            src_epub, 
+            tgt_epub, 
+            plan, 
+            remove_encrypt_file=remove_encrypt_file,
+            add_encrypt_file=add_encrypt_file,
+        )
+    return epub_path2
 
-    def ref_repl(m):
-        link = m['link']
-        urlparts = urlparse(link)
-        link = unquote(urlparts.path)
-        if link in ('', '.') or CRE_PROT.match(link) is not None:
-            return m[0]
-        full_link = relative_path(link, srcpath, lib=posixpath)
-        if full_link in repl_map:
-            dest_href = rel_ref(srcpath, repl_map[full_link])
-            return m[1] + urlunparse(urlparts._replace(path=dest_href))
-        else:
-            return m[0]
-
-    def sub_url_in_html(text, cre=CRE_EL_STYLE):
-        ls_repl_part = []
-        for match in cre.finditer(text):
-            repl_part, n = CRE_URL.subn(url_repl, match[0])
-            if n > 0:
-                ls_repl_part.append((match.span(), repl_part))
-        if ls_repl_part:
-            text_parts = []
-            last_stop = 0
-            for (start, stop), repl_part in ls_repl_part:
-                text_parts.append(text[last_stop:start])
-                text_parts.append(repl_part)
-                last_stop = stop
-            else:
-                text_parts.append(text[last_stop:])
-            return ''.join(text_parts)
-        return text
 
-    if scan_dirs is not None:
-        if '.' in scan_dirs or '' in scan_dirs:
-            scan_dirs = None
-        else:
-            scan_dirs = tuple(map(normalize_dirname, scan_dirs))
-
-    with ZipFile(epub_path, mode='r') as src_epub, \
-            ZipFile(epub_path2, mode='w') as tgt_epub:
-        opf_path = get_opf_path(src_epub)
-        itemmap = get_opf_itemmap(src_epub, opf_path)
-        repl_map = make_repl_map(
-            itemmap=itemmap, 
+def plan_epub(
+    epub_path: str, 
+    plan_path: Optional[str] = None, 
+    generate: Callable[..., str] = lambda attrib: attrib['id'],
+    quote_names: bool = False,
+    scan_dirs: Optional[Collection[str]] = None,
+) -> str:
+    '''试运行：只产生 ePub 文件的改名计划（包括每个文本文件中需要改写的链接数），
+    保存为 JSON 文件 plan_path（默认为 ePub 文件名去掉扩展名后加上 .plan.json），不产生 ePub 文件'''
+    if plan_path is None:
+        plan_path = path.splitext(epub_path)[0] + PLAN_SUFFIX
+    with ZipFile(epub_path, mode='r') as src_epub:
+        plan = make_plan(
+            src_epub, 
             generate=generate,
             scan_dirs=scan_dirs,
             quote_names=quote_names,
+            count_references=True,
         )
+    plan = plan._replace(source=path.abspath(epub_path))
+    with _part_file(plan_path) as plan_part:
+        plan.dump(plan_part)
+    return plan_path
 
-        for zipinfo in src_epub.filelist:
-            if zipinfo.is_dir():
-                continue
-
-            srcpath: str = zipinfo.filename
-            is_opf: bool = srcpath == opf_path
-
-            if not is_opf and srcpath not in itemmap:
-                if srcpath.startswith('META-INF/'):
-                    if srcpath == 'META-INF/encryption.xml':
-                        if remove_encrypt_file:
-                            continue
-                        else:
-                            has_encrypt_file = True
-                elif srcpath != 'mimetype':
-                    print('⚠️ 跳过文件', srcpath, 
-                        '，因为它未在 %s 内被列出' % opf_path)
-                    continue
-                tgt_epub.writestr(zipinfo, src_epub.read(zipinfo))
-                continue
-
-            if is_empty_scan_dirs:
-                tgt_epub.writestr(zipinfo, src_epub.read(zipinfo))
-                continue
-
-            if not is_opf:
-                item_attrib = itemmap[srcpath]
-                mimetype = item_attrib['media-type']
-
-            content = src_epub.read(zipinfo)
-
-            if is_opf or mimetype in ('text/css', 'text/html', 
-                    'application/xhtml+xml', 'application/x-dtbncx+xml'):
-                text = content.decode('utf-8')
-                if is_opf or mimetype == 'application/x-dtbncx+xml':
-                    text_new = CRE_REF.sub(ref_repl, text)
-                elif mimetype == 'text/css':
-                    text_new = CRE_URL.sub(url_repl, text)
-                else:
-                    text_new = CRE_REF.sub(ref_repl, text)
-                    text_new = sub_url_in_html(text_new, CRE_EL_STYLE)
-                    text_new = sub_url_in_html(text_new, CRE_INLINE_STYLE)  
-                if text != text_new:
-                    content = text_new.encode('utf-8')
-                    zipinfo.file_size = len(content)
-
-            zipinfo.filename = unquote(repl_map.get(srcpath, srcpath))
-            tgt_epub.writestr(zipinfo, content)
-
-        if add_encrypt_file and not has_encrypt_file:
-            tgt_epub.writestr('META-INF/encryption.xml', ENCRYPTION_XML)
 
-    return epub_path2
+class ProcessResult(NamedTuple):
+    '处理一个 ePub 文件的结果'
+    path: str
+    output: Optional[str] = None
+    error: Optional[str] = None
+    elapsed: float = 0
 
 
-def main(
-    argv: Optional[List[str]] = None, 
-    args: Optional[Namespace] = None
-):
-    '主函数'
-    if args is None:
-        args = PARSER.parse_args(argv)
-
-    epub_list: List[str] = args.path + args.list
-
+def make_method(args: Namespace) -> Tuple[Callable[..., str], Optional[Callable[[], Any]]]:
+    '根据命令行参数，创建产生文件名的函数，以及每处理完一个文件后要调用的重置函数（可能为 None）'
     try:
         method = NAME_GENERATORS[args.method]
     except KeyError:
         method_index = int(args.method)
         method = METHODS_LIST[method_index]
 
-    reset = None
-    if args.reset_method_after_files_processed:
-        reset = getattr(method, 'reset', None)
+    seed = getattr(args, 'seed', None)
+    if seed is not None:
+        set_seed = getattr(method, 'seed', None)
+        if set_seed is None:
+            print('⚠️ 忽略 --seed，因为产生文件名的策略 %r 不接受种子' % args.method)
+        else:
+            set_seed(seed)
 
     if args.encode_filenames:
-        method = make_bcp_generator(method, args.chars)
+        generate = make_bcp_generator(method, args.chars)
     else:
-        method = make_generator(method)
+        generate = make_generator(method)
 
-    def process_file(epub):
-        try:
+    reset = None
+    if args.reset_method_after_files_processed:
+        # 包装后的函数可能有自己的缓存，要一起重置
+        reset = getattr(generate, 'reset', None) or getattr(method, 'reset', None)
+    return generate, reset
+
+
+def process_file(
+    epub: str, 
+    args: Namespace, 
+    method: Callable[..., str], 
+    reset: Optional[Callable[[], Any]] = None, 
+    plan: Optional[RenamePlan] = None, 
+) -> ProcessResult:
+    '''处理一个 ePub 文件，不会抛出异常，错误信息记录在结果中。
+    如果指定了 --dry-run，则只保存改名计划，产生的文件是这个计划的 JSON 文件'''
+    start = perf_counter()
+    try:
+        if getattr(args, 'dry_run', False):
+            newfilename = plan_epub(
+                epub, 
+                scan_dirs=args.scan_dirs,
+                quote_names=args.quote_names,
+                generate=method,
+            )
+        else:
             newfilename = rename_in_epub(
                 epub, 
                 scan_dirs=args.scan_dirs,
@@ -327,17 +548,38 @@ def main(
                 generate=method,
                 remove_encrypt_file=args.remove_encrypt_file,
                 add_encrypt_file=args.add_encrypt_file,
+                plan=plan,
             )
-            print('产生文件：', newfilename)
-        finally:
-            if reset:
-                reset()
+    except Exception as exc:
+        return ProcessResult(
+            epub, error='%s: %s' % (type(exc).__qualname__, exc), 
+            elapsed=perf_counter() - start)
+    finally:
+        if reset:
+            reset()
+    return ProcessResult(epub, output=newfilename, elapsed=perf_counter() - start)
 
-    print('【接收参数】\n', args, '\n')
-    print('【采用方法】\n', method.__name__, '\n')
-    print('【方法说明】\n', method.__doc__, '\n')
-    print('【处理结果】')
 
+# 工作进程中的 (args, method, reset, plan)，由 _init_worker 设置
+_WORKER_STATE: Optional[Tuple[
+    Namespace, Callable[..., str], Optional[Callable[[], Any]], Optional[RenamePlan]
+]] = None
+
+
+def _init_worker(args: Namespace, plan: Optional[RenamePlan] = None):
+    # 每个工作进程都有自己的文件名生成器，重置也只影响这个进程
+    global _WORKER_STATE
+    _WORKER_STATE = (args, *make_method(args), plan)
+
+
+def _process_in_worker(epub: str) -> ProcessResult:
+    args, method, reset, plan = cast(tuple, _WORKER_STATE)
+    return process_file(epub, args, method, reset, plan)
+
+
+def iter_epub_paths(args: Namespace) -> Iterator[str]:
+    '根据命令行参数，逐个产生待处理的 ePub 文件路径'
+    epub_list: List[str] = args.path + args.list
     recursive: bool = args.recursive
     if args.glob:
         from glob import iglob
@@ -345,7 +587,7 @@ def main(
         for epub_glob in epub_list:
             for fpath in iglob(epub_glob, recursive=recursive):
                 if path.isfile(fpath):
-                    process_file(fpath)
+                    yield fpath
     else:
         from util.path import iter_scan_files
 
@@ -355,9 +597,113 @@ def main(
             elif path.isdir(epub):
                 for fpath in iter_scan_files(epub, recursive=recursive): # type: ignore
                     if fpath.endswith('.epub'):
-                        process_file(fpath)
+                        yield fpath
             else:
-                process_file(epub)
+                yield epub
+
+
+def print_summary(results: List[ProcessResult], elapsed: float):
+    '打印汇总报告'
+    failures = [r for r in results if r.error is not None]
+    print('\n【汇总报告】')
+    print('共 %d 个文件，成功 %d 个，失败 %d 个，总用时 %.2f 秒' % (
+        len(results), len(results) - len(failures), len(failures), elapsed))
+    if results:
+        slowest = max(results, key=lambda r: r.elapsed)
+        print('平均每个文件用时 %.3f 秒，最慢的是 %r（%.3f 秒）' % (
+            sum(r.elapsed for r in results) / len(results), slowest.path, slowest.elapsed))
+    if failures:
+        print('失败的文件：')
+        for r in failures:
+            print('  ', r.path, '\n      ', r.error)
+
+
+def main(
+    argv: Optional[List[str]] = None, 
+    args: Optional[Namespace] = None
+) -> List[ProcessResult]:
+    '主函数'
+    if args is None:
+        args = PARSER.parse_args(argv)
+
+    method, reset = make_method(args)
+    jobs: int = getattr(args, 'jobs', 1)
+    if jobs <= 0:
+        jobs = cpu_count() or 1
+
+    plan: Optional[RenamePlan] = None
+    plan_path: Optional[str] = getattr(args, 'plan', None)
+    if plan_path:
+        plan = RenamePlan.load(plan_path)
+
+    print('【接收参数】\n', args, '\n')
+    if plan is not None:
+        print('【改名计划】\n', plan_path, '（%d 个文件被改名，不再解析 OPF 文件和产生文件名）\n' 
+              % len(plan.repl_map))
+    else:
+        print('【采用方法】\n', method.__name__, '\n')
+        print('【方法说明】\n', method.__doc__, '\n')
+    if jobs > 1 and plan is None and not args.reset_method_after_files_processed:
+        print('⚠️ 用 %d 个进程并行处理，每个进程的文件名生成器分别计数（未指定 -raf），'
+              '产生的文件名可能与逐个处理时不同\n' % jobs)
+    print('【处理结果】')
+
+    journal: Optional[Journal] = None
+    journal_path: Optional[str] = getattr(args, 'journal', None)
+    resume: bool = getattr(args, 'resume', False)
+    if resume and not journal_path:
+        journal_path = DEFAULT_JOURNAL
+    if journal_path:
+        journal = Journal(
+            journal_path, 
+            mode=MODE_DRY_RUN if getattr(args, 'dry_run', False) else MODE_RENAME, 
+        )
+        if resume:
+            journal.load()
+
+    epubs = list(iter_epub_paths(args))
+    if resume:
+        outputs = [epub for epub in epubs if journal.is_output(epub)] # type: ignore
+        done = [epub for epub in epubs if journal.is_done(epub)] # type: ignore
+        if outputs or done:
+            skipped = set(outputs).union(done)
+            epubs = [epub for epub in epubs if epub not in skipped]
+            print('⏭️ 跳过 %d 个在日志 %r 中已完成的文件，以及 %d 个之前产生的文件' 
+                  % (len(done), journal_path, len(outputs)))
+    total = len(epubs)
+    results: List[ProcessResult] = []
+
+    def report(result: ProcessResult):
+        results.append(result)
+        if journal is not None:
+            journal.record(result.path, result.output, result.error, result.elapsed)
+        if result.error is None:
+            print('[%d/%d] 产生文件：' % (len(results), total), result.output)
+        else:
+            print('[%d/%d] ❌ 处理失败：' % (len(results), total), result.path, 
+                  '，因为', result.error)
+
+    start = perf_counter()
+    try:
+        if jobs > 1 and total > 1:
+            from concurrent.futures import as_completed, ProcessPoolExecutor
+
+            with ProcessPoolExecutor(
+                max_workers=min(jobs, total), 
+                initializer=_init_worker, 
+                initargs=(args, plan), 
+            ) as executor:
+                futures = [executor.submit(_process_in_worker, epub) for epub in epubs]
+                for future in as_completed(futures):
+                    report(future.result())
+        else:
+            for epub in epubs:
+                report(process_file(epub, args, method, reset, plan))
+    finally:
+        if journal is not None:
+            journal.close()
+    print_summary(results, perf_counter() - start)
+    return results
 
 
 if __name__ == '__main__':
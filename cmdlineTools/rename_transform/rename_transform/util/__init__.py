@@ -2,4 +2,5 @@ from .basechars import *
 from .matter import *
 from .path import *
 from .undefined import  *
+from .ziputils import *
 
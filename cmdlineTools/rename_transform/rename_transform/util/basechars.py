@@ -8,7 +8,7 @@ __all__ = ['BaseCharsEncodeError', 'BaseCharsDecodeError', 'BaseChars', 'BaseCha
 
 from itertools import product
 from types import MappingProxyType
-from typing import Any, ByteString, Dict, Tuple
+from typing import Any, ByteString, Dict, Iterable, List, Optional, Tuple
 
 from .matter import astype_bytes
 
@@ -21,9 +21,18 @@ class BaseCharsDecodeError(ValueError):
     pass
 
 
+def _as_bytes(s: Any) -> bytes:
+    if isinstance(s, bytes):
+        return s
+    elif isinstance(s, ByteString):
+        return bytes(s)
+    return astype_bytes(s)
+
+
 class BaseChars:
 
-    __slots__: Tuple[str, ...] = ('_chars', '_charmap', '_bits', '_sup')
+    __slots__: Tuple[str, ...] = (
+        '_chars', '_charmap', '_bits', '_sup', '_charset', '_table', '_digits')
 
     def __init__(self, chars: str) -> None:
         l: int = len(chars)
@@ -37,6 +46,28 @@ class BaseChars:
         self._chars: str = chars
         self._bits: int = l.bit_length() - 1
         self._sup: int = (1 << self._bits) - 1
+        self._charset: frozenset = frozenset(chars)
+        # 当每个字符表示 1、2、4 或 8 位时，每个字节正好对应固定个数的字符，
+        # _table 是 256 个字节分别对应的字符串，可用于 str.translate
+        self._table: Optional[List[str]] = None
+        if 8 % self._bits == 0:
+            width = 8 // self._bits
+            self._table = [self._encode_fixed(i, width) for i in range(256)]
+        # 当字符数不超过 36 时，可以把每个字符转换为 int() 所用的数字，
+        # _digits 是字符到数字的映射，可用于 str.translate
+        self._digits: Optional[Dict[int, str]] = None
+        if l <= 36:
+            self._digits = {
+                ord(ch): '0123456789abcdefghijklmnopqrstuvwxyz'[i] 
+                for i, ch in enumerate(chars)
+            }
+
+    def _encode_fixed(self, n: int, width: int) -> str:
+        chars: str = self._chars
+        return ''.join(
+            chars[(n >> (self._bits * i)) & self._sup] 
+            for i in reversed(range(width))
+        )
 
     def encode_int(self, n: int) -> str:
         chars: str = self._chars
@@ -77,10 +108,60 @@ class BaseChars:
 
     decode = decode_bytes
 
+    def encode_many(self, items: Iterable[Any]) -> List[str]:
+        '''批量编码，结果与逐个调用 encode 相同。每个字符表示 1、2、4 或 8 位时，
+        用 256 个字节的查找表逐个字节转换（str.translate），否则逐个调用 encode'''
+        table = self._table
+        if table is None:
+            return [self.encode(s) for s in items]
+        zero: str = self._chars[0]
+        encode_int = self.encode_int
+        result: List[str] = []
+        append = result.append
+        try:
+            for s in items:
+                if isinstance(s, int):
+                    if s < 0:
+                        append(encode_int(s))
+                        continue
+                    s = s.to_bytes((s.bit_length() + 7) // 8, 'big')
+                else:
+                    s = _as_bytes(s)
+                # encode_int 不产生前导的 0（即字符 chars[0]）
+                append(s.decode('latin-1').translate(table).lstrip(zero))
+        except BaseCharsEncodeError:
+            raise
+        except Exception as exc:
+            raise BaseCharsEncodeError from exc
+        return result
+
+    def decode_many(self, strings: Iterable[str]) -> List[bytes]:
+        '''批量解码，结果与逐个调用 decode 相同。字符数不超过 36 时，
+        先把字符转换为数字，再用 int() 解析，否则逐个调用 decode'''
+        digits = self._digits
+        if digits is None:
+            return [self.decode(s) for s in strings]
+        base: int = len(self._chars)
+        charset: frozenset = self._charset
+        result: List[bytes] = []
+        append = result.append
+        try:
+            for s in strings:
+                if not charset.issuperset(s):
+                    raise BaseCharsDecodeError('Invalid characters in %r' % s)
+                n = int(s.translate(digits), base) if s else 0
+                append(n.to_bytes((n.bit_length() + 7) // 8, 'big'))
+        except BaseCharsDecodeError:
+            raise
+        except Exception as exc:
+            raise BaseCharsDecodeError from exc
+        return result
+
 
 class BaseCharsProduct:
 
-    __slots__: Tuple[str, ...] = ('_chars', '_repeat', '_ivmap', '_vimap')
+    __slots__: Tuple[str, ...] = (
+        '_chars', '_repeat', '_ivmap', '_vimap', '_charset', '_table', '_digits')
 
     _expected_chars_count: Tuple[int, ...] = (1 << 1, 1 << 2, 1 << 4, 1 << 8)
     _expected_chars_repeat: Tuple[int, ...] = (8, 4, 2, 1)
@@ -105,6 +186,14 @@ class BaseCharsProduct:
         self._vimap: MappingProxyType = MappingProxyType(
             {v: k for k, v in self._ivmap.items()}
         )
+        self._charset: frozenset = frozenset(chars)
+        # 256 个字节分别对应的字符串，可用于 str.translate
+        self._table: List[str] = [self._ivmap[i] for i in range(256)]
+        # 字符到数字的映射（只有 256 个字符时，是到 latin-1 字符的映射），可用于 str.translate
+        self._digits: Dict[int, str] = {
+            ord(ch): ('0123456789abcdef'[i] if chars_count <= 16 else chr(i)) 
+            for i, ch in enumerate(chars)
+        }
 
     def encode_bytes(self, b: ByteString) -> str:
         ivmap = self._ivmap
@@ -129,3 +218,33 @@ class BaseCharsProduct:
 
     decode = decode_bytes
 
+    def encode_many(self, items: Iterable[Any]) -> List[str]:
+        '批量编码，结果与逐个调用 encode 相同，用 256 个字节的查找表逐个字节转换（str.translate）'
+        table: List[str] = self._table
+        try:
+            return [_as_bytes(s).decode('latin-1').translate(table) for s in items]
+        except Exception as exc:
+            raise BaseCharsEncodeError from exc
+
+    def decode_many(self, strings: Iterable[str]) -> List[bytes]:
+        '''批量解码，结果与逐个调用 decode 相同。先把字符转换为数字，再用 int() 解析
+        （只有 256 个字符时，转换为 latin-1 字符）'''
+        repeat: int = self._repeat
+        base: int = len(self._chars)
+        charset: frozenset = self._charset
+        digits: Dict[int, str] = self._digits
+        result: List[bytes] = []
+        append = result.append
+        try:
+            for s in strings:
+                if len(s) % repeat or not charset.issuperset(s):
+                    raise BaseCharsDecodeError('Invalid string %r' % s)
+                if repeat == 1:
+                    append(s.translate(digits).encode('latin-1'))
+                else:
+                    append(int(s.translate(digits) or '0', base).to_bytes(len(s) // repeat, 'big'))
+        except BaseCharsDecodeError:
+            raise
+        except Exception as exc:
+            raise BaseCharsDecodeError from exc
+        return result
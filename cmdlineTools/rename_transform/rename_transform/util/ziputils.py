@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+__author__  = 'ChenyangGao <https://chenyanggao.github.io/>'
+__version__ = (0, 0, 1)
+__all__ = ['copy_member']
+
+
+from copy import copy
+from struct import unpack, unpack_from
+from typing import Optional
+from zipfile import (
+    ZipFile, ZipInfo, BadZipFile, ZIP64_LIMIT, 
+    sizeFileHeader, stringFileHeader, structFileHeader, 
+    _FH_SIGNATURE, _FH_FILENAME_LENGTH, _FH_EXTRA_FIELD_LENGTH, 
+)
+
+
+def _strip_zip64_extra(extra: bytes) -> bytes:
+    # 如果需要，zip64 的扩展字段会被重新生成
+    parts = []
+    i, n = 0, len(extra)
+    while i + 4 <= n:
+        tp, ln = unpack_from('<HH', extra, i)
+        if tp != 0x0001:
+            parts.append(extra[i:i+4+ln])
+        i += 4 + ln
+    return b''.join(parts)
+
+
+def copy_member(
+    source: ZipFile, 
+    zinfo: ZipInfo, 
+    target: ZipFile, 
+    arcname: Optional[str] = None, 
+    bufsize: int = 1 << 20, 
+) -> ZipInfo:
+    '''把压缩包 `source` 中的成员 `zinfo` 复制到（以写模式打开的）压缩包 `target` 中，
+    如果指定了 `arcname`，则改用这个文件名。压缩后的数据会被分块原样复制，
+    不会解压再压缩，所以内存占用与文件大小无关。
+
+    :return: 在 `target` 中的新成员
+    '''
+    fp = source.fp
+    fp.seek(zinfo.header_offset)
+    fheader = fp.read(sizeFileHeader)
+    if len(fheader) != sizeFileHeader:
+        raise BadZipFile('Truncated file header')
+    fheader = unpack(structFileHeader, fheader)
+    if fheader[_FH_SIGNATURE] != stringFileHeader:
+        raise BadZipFile('Bad magic number for file header')
+    fp.seek(fheader[_FH_FILENAME_LENGTH] + fheader[_FH_EXTRA_FIELD_LENGTH], 1)
+
+    zinfo_new = copy(zinfo)
+    # CRC 和大小都是已知的，所以写在本地文件头中，而不是数据之后的数据描述符中
+    zinfo_new.flag_bits &= ~0x08
+    zinfo_new.extra = _strip_zip64_extra(zinfo.extra)
+    if arcname is not None:
+        zinfo_new.filename = zinfo_new.orig_filename = arcname
+    zip64 = zinfo.file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT
+
+    with target._lock:
+        out = target.fp
+        zinfo_new.header_offset = out.tell()
+        out.write(zinfo_new.FileHeader(zip64))
+        remaining = zinfo.compress_size
+        while remaining:
+            data = fp.read(min(remaining, bufsize))
+            if not data:
+                raise BadZipFile('Truncated file data of member %r' % zinfo.filename)
+            out.write(data)
+            remaining -= len(data)
+        target.filelist.append(zinfo_new)
+        target.NameToInfo[zinfo_new.filename] = zinfo_new
+        target.start_dir = out.tell()
+        target._didModify = True
+    return zinfo_new
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Benchmark the single-pass reference extractor (`util.watch.analyze_html`)
+against the previous implementation, which scans the text with 3 regular
+expressions in turn.
+
+Usage:
+    python bench_analyze.py [-n PARAGRAPHS] [-r REPEAT]
+"""
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+
+import sys
+import os.path as syspath
+
+sys.path.insert(0, syspath.join(syspath.dirname(syspath.dirname(syspath.abspath(__file__))), "watch_epub"))
+
+from argparse import ArgumentParser
+from collections import Counter
+from html import unescape
+from timeit import repeat
+from urllib.parse import unquote
+
+from util.watch import (
+    analyze_html, fileter_localpath, CRE_EL_STYLE, CRE_INLINE_STYLE, CRE_REF, CRE_URL, 
+)
+
+
+def legacy_analyze_html(bookpath, text):
+    "The previous implementation of `analyze_html`."
+    return {
+        "attr_href_src": Counter(fileter_localpath(
+            bookpath, (
+                unquote(m["link"])
+                for m in CRE_REF.finditer(text)
+            )
+        )), 
+        "attr_style": Counter(fileter_localpath(
+            bookpath, (
+                m[m.lastgroup]
+                for m0 in CRE_INLINE_STYLE.finditer(text)
+                for m in CRE_URL.finditer(unquote(m0["attr"]))
+            )
+        )), 
+        "el_style": Counter(fileter_localpath(
+            bookpath, (
+                unquote(m[m.lastgroup])
+                for m0 in CRE_EL_STYLE.finditer(text)
+                for m in CRE_URL.finditer(unescape(m0["text"]))
+            )
+        )), 
+    }
+
+
+def make_xhtml(n: int) -> str:
+    "Make a large XHTML document with `n` paragraphs."
+    para = (
+        '<p class="p%(i)d" id="p%(i)d">Lorem ipsum dolor sit amet, consectetur adipiscing '
+        'elit <a href="../Text/notes.xhtml#n%(i)d" id="r%(i)d">[%(i)d]</a>, sed do eiusmod '
+        '<span style="background: url(\'../Images/bg%(j)d.png\')">tempor</span> '
+        '<img alt="" src="../Images/img%(j)d.jpg"/> <a href="https://example.com/%(i)d">link</a></p>\n'
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml">\n<head>\n'
+        '<link href="../Styles/main.css" rel="stylesheet" type="text/css"/>\n'
+        '<style type="text/css">\nbody { background: url("../Images/body.png") }\n</style>\n'
+        '</head>\n<body>\n'
+        + "".join(para % {"i": i, "j": i % 100} for i in range(n))
+        + "</body>\n</html>"
+    )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--paragraphs", type=int, default=20000, help="number of paragraphs")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of repetitions")
+    args = parser.parse_args()
+
+    bookpath = "OEBPS/Text/chapter.xhtml"
+    text = make_xhtml(args.paragraphs)
+    print("Document size: %.1f KB" % (len(text) / 1024))
+
+    expected = legacy_analyze_html(bookpath, text)
+    got = analyze_html(bookpath, text)
+    print("Same results:", got == expected)
+
+    for name, fn in (("legacy", legacy_analyze_html), ("single-pass", analyze_html)):
+        best = min(repeat(lambda: fn(bookpath, text), number=1, repeat=args.repeat))
+        print("%-12s %8.2f ms" % (name, best * 1000))
+
+
+if __name__ == "__main__":
+    main()
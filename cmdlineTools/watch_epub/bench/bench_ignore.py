@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Benchmark the per-path cost of `util.ignore.GitIgnoreMatcher` (one combined
+regular expression, with and without the cache hits) against the previous
+implementation (one regular expression per pattern, tried one by one), as the
+number of patterns grows.
+
+Usage:
+    python bench_ignore.py [-n PATHS] [-p PATTERN_COUNTS ...]
+"""
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+
+import sys
+import os.path as syspath
+
+sys.path.insert(0, syspath.join(syspath.dirname(syspath.dirname(syspath.abspath(__file__))), "watch_epub"))
+
+from argparse import ArgumentParser
+from random import Random
+from re import compile as re_compile, IGNORECASE
+from time import perf_counter
+
+from util.ignore import translate, GitIgnoreMatcher
+
+
+def legacy_make_ignore(*pats, flags=IGNORECASE):
+    "The previous implementation (without negated patterns)."
+    matches = [re_compile(translate(pat), flags=flags).fullmatch for pat in pats]
+    return lambda path: any(match(path) is not None for match in matches)
+
+
+def make_patterns(n: int, rnd: Random) -> list[str]:
+    "Generate `n` patterns of the common forms."
+    pats = [".DS_Store", "._*", "Thumb.store", "desktop.ini", ".*.sw[px]", ".*.swpx"]
+    while len(pats) < n:
+        i = len(pats)
+        pats.append(rnd.choice((
+            "*.tmp%d", "/scratch%d/", "backup%d/", "Text/draft%d_*.xhtml", "**/cache%d/**", "file%d.bak",
+        )) % i)
+    return pats[:n]
+
+
+def make_paths(n: int, rnd: Random) -> list[str]:
+    "Generate `n` different book paths, a few of them are ignored."
+    dirs = ["OEBPS/Text", "OEBPS/Images", "OEBPS/Styles", "OEBPS/Fonts", "scratch7", "OEBPS/cache9/x"]
+    names = ["chapter", "image", "style", "font", "._chapter", "draft8_"]
+    exts = [".xhtml", ".jpg", ".css", ".ttf", ".tmp11", ".swp"]
+    return ["%s/%s%05d%s" % (rnd.choice(dirs), rnd.choice(names), i, rnd.choice(exts)) for i in range(n)]
+
+
+def per_path(fn, paths) -> float:
+    start = perf_counter()
+    for path in paths:
+        fn(path)
+    return (perf_counter() - start) / len(paths) * 1e6
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the per-path cost of the ignore matchers")
+    parser.add_argument("-n", "--paths", type=int, default=20000, help="number of paths, default 20000")
+    parser.add_argument("-p", "--patterns", type=int, nargs="*", default=[1, 6, 20, 100, 500],
+                        help="numbers of patterns, default 1 6 20 100 500")
+    args = parser.parse_args()
+
+    rnd = Random(0)
+    paths = make_paths(args.paths, rnd)
+    print("%d paths, cost per path in microseconds" % len(paths))
+    print("%9s %10s %10s %10s" % ("patterns", "legacy", "combined", "cached"))
+    for n in args.patterns:
+        pats = make_patterns(n, rnd)
+        legacy = legacy_make_ignore(*pats)
+        matcher = GitIgnoreMatcher(*pats, maxsize=None)
+        assert [legacy(p) for p in paths] == [matcher(p) for p in paths], "The results are different"
+        matcher.cache_clear()
+        t_legacy = per_path(legacy, paths)
+        t_combined = per_path(matcher, paths)
+        t_cached = per_path(matcher, paths)
+        print("%9d %10.2f %10.2f %10.2f" % (n, t_legacy, t_combined, t_cached))
+
+
+if __name__ == "__main__":
+    main()
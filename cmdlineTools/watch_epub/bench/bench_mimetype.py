@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Benchmark `util.mimetype`: the import time (in a new interpreter, `typing` and
+`pkgutil` are imported before, as the other modules do), the time to load the
+precomputed table at the first miss, and the cost of `guess_mimetype` for the
+EPUB core media types, the extensions in the table and the unknown extensions.
+
+Usage:
+    python bench_mimetype.py [-n PATHS] [-r REPEAT]
+"""
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+
+import sys
+import os.path as syspath
+
+WATCH_EPUB_DIR = syspath.join(syspath.dirname(syspath.dirname(syspath.abspath(__file__))), "watch_epub")
+sys.path.insert(0, WATCH_EPUB_DIR)
+
+from argparse import ArgumentParser
+from subprocess import check_output
+from time import perf_counter
+
+
+IMPORT_CODE = """\
+import typing, pkgutil
+from time import perf_counter
+start = perf_counter()
+import util.mimetype
+print(perf_counter() - start)
+"""
+
+
+def import_time(repeat: int) -> float:
+    return min(
+        float(check_output([sys.executable, "-c", IMPORT_CODE], cwd=WATCH_EPUB_DIR))
+        for _ in range(repeat)
+    )
+
+
+def per_call(fn, paths, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        for path in paths:
+            fn(path)
+        best = min(best, perf_counter() - start)
+    return best / len(paths) * 1e6
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark util.mimetype")
+    parser.add_argument("-n", "--paths", type=int, default=100000, help="number of paths, default 100000")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="repeat times, take the minimum, default 5")
+    args = parser.parse_args()
+
+    print("import util.mimetype: %.2f ms" % (import_time(args.repeat) * 1000))
+
+    from util import mimetype
+    from util.mimetype import guess_mimetype, EPUB_CORE_MEDIA_TYPES
+
+    start = perf_counter()
+    guess_mimetype("OEBPS/Misc/a.epub")
+    print("load the table at the first miss: %.2f ms" % ((perf_counter() - start) * 1000))
+
+    core = list(EPUB_CORE_MEDIA_TYPES)
+    table = [ext for ext in mimetype.load_table() if ext not in EPUB_CORE_MEDIA_TYPES]
+    print("cost per call in microseconds")
+    for name, exts in (
+        ("core", core),
+        ("table", table),
+        ("unknown", [".unknown%d" % i for i in range(100)]),
+    ):
+        paths = ["OEBPS/Text/file%d%s" % (i, exts[i % len(exts)]) for i in range(args.paths)]
+        print("%-10s %8.2f" % (name, per_call(guess_mimetype, paths, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
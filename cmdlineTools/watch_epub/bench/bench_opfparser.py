@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Benchmark the conversions of `util.opfwrapper.OpfWrapper` which every watcher
+event goes through (path -> bookpath, bookpath -> href, bookpath -> media-type),
+with the LRU caches (cold and warm) against the previous implementations. The
+media-type is read from the id index, so it has no cache (cold == warm).
+
+Usage:
+    python bench_opfparser.py [-n ITEMS] [-r REPEAT]
+"""
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+
+import sys
+import os.path as syspath
+
+sys.path.insert(0, syspath.join(syspath.dirname(syspath.dirname(syspath.abspath(__file__))), "watch_epub"))
+
+import posixpath
+
+from argparse import ArgumentParser
+from os import fsdecode, makedirs
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from util.opfwrapper import OpfWrapper
+from util.pathutils import path_to_posix
+
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+
+def make_book(root: str, n: int):
+    "Make a book folder, whose manifest has `n` items."
+    makedirs(syspath.join(root, "META-INF"))
+    makedirs(syspath.join(root, "OEBPS"))
+    open(syspath.join(root, "META-INF", "container.xml"), "w").write(CONTAINER_XML)
+    items = "".join(
+        '<item id="c%d" href="Text/c%d.xhtml" media-type="application/xhtml+xml"/>' % (i, i)
+        for i in range(n)
+    )
+    open(syspath.join(root, "OEBPS", "content.opf"), "w").write(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid">'
+        '<metadata/><manifest>%s</manifest><spine/></package>' % items
+    )
+
+
+def legacy_path_to_bookpath(opf, path):
+    path_ = fsdecode(syspath.realpath(path))
+    if not path_.startswith(opf.ebook_root):
+        raise ValueError(path)
+    return path_to_posix(syspath.relpath(path_, opf.ebook_root))
+
+
+def legacy_bookpath_to_href(opf, bookpath):
+    return posixpath.relpath(bookpath, opf.opf_dir)
+
+
+def legacy_media_type(opf, bookpath):
+    try:
+        return opf.id_to_media_type(opf.bookpath_to_id(bookpath))
+    except KeyError:
+        return None
+
+
+def per_call(fn, args, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        for arg in args:
+            fn(arg)
+        best = min(best, perf_counter() - start)
+    return best / len(args) * 1e6
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the conversions of OpfWrapper")
+    parser.add_argument("-n", "--items", type=int, default=500, help="number of manifest items, default 500")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="repeat times, take the minimum, default 5")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tempdir:
+        make_book(tempdir, args.items)
+        opf = OpfWrapper(tempdir)
+        bookpaths = list(opf.bookpath_to_id)
+        paths = [opf.bookpath_to_path(bookpath) for bookpath in bookpaths]
+
+        print("%d manifest items, cost per call in microseconds" % len(bookpaths))
+        print("%-22s %10s %10s %10s" % ("", "legacy", "cold", "warm"))
+        for name, legacy, fn, cache_args in (
+            ("path_to_bookpath", legacy_path_to_bookpath, opf.path_to_bookpath, paths),
+            ("bookpath_to_href", legacy_bookpath_to_href, opf.bookpath_to_href, bookpaths),
+            ("bookpath_to_media_type", legacy_media_type, opf.bookpath_to_media_type, bookpaths),
+        ):
+            assert [legacy(opf, arg) for arg in cache_args] == list(map(fn, cache_args)), \
+                "The results of %s are different" % name
+            t_legacy = per_call(lambda arg: legacy(opf, arg), cache_args, args.repeat)
+            def cold(arg, fn=fn):
+                opf.cache_clear()
+                return fn(arg)
+            t_cold = per_call(cold, cache_args, args.repeat)
+            t_warm = per_call(fn, cache_args, args.repeat)
+            print("%-22s %10.2f %10.2f %10.2f" % (name, t_legacy, t_cold, t_warm))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Benchmark `util.pathutils.reference_path` and `util.pathutils.relative_path`
+(string scanning, memoized), with cold and warm caches, against the previous
+implementations (split and `clean_parts`) and `posixpath.normpath` / `posixpath.relpath`,
+on the kinds of hrefs found in EPUB documents.
+
+Usage:
+    python bench_pathutils.py [-n HREFS] [-r REPEAT]
+"""
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+
+import sys
+import os.path as syspath
+
+sys.path.insert(0, syspath.join(syspath.dirname(syspath.dirname(syspath.abspath(__file__))), "watch_epub"))
+
+import posixpath
+
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+from util import pathutils
+from util.pathutils import clean_parts, reference_path, relative_path
+
+
+def legacy_reference_path(path, pathto, sep="/"):
+    "The previous implementation."
+    parts = path.split(sep)
+    parts[-1:] = pathto.split(sep)
+    return sep.join(clean_parts(parts))
+
+
+def legacy_relative_path(path, pathto, sep="/"):
+    "The previous implementation."
+    if path.rstrip(sep) == pathto.rstrip(sep):
+        return ""
+    parts_org = clean_parts(path.split(sep))
+    parts_dst = clean_parts(pathto.split(sep))
+    i = 0
+    for p1, p2 in zip(parts_org, parts_dst):
+        if p1 != p2:
+            break
+        i += 1
+    return sep.join((*((("..",) * (len(parts_org)-i-1))), *parts_dst[i:]))
+
+
+def normpath_reference_path(path, pathto, sep="/"):
+    "With `posixpath.normpath` (but it keeps no trailing slash)."
+    return posixpath.normpath(posixpath.join(posixpath.dirname(path), pathto))
+
+
+def relpath_relative_path(path, pathto, sep="/"):
+    "With `posixpath.relpath` (the path is relative to the directory of `path`)."
+    return posixpath.relpath(pathto, posixpath.dirname(path) or ".")
+
+
+def make_pairs(n: int, rnd: Random) -> list[tuple[str, str]]:
+    "Generate `n` (bookpath, href) pairs, many of them are repeated."
+    hrefs = ["../Images/p%d.jpg", "c%d.xhtml", "./c%d.xhtml", "../Styles/s%d.css", "sub/n%d.xhtml", "../../x%d.png"]
+    pairs = []
+    for i in range(n):
+        k = rnd.randrange(200)
+        pairs.append(("OEBPS/Text/c%d.xhtml" % (k % 20), rnd.choice(hrefs) % k))
+    return pairs
+
+
+def per_call(fn, pairs, repeat: int, clear=None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if clear is not None:
+            clear()
+        start = perf_counter()
+        for path, pathto in pairs:
+            fn(path, pathto, "/")
+        best = min(best, perf_counter() - start)
+    return best / len(pairs) * 1e6
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the path normalization of pathutils")
+    parser.add_argument("-n", "--hrefs", type=int, default=100000, help="number of (bookpath, href) pairs, default 100000")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="repeat times, take the minimum, default 3")
+    args = parser.parse_args()
+
+    rnd = Random(0)
+    pairs = make_pairs(args.hrefs, rnd)
+    targets = [(path, reference_path(path, href, "/")) for path, href in pairs]
+    for name, new, legacy, data in (
+        ("reference_path", reference_path, legacy_reference_path, pairs),
+        ("relative_path", relative_path, legacy_relative_path, targets),
+    ):
+        assert [legacy(*t) for t in data] == [new(*t, "/") for t in data], "The results of %s are different" % name
+
+    print("%d pairs, cost per call in microseconds" % len(pairs))
+    print("%-16s %10s %10s %10s %10s" % ("", "legacy", "posixpath", "cold", "warm"))
+    for name, new, legacy, stdlib, data, cache in (
+        ("reference_path", reference_path, legacy_reference_path, normpath_reference_path,
+            pairs, pathutils._reference_path),
+        ("relative_path", relative_path, legacy_relative_path, relpath_relative_path,
+            targets, pathutils._relative_path),
+    ):
+        print("%-16s %10.2f %10.2f %10.2f %10.2f" % (
+            name,
+            per_call(legacy, data, args.repeat),
+            per_call(stdlib, data, args.repeat),
+            per_call(new, data, args.repeat, cache.cache_clear),
+            per_call(new, data, args.repeat),
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Benchmark `util.ziputils.snapshot` and `util.ziputils.zip` over a book folder
+which contains a large ignored tree (such as `.git/`), with and without pruning
+the ignored directories (`ignore_dir`), the packed files must be the same.
+
+Usage:
+    python bench_walk.py [-b BOOK_FILES] [-i IGNORED_FILES] [-r REPEAT]
+"""
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+
+import sys
+import os.path as syspath
+
+sys.path.insert(0, syspath.join(syspath.dirname(syspath.dirname(syspath.abspath(__file__))), "watch_epub"))
+
+from argparse import ArgumentParser
+from os import makedirs, remove
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from zipfile import ZipFile
+
+from util.ignore import make_ignore
+from util.ziputils import snapshot, zip
+
+
+def make_tree(root: str, book_files: int, ignored_files: int):
+    "Make a book folder, with `ignored_files` files under .git/ and a scratch dir."
+    def touch(path, data=b"x" * 64):
+        makedirs(syspath.dirname(path), exist_ok=True)
+        open(path, "wb").write(data)
+    touch(syspath.join(root, "mimetype"), b"application/epub+zip")
+    touch(syspath.join(root, "META-INF", "container.xml"))
+    for i in range(book_files):
+        touch(syspath.join(root, "OEBPS", "Text", "c%d.xhtml" % i))
+    for i in range(ignored_files):
+        if i % 4:
+            touch(syspath.join(root, ".git", "objects", "%02x" % (i % 256), "%038x" % i))
+        else:
+            touch(syspath.join(root, "OEBPS", "scratch", "d%d" % (i % 50), "f%d.tmp" % i))
+
+
+def timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the tree walks with and without pruning")
+    parser.add_argument("-b", "--book-files", type=int, default=200, help="number of book files, default 200")
+    parser.add_argument("-i", "--ignored-files", type=int, default=20000,
+                        help="number of files in the ignored directories, default 20000")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="repeat times, take the minimum, default 3")
+    args = parser.parse_args()
+
+    matcher = make_ignore(".git/", "scratch/")
+    keep = lambda path: not matcher(path)
+    with TemporaryDirectory() as tempdir:
+        root = syspath.join(tempdir, "book")
+        make_tree(root, args.book_files, args.ignored_files)
+        destpath = syspath.join(tempdir, "book.zip")
+
+        def pack(ignore_dir=None):
+            if syspath.exists(destpath):
+                remove(destpath)
+            zip(root, destpath, ignore=keep, ignore_dir=ignore_dir)
+
+        pack()
+        with ZipFile(destpath) as zf:
+            names = zf.namelist()
+        pack(matcher.ignore_dir)
+        with ZipFile(destpath) as zf:
+            assert zf.namelist() == names, "The packed files are different"
+
+        print("%d book files, %d ignored files" % (args.book_files, args.ignored_files))
+        print("%-10s %12s %12s" % ("", "walk all", "pruned"))
+        for name, fn in (
+            ("snapshot", lambda ignore_dir=None: snapshot(root, ignore_dir)),
+            ("zip", pack),
+        ):
+            t_all = timeit(fn, args.repeat)
+            t_pruned = timeit(lambda: fn(matcher.ignore_dir), args.repeat)
+            print("%-10s %10.3f s %10.3f s" % (name, t_all, t_pruned))
+
+
+if __name__ == "__main__":
+    main()
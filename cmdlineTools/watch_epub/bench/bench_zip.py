@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""Benchmark `util.ziputils.zip` (with `ParallelZipWriter`) against packing
+the same directory serially by `ZipFile.write`, on a generated book of images
+and text files (hundreds of MB by default).
+
+Usage:
+    python bench_zip.py [-s SIZE_MB] [-j WORKERS] [-m MEMORY_LIMIT_MB]
+"""
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+
+import sys
+import os.path as syspath
+
+sys.path.insert(0, syspath.join(syspath.dirname(syspath.dirname(syspath.abspath(__file__))), "watch_epub"))
+
+from argparse import ArgumentParser
+from os import cpu_count, makedirs, remove, urandom, walk
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+from util.ziputils import zip as makezip
+
+
+def make_book(dir_: str, size: int):
+    "Generate a book of about `size` bytes, half of them are (incompressible) images."
+    makedirs(syspath.join(dir_, "OEBPS", "Images"))
+    makedirs(syspath.join(dir_, "OEBPS", "Text"))
+    open(syspath.join(dir_, "mimetype"), "w").write("application/epub+zip")
+    para = b"<p>" + b"Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20 + b"</p>\n"
+    i = total = 0
+    while total < size:
+        image = urandom(2 * 1024 * 1024)
+        open(syspath.join(dir_, "OEBPS", "Images", "%04d.jpg" % i), "wb").write(image)
+        text = b"<html><body>\n" + para * (len(image) // len(para)) + b"</body></html>"
+        open(syspath.join(dir_, "OEBPS", "Text", "%04d.xhtml" % i), "wb").write(text)
+        total += len(image) + len(text)
+        i += 1
+
+
+def serial_zip(path: str, destpath: str):
+    "Pack like the previous implementation, but with compression."
+    with ZipFile(destpath, "w", ZIP_DEFLATED) as zf:
+        for dirpath, _, filenames in walk(path):
+            for filename in filenames:
+                src = syspath.join(dirpath, filename)
+                arcname = syspath.relpath(src, path)
+                zf.write(src, arcname, ZIP_STORED if arcname == "mimetype" else None)
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the parallel compression of ziputils.zip")
+    parser.add_argument("-s", "--size", type=int, default=300, help="size of the book in MB, default 300")
+    parser.add_argument("-j", "--workers", type=int, help="number of threads, default the number of CPUs")
+    parser.add_argument("-m", "--memory-limit", type=int, default=64, help="memory budget in MB, default 64")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as td:
+        book = syspath.join(td, "book")
+        make_book(book, args.size * 1024 * 1024)
+        dest = syspath.join(td, "book.epub")
+        print("CPUs: %s, workers: %s" % (cpu_count(), args.workers or cpu_count()))
+        for name, fn in (
+            ("serial", lambda: serial_zip(book, dest)),
+            ("parallel", lambda: makezip(
+                book, dest, workers=args.workers, 
+                memory_limit=args.memory_limit * 1024 * 1024, compression=ZIP_DEFLATED)),
+        ):
+            start = perf_counter()
+            fn()
+            elapsed = perf_counter() - start
+            print("%-8s %8.3f s  %8.1f MB" % (name, elapsed, syspath.getsize(dest) / 1024 / 1024))
+            remove(dest)
+
+
+if __name__ == "__main__":
+    main()
@@ -52,6 +52,22 @@ if __name__ == "__main__":
     parser.add_argument("-nu", "--not-update-reference", action="store_false", dest="update_reference", 
         help="禁用自动更新引用关系，若未指定此参数（默认），则会开启自动更新。指定此参数后，就不会读取本地文件，也会忽略"
              "文件更改（modified）事件，直接根据新增(created)、删除(deleted)和移动(moved)事件来更新 OPF。")
+    parser.add_argument("-w", "--debounce", type=float, default=0.5, 
+        help="合并事件的静默时间窗口（单位是秒），默认为 0.5。在这段时间内同一个文件上发生的多个事件"
+             "（例如保存时的截断和写入，或者 新增→修改→移动），会被合并成一个最终的操作后再处理。"
+             "如果指定为 0，则每个事件都会被立即处理。")
+    parser.add_argument("-j", "--jobs", type=int, 
+        help="启动时分析引用关系所用的进程数，默认为 CPU 核数。文件较少时，总是在当前进程中分析。")
+    parser.add_argument("-c", "--checkpoint", type=float, default=2, 
+        help="在 OPF 文件的清单（manifest）发生改动，并且静默这么多秒后，在后台写入 OPF 文件，"
+             "以防程序崩溃时丢失改动，默认值是 2。如果指定为 0，则只在退出时写入。")
+    parser.add_argument("-nc", "--no-cache", action="store_false", dest="use_cache", 
+        help="禁用引用关系的缓存。若未指定此参数（默认），会在 EPUB 文件旁边保存一个 .refcache 缓存文件，"
+             "记录各个文件的引用关系，下次打开同一个 EPUB 时，未改动的文件就不需要再分析。")
+    parser.add_argument("-l", "--lazy", action="store_true", 
+        help="延迟解压。指定此参数后，启动时只解压 OPF、container.xml、文本和 CSS 等文件，"
+             "图片、字体、音频和视频等文件会在监控开始后，在后台逐个解压。"
+             "退出时，还没有解压的文件，会直接从原来的 EPUB 中复制。")
     # TODO: 接受一个文件或者标准输入
     parser.add_argument("-n", "--ignore-file", dest="ignore_file", 
         help="指定一个文件路径，采用类似[gitignore](https://git-scm.com/docs/gitignore)的语法规则，"
@@ -95,12 +111,12 @@ import os.path as syspath
 from contextlib import contextmanager
 from datetime import datetime
 from io import BytesIO
-from os import chdir, getcwd, remove, PathLike
+from os import chdir, getcwd, PathLike
 from pkgutil import get_data
 from tempfile import TemporaryDirectory
 from re import sub as re_sub
 from string import Template
-from typing import AnyStr, Callable, Union
+from typing import Any, AnyStr, Callable, Union
 from time import time_ns
 from uuid import uuid4
 from warnings import warn
@@ -110,8 +126,10 @@ from util.ignore import escape, make_ignore, read_file
 from util.makeid import set_makeid
 from util.opfwrapper import OpfWrapper
 from util.pathutils import openpath
-from util.watch import watch
-from util.ziputils import zip as makezip
+from util.refcache import CacheEntry, ReferenceCache
+from util.watch import watch, ANALYZER_VERSION
+from util.workspace import LazyWorkspace
+from util.ziputils import repack, snapshot
 
 
 @contextmanager
@@ -119,6 +137,9 @@ def ctx_epub_tempdir(
     path: Union[AnyStr, PathLike[AnyStr]], 
     inplace: bool = False, 
     ignore: Optional[Callable[[str], bool]] = None, 
+    on_saved: Optional[Callable[[str], Any]] = None, 
+    workspace: Optional[LazyWorkspace] = None, 
+    ignore_dir: Optional[Callable[[str], bool]] = None, 
 ):
     """"""
     need_make_new = not syspath.exists(path)
@@ -137,6 +158,8 @@ def ctx_epub_tempdir(
             )
             opf_file = syspath.join(dir_, "OEBPS", "content.opf")
             open(opf_file, "w", encoding="utf-8").write(opf_updated)
+    elif workspace is not None:
+        init_dir = workspace.open
     else:
         def init_dir(dir_):
             with ZipFile(path) as zf:
@@ -146,13 +169,22 @@ def ctx_epub_tempdir(
     try:
         tempdir = td.name
         init_dir(tempdir)
+        # To tell which files are unchanged when repacking, their compressed 
+        # data will be copied from the original file as is
+        source = None if need_make_new else path
+        if need_make_new:
+            snap = None
+        elif workspace is not None:
+            snap = workspace.snapshot
+        else:
+            snap = snapshot(tempdir, ignore_dir=ignore_dir)
         yield tempdir
+        pending = None
+        if workspace is not None:
+            workspace.close()
+            pending = workspace.pending
         if inplace:
             target_path = path
-            try:
-                remove(path)
-            except (FileNotFoundError, PermissionError) as exc:
-                warn("Failed to delete file: %r, because of: %r" % (path, exc))
         elif syspath.isfile(path):
             dirname, basename = syspath.split(path)
             if basename.endswith(".epub"):
@@ -165,8 +197,24 @@ def ctx_epub_tempdir(
             target_path = path
         while True:
             try:
-                makezip(tempdir, target_path, ignore=ignore)
+                copied, compressed = repack(
+                    tempdir, 
+                    target_path, 
+                    source=source, 
+                    snapshot=snap, 
+                    pending=pending, 
+                    ignore=ignore, 
+                    ignore_dir=ignore_dir, 
+                    overwrite=inplace and target_path == path, 
+                )
                 print("Generated file:", target_path)
+                logging.getLogger().debug(
+                    "Repacked: %d members copied, %d members compressed" % (copied, compressed))
+                if on_saved is not None:
+                    try:
+                        on_saved(target_path)
+                    except Exception as exc:
+                        warn("Failed to process the generated file: %r, because of: %r" % (target_path, exc))
                 break
             except (PermissionError, FileNotFoundError, FileExistsError) as exc:
                 print("创建文件 %r 失败，因为 %r" % (target_path, exc))
@@ -178,6 +226,8 @@ def ctx_epub_tempdir(
                 if not syspath.isabs(target_path):
                     target_path = syspath.join(dirname, target_path)
     finally:
+        if workspace is not None:
+            workspace.close()
         try:
             td.cleanup()
         except RecursionError:
@@ -192,6 +242,11 @@ def main(args):
     makeid: str = args.makeid
     update_reference: bool = args.update_reference
     ignore_file: Optional[str] = args.ignore_file
+    debounce: float = args.debounce
+    jobs: Optional[int] = args.jobs
+    use_cache: bool = args.use_cache
+    checkpoint: float = args.checkpoint
+    lazy: bool = args.lazy
 
     set_makeid(args.makeid)
 
@@ -209,10 +264,40 @@ def main(args):
     else:
         ignores = read_file(ignore_file)
 
+    refcache: Optional[ReferenceCache] = None
+    on_scanned: Optional[Callable[[dict[str, CacheEntry]], Any]] = None
+    if update_reference and use_cache:
+        refcache = ReferenceCache(ANALYZER_VERSION)
+        if syspath.isfile(epub_path):
+            loaded = refcache.load(epub_path)
+            if not inplace:
+                # The generated file is a new one, so the cache of the startup scan 
+                # is also saved for `epub_path`, which is unchanged
+                epub_abspath = syspath.abspath(epub_path)
+                def on_scanned(entries: dict[str, CacheEntry]):
+                    if not (loaded and refcache.trusted and entries == refcache.entries):
+                        refcache.save(epub_abspath, entries)
+
+    workspace: Optional[LazyWorkspace] = None
+    if lazy and syspath.isfile(epub_path):
+        workspace = LazyWorkspace(epub_path, logger=logger)
+
+    # The ignored directories are not walked into, when scanning and packing the 
+    # book, unless they contain the files in the manifest
+    dir_ignore = make_ignore(*ignores)
+    opfwrapper: Optional[OpfWrapper] = None
+    def ignore_dir(dir_: str) -> bool:
+        if dir_ == "META-INF" or not dir_ignore.ignore_dir(dir_):
+            return False
+        return opfwrapper is None or next(opfwrapper.iter_dir(dir_), None) is None
+
     with ctx_epub_tempdir(
         epub_path, 
         inplace=inplace, 
-        ignore=lambda p: not main_ignore(p) or p not in opfwrapper.bookpath_to_id
+        ignore=lambda p: not main_ignore(p) or p not in opfwrapper.bookpath_to_id, 
+        on_saved=None if refcache is None else refcache.save, 
+        workspace=workspace, 
+        ignore_dir=ignore_dir, 
     ) as tempdir:
         oldwd = getcwd()
         opfwrapper = OpfWrapper(tempdir)
@@ -225,7 +310,18 @@ def main(args):
         protected_pats = ("/META-INF/", "/mimetype", "/" + escape(opfwrapper.opf_bookpath))
         main_ignore = make_ignore(*protected_pats)
         ignore = make_ignore(*protected_pats, *ignores)
-        watch(opfwrapper, logger=logger, ignore=ignore, update_reference=update_reference)
+        watch(
+            opfwrapper, 
+            logger=logger, 
+            ignore=ignore, 
+            update_reference=update_reference, 
+            debounce=debounce, 
+            jobs=jobs, 
+            refcache=refcache, 
+            checkpoint=checkpoint, 
+            workspace=workspace, 
+            on_scanned=on_scanned, 
+        )
         chdir(oldwd)
 
 
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+__all__ = ["OpfCheckpointer", "atomic_write"]
+
+import logging
+import os.path as syspath
+
+from contextlib import nullcontext
+from os import fsync, remove, replace
+from shutil import copymode
+from tempfile import NamedTemporaryFile
+from threading import Condition, Thread
+from time import monotonic
+from typing import ContextManager, Optional
+
+from util.opfwrapper import OpfWrapper
+
+
+def atomic_write(path: str, data: bytes, tempdir: Optional[str] = None):
+    """Write `data` into the file `path` atomically, i.e. write a temporary file
+    (in `tempdir`, which must be on the same file system) and then rename it."""
+    if tempdir is None:
+        tempdir = syspath.dirname(path)
+    with NamedTemporaryFile(dir=tempdir, prefix=".checkpoint-", suffix=".tmp", delete=False) as f:
+        try:
+            f.write(data)
+            f.flush()
+            fsync(f.fileno())
+        except BaseException:
+            f.close()
+            remove(f.name)
+            raise
+    try:
+        if syspath.exists(path):
+            copymode(path, f.name)
+        replace(f.name, path)
+    except BaseException:
+        remove(f.name)
+        raise
+
+
+class OpfCheckpointer:
+    """Write the OPF file in a background thread, `delay` seconds after the
+    manifest stopped changing, so that the changes survive a crash.
+
+    Whether the manifest changed is told by `OpfWrapper.revision`, which is
+    polled, so the event handlers never wait for the checkpointer. Only the
+    serialization holds `lock` (which the handlers hold when they modify the
+    manifest), the file is written after it is released. The write is skipped
+    if the serialized bytes are the same as the last written.
+
+    :param tempdir: Where to put the temporary file, it must be on the same
+        file system with the OPF file, and should be ignored by the watcher.
+    """
+    def __init__(
+        self, 
+        opfwrapper: OpfWrapper, /, 
+        delay: float = 2, 
+        lock: Optional[ContextManager] = None, 
+        tempdir: Optional[str] = None, 
+        logger: logging.Logger = logging.getLogger(), 
+    ):
+        self.opfwrapper = opfwrapper
+        self.delay = delay
+        self.lock = nullcontext() if lock is None else lock
+        self.tempdir = tempdir
+        self.logger = logger
+        self._cond = Condition()
+        self._running = False
+        self._thread: Optional[Thread] = None
+        self._saved_revision = opfwrapper.revision
+        self._last_data: Optional[bytes] = None
+
+    def checkpoint(self) -> bool:
+        "Write the OPF file now (if changed). Return True if it was written."
+        opfwrapper = self.opfwrapper
+        with self.lock:
+            revision = opfwrapper.revision
+            data = opfwrapper.dumps()
+        self._saved_revision = revision
+        if data == self._last_data:
+            return False
+        atomic_write(opfwrapper.opf_path, data, self.tempdir)
+        self._last_data = data
+        self.logger.debug("Checkpoint: written the OPF file (revision %d)" % revision)
+        return True
+
+    def _run(self):
+        cond = self._cond
+        opfwrapper = self.opfwrapper
+        seen_revision = self._saved_revision
+        changed_at = monotonic()
+        while True:
+            with cond:
+                if not self._running:
+                    break
+                cond.wait(min(self.delay, 0.5))
+                if not self._running:
+                    break
+            revision = opfwrapper.revision
+            now = monotonic()
+            if revision != seen_revision:
+                seen_revision = revision
+                changed_at = now
+            elif revision != self._saved_revision and now - changed_at >= self.delay:
+                try:
+                    self.checkpoint()
+                except Exception:
+                    self.logger.exception("Failed to write the checkpoint of the OPF file")
+                    # Do not retry immediately
+                    changed_at = now
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, name="OpfCheckpointer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+__all__ = ["CoalescingEventHandler"]
+
+import logging
+
+from contextlib import nullcontext
+from os import fsdecode
+from threading import Condition, Thread
+from time import monotonic
+from typing import Final, Optional
+
+from watchdog.events import ( # type: ignore
+    EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED, 
+    FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent, 
+    FileSystemEvent, FileSystemEventHandler, 
+)
+
+
+FILE_EVENT_TYPES: Final = (
+    EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED)
+
+
+class _Pending:
+    """The net operation of a file during a burst of events.
+
+    - `origin` is None: the file was created during the burst;
+    - `origin` is the current path: the file was modified in place;
+    - otherwise: the file was moved from `origin` (and maybe modified).
+
+    If `clobbered` is True, the file was moved onto its current path, and has 
+    overwritten the file originally located there (if any).
+    """
+    __slots__ = ("origin", "modified", "clobbered")
+
+    def __init__(self, origin: Optional[str], modified: bool = False, clobbered: bool = False):
+        self.origin = origin
+        self.modified = modified
+        self.clobbered = clobbered
+
+
+class _Deleted:
+    """The file originally located at `origin` was deleted during the burst.
+
+    If `clobbered` is True, it was overwritten by a moved file, which was then 
+    moved away or deleted, so there may have been no file at all.
+    """
+    __slots__ = ("origin", "clobbered")
+
+    def __init__(self, origin: str, clobbered: bool = False):
+        self.origin = origin
+        self.clobbered = clobbered
+
+
+class _Segment:
+    """Coalesced file operations, keyed by the current path of the file.
+
+    When an event would reorder the operations in a way that changes their
+    meaning (e.g. a file is moved into the place of another file, which was
+    also moved away during the burst), the segment is sealed and a new one
+    is started, so the net operations are still replayed in order.
+
+        >>> def net(*events):
+        ...     segment = _Segment()
+        ...     for event in events:
+        ...         assert segment.accept(event)
+        ...     return [(e.event_type, e.src_path, getattr(e, "dest_path", "")) 
+        ...             for e in segment.iter_events()]
+        >>> net(FileCreatedEvent("a"), FileModifiedEvent("a"), FileMovedEvent("a", "a2"))
+        [('created', 'a2', ''), ('modified', 'a2', '')]
+        >>> net(FileCreatedEvent("a"), FileModifiedEvent("a"), FileDeletedEvent("a"))
+        []
+        >>> net(FileMovedEvent("a", "b"), FileDeletedEvent("b"))
+        [('deleted', 'b', ''), ('deleted', 'a', '')]
+        >>> net(FileMovedEvent("a", "b"), FileMovedEvent("b", "c"))
+        [('deleted', 'b', ''), ('moved', 'a', 'c')]
+        >>> net(FileMovedEvent("a", "b"), FileMovedEvent("b", "a"))
+        [('deleted', 'b', '')]
+    """
+    __slots__ = ("ops", "origins")
+
+    def __init__(self):
+        self.ops: dict[str, _Pending | _Deleted] = {}
+        # origin path -> current path, for the moved files only
+        self.origins: dict[str, str] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.ops)
+
+    def _pop(self, path: str):
+        op = self.ops.pop(path, None)
+        if type(op) is _Pending:
+            if op.origin is not None and op.origin != path:
+                self.origins.pop(op.origin, None)
+            if op.clobbered:
+                # The file leaves the path, so the overwritten file no longer exists
+                op.clobbered = False
+                self._delete_origin(path, clobbered=True)
+        return op
+
+    def _put(self, path: str, op: _Pending | _Deleted):
+        self.ops[path] = op
+        if type(op) is _Pending and op.origin is not None and op.origin != path:
+            self.origins[op.origin] = path
+
+    def _delete_origin(self, origin: str, clobbered: bool = False):
+        # The file originally located at `origin` no longer exists
+        op = self.ops.get(origin)
+        if op is None:
+            self._put(origin, _Deleted(origin, clobbered))
+        elif type(op) is _Pending and op.origin is None:
+            # Deleted and then re-created at the same place, i.e. modified
+            op.origin = origin
+            op.modified = True
+
+    def _recreate(self, op: _Deleted) -> _Pending:
+        # A file is created where the file `op` was deleted
+        if op.clobbered:
+            # It's unknown whether there was a file
+            return _Pending(None, clobbered=True)
+        # Deleted and then re-created at the same place, i.e. modified
+        return _Pending(op.origin, True)
+
+    def accept(self, event: FileSystemEvent) -> bool:
+        """Merge a file event into this segment. Return False if the event
+        can not be merged, then it should be put into a new segment.
+        """
+        src_path = fsdecode(event.src_path)
+        match event.event_type:
+            case "created":
+                op = self.ops.get(src_path)
+                if op is None:
+                    self._put(src_path, _Pending(None))
+                elif type(op) is _Deleted:
+                    self._pop(src_path)
+                    self._put(src_path, self._recreate(op))
+                else:
+                    op.modified = True
+            case "modified":
+                op = self.ops.get(src_path)
+                if op is None:
+                    self._put(src_path, _Pending(src_path, True))
+                elif type(op) is _Deleted:
+                    self._pop(src_path)
+                    self._put(src_path, self._recreate(op))
+                else:
+                    op.modified = True
+            case "deleted":
+                op = self.ops.get(src_path)
+                if op is None:
+                    self._put(src_path, _Deleted(src_path))
+                elif type(op) is _Pending:
+                    self._pop(src_path)
+                    if op.origin == src_path:
+                        self._put(src_path, _Deleted(src_path))
+                    elif op.origin is not None:
+                        self._delete_origin(op.origin)
+            case "moved":
+                dest_path = fsdecode(event.dest_path)
+                if src_path == dest_path:
+                    return True
+                op = self.ops.get(src_path)
+                if type(op) is _Deleted:
+                    return False
+                if dest_path in self.origins and self.origins[dest_path] != src_path:
+                    # The file originally located at `dest_path` has been moved away,
+                    # its move must be replayed before this one.
+                    return False
+                self._pop(src_path)
+                if op is None:
+                    op = _Pending(src_path)
+                # If there was a file at `dest_path`, it is overwritten, this is recorded 
+                # by `clobbered`, unless the file was created during the burst
+                dest_op = self.ops.pop(dest_path, None)
+                if type(dest_op) is _Pending:
+                    if dest_op.origin not in (None, dest_path):
+                        self.origins.pop(dest_op.origin, None)
+                        self._delete_origin(dest_op.origin)
+                    clobbered = dest_op.clobbered or dest_op.origin == dest_path
+                else:
+                    clobbered = True
+                if op.origin == dest_path:
+                    # Moved back to where it was
+                    if not op.modified:
+                        return True
+                    clobbered = False
+                op.clobbered = clobbered
+                self._put(dest_path, op)
+        return True
+
+    def iter_events(self):
+        """Yield the net events of this segment. The created files are the last, 
+        since one may be located where the original file was moved away."""
+        created: list[str] = []
+        for path, op in self.ops.items():
+            if type(op) is _Deleted:
+                yield FileDeletedEvent(op.origin)
+            elif op.origin is None:
+                created.append(path)
+            elif op.origin == path:
+                if op.modified:
+                    yield FileModifiedEvent(path)
+            else:
+                yield FileMovedEvent(op.origin, path)
+                if op.modified:
+                    yield FileModifiedEvent(path)
+        for path in created:
+            yield FileCreatedEvent(path)
+            if self.ops[path].clobbered:
+                # It's a new content of the existing file
+                yield FileModifiedEvent(path)
+
+
+class CoalescingEventHandler(FileSystemEventHandler):
+    """Buffer the events from an `Observer`, merge them per path, and then
+    dispatch the net events to `handler` from a worker thread, after no new
+    event has arrived within `delay` seconds (or the oldest buffered event
+    has waited for `max_delay` seconds).
+
+    A chain like created -> modified -> moved is collapsed into one created
+    event at the final path, modified events of the same file are merged,
+    and a file created and then deleted within the window is never seen by
+    `handler`. Directory events are passed through in order, as barriers.
+
+    If `handler` has a `batch` method, which returns a context manager, all 
+    the events of a burst are dispatched within it.
+    """
+    def __init__(
+        self, 
+        handler: FileSystemEventHandler, /, 
+        delay: float = 0.5, 
+        max_delay: Optional[float] = 5, 
+        logger: logging.Logger = logging.getLogger(), 
+    ):
+        super().__init__()
+        self.handler = handler
+        self.delay = delay
+        self.max_delay = max_delay
+        self.logger = logger
+        self._cond = Condition()
+        self._queue: list[_Segment | FileSystemEvent] = []
+        self._first_time: Optional[float] = None
+        self._last_time: float = 0.
+        self._running = False
+        self._thread: Optional[Thread] = None
+
+    def dispatch(self, event: FileSystemEvent):
+        event_type = event.event_type
+        if event_type not in FILE_EVENT_TYPES:
+            return
+        with self._cond:
+            queue = self._queue
+            if event.is_directory:
+                if event_type == EVENT_TYPE_MODIFIED:
+                    # NOTE: The modified events of a directory are just side effects
+                    #       of the changes of its children, nobody cares about them.
+                    return
+                queue.append(event)
+            elif not (queue and type(queue[-1]) is _Segment and queue[-1].accept(event)):
+                segment = _Segment()
+                segment.accept(event)
+                queue.append(segment)
+            now = monotonic()
+            if self._first_time is None:
+                self._first_time = now
+            self._last_time = now
+            self._cond.notify()
+
+    def _take(self) -> list[_Segment | FileSystemEvent]:
+        queue, self._queue = self._queue, []
+        self._first_time = None
+        return queue
+
+    def _emit(self, queue: list[_Segment | FileSystemEvent]):
+        if not queue:
+            return
+        dispatch = self.handler.dispatch
+        # NOTE: If the handler supports batches, it can defer the work that depends on
+        #       all the events of the burst (e.g. rewriting the references of moved files).
+        batch = getattr(self.handler, "batch", None)
+        try:
+            with nullcontext() if batch is None else batch():
+                for item in queue:
+                    if type(item) is _Segment:
+                        events = item.iter_events()
+                    else:
+                        events = (item,)
+                    for event in events:
+                        try:
+                            dispatch(event)
+                        except Exception:
+                            self.logger.exception("Failed to process event: %r" % event)
+        except Exception:
+            self.logger.exception("Failed to finish processing a batch of events")
+
+    def _run(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while self._running and self._first_time is None:
+                    cond.wait()
+                if not self._running:
+                    break
+                now = monotonic()
+                timeout = self._last_time + self.delay - now
+                if self.max_delay is not None:
+                    timeout = min(timeout, self._first_time + self.max_delay - now)
+                if timeout > 0:
+                    cond.wait(timeout)
+                    continue
+                queue = self._take()
+            self._emit(queue)
+
+    def flush(self):
+        "Dispatch all the buffered events immediately (in the caller thread)."
+        with self._cond:
+            queue = self._take()
+        self._emit(queue)
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, name="CoalescingEventHandler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        "Stop the worker thread, and then dispatch the remaining events."
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -5,15 +5,16 @@
 """
 
 __author__  = "ChenyangGao <https://chenyanggao.github.io/>"
-__version__ = (0, 1, 2)
-__all__ = ["escape", "translate", "make_ignore", "ignore", "read_file"]
+__version__ = (0, 2, 0)
+__all__ = ["escape", "translate", "GitIgnoreMatcher", "make_ignore", "ignore", "read_file"]
 
+from functools import lru_cache
 from os import PathLike
 from re import (
     compile as re_compile, escape as re_escape, IGNORECASE, 
     Match, Pattern, RegexFlag, 
 )
-from typing import AnyStr, Callable, Final, Iterable, Optional
+from typing import AnyStr, Callable, Final, Generic, Iterable, Optional
 
 
 cre_stars: Final[Pattern[str]] = re_compile("\*{2,}")
@@ -119,7 +120,13 @@ def translate(pat: AnyStr) -> AnyStr:
     for i, p in enumerate(parts, 1):
         if cre_stars_.fullmatch(p):
             p = star2
-            if prev != star2:
+            if i == n:
+                # A trailing "**" matches everything inside
+                if prev == star2:
+                    parts_[-1] = star2_to_v2
+                else:
+                    parts_append(star2_to_v2)
+            elif prev != star2:
                 parts_append(star2_to_v1)
         elif p:
             p = cre_stars_.sub(star, p)
@@ -140,29 +147,273 @@ def translate(pat: AnyStr) -> AnyStr:
     return empty.join(parts_)
 
 
+def _translate_segment(pat: AnyStr) -> AnyStr:
+    "Translate a pattern of one path segment (without slashes and **) into a regular expression."
+    # translate(pat) == "(?:[^/]*/)*" + _translate_segment(pat)
+    if isinstance(pat, str):
+        return translate(pat)[len("(?:[^/]*/)*"):]
+    else:
+        return translate(pat)[len(b"(?:[^/]*/)*"):]
+
+
+class GitIgnoreMatcher(Generic[AnyStr]):
+    """Match paths against a list of gitignore patterns, the last matching pattern 
+    decides the outcome, so a negated pattern (which starts with "!") re-includes 
+    the paths excluded by the patterns before it.
+
+    The patterns are divided into 5 kinds, and each kind is folded into one lookup:
+        1. literal names, prefixes or suffixes, e.g. "desktop.ini", "._*" or "*.bak": 
+           dict lookups of the basename
+        2. other patterns without slashes, e.g. ".*.sw[px]": a regular expression 
+           matching the basename
+        3. directory names, e.g. "backup/" or "backup-*/": a dict lookup or a regular 
+           expression matching the name of a directory
+        4. other directory-only patterns, e.g. "/OEBPS/tmp/": a regular expression 
+           matching the path of a directory
+        5. the others, e.g. "/OEBPS/*.tmp": a regular expression matching the path
+    The alternatives of each regular expression are in reverse order, so the first 
+    one that matches is the last matching pattern of the kind. Among the kinds, 
+    the last matching pattern wins. The decisions are kept in an LRU cache.
+
+    As gitignore, a pattern with a trailing slash only matches directories, one 
+    without it matches both files and directories, and a file can not be re-included 
+    if one of its parent directories is excluded. Each parent directory is decided 
+    by all the patterns (see `match_dir`), so a tree walk can skip the ignored 
+    directories (see `ignore_dir`).
+    """
+    def __init__(
+        self, 
+        pat: AnyStr, 
+        *pats: AnyStr, 
+        flags: Optional[RegexFlag] = IGNORECASE, 
+        maxsize: Optional[int] = 4096, 
+    ):
+        not_: AnyStr
+        sep: AnyStr
+        if isinstance(pat, str):
+            not_, sep, self._sep = "!", "|", "/"
+        else:
+            not_, sep, self._sep = b"!", b"|", b"/"
+        flags = flags or RegexFlag(0)
+        self.patterns: tuple[AnyStr, ...] = (pat, *pats)
+        self._ignorecase: bool = bool(flags & IGNORECASE)
+        # The case-insensitive matching of `re` treats some non-ASCII characters as 
+        # equal to ASCII ones (e.g. "ſ" and "s"), so the dicts only work for ASCII 
+        # names, the other names are matched by the regular expressions of the literals
+        self._ascii_only: bool = self._ignorecase and isinstance(pat, str)
+        # Whether the nth pattern is negated
+        self._negated: list[bool] = []
+        # {name: index of the last pattern}, {prefix: ...}, {suffix: ...}, {directory name: ...}
+        self._literals: dict[AnyStr, int] = {}
+        self._prefixes: dict[AnyStr, int] = {}
+        self._suffixes: dict[AnyStr, int] = {}
+        self._dir_literals: dict[AnyStr, int] = {}
+        # For the kinds of (basename, directory name, path, basename of the literals, 
+        # directory name of the literals, path of a directory): (regular expressions 
+        # of the alternatives, the indexes of the patterns)
+        kinds: list[tuple[list[AnyStr], list[int]]] = [([], []) for _ in range(6)]
+        for i, p in enumerate(self.patterns):
+            negated = p.startswith(not_)
+            if negated:
+                p = p[1:]
+            self._negated.append(negated)
+            p = self._normalize(p)
+            if not p:
+                continue
+            if p.endswith(self._sep) and (self._sep in p[:-1] or self._has_star2(p)):
+                # A directory-only pattern only matches the path of a directory
+                kind, expr = 5, translate(p[:-1])
+            elif self._has_star2(p):
+                kind, expr = 2, translate(p)
+            elif self._sep not in p:
+                kind, expr = 0, _translate_segment(p)
+                literal = self._literal_part(p)
+                if literal is not None and self._add_literal(literal, i):
+                    if not self._ascii_only:
+                        continue
+                    kind = 3
+            elif p.endswith(self._sep) and self._sep not in p[:-1]:
+                kind, expr = 1, _translate_segment(p[:-1])
+                literal = self._literal_part(p[:-1])
+                if literal is not None and literal[0] == 0 and self._add_literal((3, literal[1]), i):
+                    if not self._ascii_only:
+                        continue
+                    kind = 4
+            else:
+                kind, expr = 2, translate(p)
+            kinds[kind][0].append(expr)
+            kinds[kind][1].append(i)
+        self._prefix_lengths: list[int] = sorted({len(k) for k in self._prefixes})
+        self._suffix_lengths: list[int] = sorted({len(k) for k in self._suffixes})
+        def compile_kind(exprs: list[AnyStr], indexes: list[int]):
+            if not exprs:
+                return None
+            group = "(%s)" if isinstance(exprs[0], str) else b"(%s)"
+            fullmatch = re_compile(
+                sep.join(group % e for e in reversed(exprs)), flags=flags).fullmatch
+            # The nth group (from 1) is the (-n)th pattern
+            indexes = [-1, *reversed(indexes)]
+            def match(path: AnyStr) -> int:
+                m = fullmatch(path)
+                return -1 if m is None else indexes[m.lastindex] # type: ignore
+            return match
+        (self._match_basename, self._match_dirname, self._match_path, 
+         self._match_basename_literals, self._match_dirname_literals, 
+         self._match_dir_path) = (compile_kind(*kind) for kind in kinds)
+        self._cached_match = lru_cache(maxsize)(self._match)
+        self._cached_match_dir = lru_cache(maxsize)(self._match_dir)
+        self._cached_ignore_dir = lru_cache(maxsize)(self._ignore_dir)
+
+    def _has_star2(self, pat: AnyStr) -> bool:
+        return (cre_stars if isinstance(pat, str) else creb_stars).search(pat) is not None
+
+    def _normalize(self, pat: AnyStr) -> AnyStr:
+        # "**/name" == "name", "**/name/" == "name/", if `name` has no slashes
+        sep = self._sep
+        star2 = "**" if isinstance(pat, str) else b"**"
+        if not pat.startswith(star2 + sep):
+            return pat
+        rest = pat[3:]
+        name = rest[:-1] if rest.endswith(sep) else rest
+        if not name or sep in name or self._has_star2(name):
+            return pat
+        return rest
+
+    def _literal_part(self, pat: AnyStr) -> Optional[tuple[int, AnyStr]]:
+        """If a pattern of the basename is a literal name, a literal prefix followed by "*", 
+        or "*" followed by a literal suffix, return (0, name), (1, prefix) or (2, suffix)."""
+        if isinstance(pat, str):
+            magic_check, star = cre_magic_check, "*"
+        else:
+            magic_check, star = creb_magic_check, b"*"
+        if magic_check.search(pat) is None:
+            return 0, pat
+        elif pat.endswith(star) and magic_check.search(pat[:-1]) is None:
+            return 1, pat[:-1]
+        elif pat.startswith(star) and magic_check.search(pat[1:]) is None:
+            return 2, pat[1:]
+        return None
+
+    def _add_literal(self, literal: tuple[int, AnyStr], index: int) -> bool:
+        which, value = literal
+        if self._ascii_only and not value.isascii():
+            return False
+        if self._ignorecase:
+            value = value.lower()
+        (self._literals, self._prefixes, self._suffixes, self._dir_literals)[which][value] = index
+        return True
+
+    def _match_name(self, name: AnyStr) -> int:
+        # Match the literal names, prefixes and suffixes
+        if self._ascii_only and not name.isascii():
+            if self._match_basename_literals is None:
+                return -1
+            return self._match_basename_literals(name)
+        if self._ignorecase:
+            name = name.lower()
+        index = self._literals.get(name, -1)
+        prefixes = self._prefixes
+        for n in self._prefix_lengths:
+            if n > len(name):
+                break
+            index = max(index, prefixes.get(name[:n], -1))
+        suffixes = self._suffixes
+        for n in self._suffix_lengths:
+            if n > len(name):
+                break
+            index = max(index, suffixes.get(name[len(name)-n:], -1))
+        return index
+
+    def _match_dir_literal(self, name: AnyStr) -> int:
+        if self._ascii_only and not name.isascii():
+            if self._match_dirname_literals is None:
+                return -1
+            return self._match_dirname_literals(name)
+        return self._dir_literals.get(name.lower() if self._ignorecase else name, -1)
+
+    def _match_index(self, path: AnyStr) -> int:
+        # The index of the last matching pattern which applies to files, or -1. 
+        # The parent directories are decided separately (see `_ignore_dir`)
+        basename = path.rpartition(self._sep)[2]
+        index = -1
+        if self._literals or self._prefixes or self._suffixes:
+            index = self._match_name(basename)
+        if self._match_basename is not None:
+            index = max(index, self._match_basename(basename))
+        if self._match_path is not None:
+            index = max(index, self._match_path(path))
+        return index
+
+    def _match(self, path: AnyStr) -> Optional[bool]:
+        # A file in an excluded directory can not be re-included
+        dirname, has_dir, _ = path.rpartition(self._sep)
+        if dirname and self._cached_ignore_dir(dirname):
+            return True
+        index = self._match_index(path)
+        if index < 0:
+            return None
+        return not self._negated[index]
+
+    def _match_dir(self, path: AnyStr) -> Optional[bool]:
+        # A directory is matched as a file, and by the directory-only patterns 
+        # (with a trailing slash). Do not test `path + "/"`, or "foo/*" and "foo/**" 
+        # would match the directory "foo" itself
+        index = self._match_index(path)
+        basename = path.rpartition(self._sep)[2]
+        if self._dir_literals:
+            index = max(index, self._match_dir_literal(basename))
+        if self._match_dirname is not None:
+            index = max(index, self._match_dirname(basename))
+        if self._match_dir_path is not None:
+            index = max(index, self._match_dir_path(path))
+        if index < 0:
+            return None
+        return not self._negated[index]
+
+    def _ignore_dir(self, path: AnyStr) -> bool:
+        # Each directory on the way is decided by all the patterns (`_match_dir`), 
+        # so a directory re-included by a negated pattern is walked into
+        parent, _, _ = path.rpartition(self._sep)
+        if parent and self._cached_ignore_dir(parent):
+            return True
+        return self._cached_match_dir(path) is True
+
+    def match(self, path: AnyStr) -> Optional[bool]:
+        """Return True if `path` is ignored, False if it is re-included by a negated 
+        pattern, or None if no pattern matches it. A path in an ignored directory 
+        is always ignored (see `ignore_dir`)."""
+        return self._cached_match(path)
+
+    def match_dir(self, path: AnyStr) -> Optional[bool]:
+        """Like `match`, but `path` is a directory (without the trailing slash), 
+        and its parent directories are not considered."""
+        return self._cached_match_dir(path)
+
+    def ignore_dir(self, path: AnyStr) -> bool:
+        """Whether the directory `path` (without the trailing slash) or one of its 
+        parent directories is ignored, if so, everything in it is ignored, and 
+        a tree walk does not need to descend into it."""
+        return self._cached_ignore_dir(path)
+
+    def __call__(self, path: AnyStr) -> bool:
+        return self._cached_match(path) is True
+
+    def cache_info(self):
+        return self._cached_match.cache_info()
+
+    def cache_clear(self):
+        self._cached_match.cache_clear()
+        self._cached_match_dir.cache_clear()
+        self._cached_ignore_dir.cache_clear()
+
+
 def make_ignore(
     pat: AnyStr, 
     *pats: AnyStr, 
     flags: Optional[RegexFlag] = IGNORECASE, 
-) -> Callable[[AnyStr], bool]:
+) -> GitIgnoreMatcher[AnyStr]:
     ""
-    not_: AnyStr
-    if isinstance(pat, str):
-        not_ = "!"
-    else:
-        not_ = b"!"
-    def get_ignore(pat: AnyStr) -> Callable[[AnyStr], bool]:
-        if pat.startswith(not_):
-            match = re_compile(translate(pat[1:]), flags=flags).fullmatch
-            return lambda path: match(path) is None
-        else:
-            match = re_compile(translate(pat), flags=flags).fullmatch
-            return lambda path: match(path) is not None
-    ignore = get_ignore(pat)
-    if not pats:
-        return ignore
-    ignores = (ignore, *(map(get_ignore, pats)))
-    return lambda path: any(ignore(path) for ignore in ignores)
+    return GitIgnoreMatcher(pat, *pats, flags=flags)
 
 
 def ignore(
@@ -207,6 +458,12 @@ def ignore(
         True
         >>> ignore("foo/**/bar/hello.py", "foo/fop/foq/bar/hello.py")
         True
+        >>> ignore("foo/**", "foo/bar/hello.py")
+        True
+        >>> ignore("**/foo/**", "bar/foo/hello.py")
+        True
+        >>> not ignore("foo/**", "bar/foo/hello.py")
+        True
         >>> ignore("h?llo.py", "hello.py")
         True
         >>> ignore("h[a-g]llo.py", "hello.py")
@@ -217,6 +474,40 @@ def ignore(
         True
         >>> not ignore("!hello.py", "hello.py")
         True
+        >>> not ignore(["*.py", "!hello.py"], "hello.py")
+        True
+        >>> ignore(["*.py", "!hello.py"], "foo.py")
+        True
+        >>> ignore(["!hello.py", "*.py"], "hello.py")
+        True
+        >>> not ignore(["*.py", "!hello.py"], "hello.txt")
+        True
+        >>> ignore(["foo/", "!foo/hello.py"], "foo/hello.py")
+        True
+        >>> ignore(["._*"], "foo/._bar/hello.py")
+        True
+        >>> make_ignore("foo/", "!bar/").ignore_dir("foo/bar")
+        True
+        >>> not make_ignore("foo/*").ignore_dir("foo")
+        True
+        >>> not ignore(["/*", "!/foo", "/foo/*", "!/foo/bar"], "foo/bar/hello.py")
+        True
+        >>> ignore(["/*", "!/foo", "/foo/*", "!/foo/bar"], "foo/baz/hello.py")
+        True
+        >>> not ignore(["foo/*", "!foo/keep.txt"], "foo/keep.txt")
+        True
+        >>> not ignore(["foo/**", "!foo/keep.txt"], "foo/keep.txt")
+        True
+        >>> ignore(["ab/", "!b/"], "b/ab/a")
+        True
+        >>> ignore(["!a", "a*", "!b/"], "b/ab")
+        True
+        >>> not make_ignore("a/", "a*", "b/", "!a").ignore_dir("a/x.tmp")
+        True
+        >>> not ignore(["a/", "a*", "b/", "!a"], "a/x.tmp/b")
+        True
+        >>> not ignore("**/", "hello.py")
+        True
 
         # test bytes cases
         >>> ignore(b"hello.*", b"hello.py")
@@ -259,6 +550,10 @@ def ignore(
         True
         >>> not ignore(b"!hello.py", b"hello.py")
         True
+        >>> not ignore([b"*.py", b"!hello.py"], b"hello.py")
+        True
+        >>> ignore([b"!hello.py", b"*.py"], b"hello.py")
+        True
     """
     if callable(pats):
         fn = pats
@@ -273,7 +568,7 @@ def read_file(
     path: AnyStr | PathLike[AnyStr], 
 ) -> list[str]:
     ""
-    return [l for l in open(path, encoding="utf-8") 
+    return [l.rstrip("\r\n") for l in open(path, encoding="utf-8") 
               if l.strip() and not l.startswith("#")]
 
 
@@ -4,8 +4,8 @@
 "MIME - Multipurpose Internet Mail Extension"
 
 __author__  = 'ChenyangGao <https://chenyanggao.github.io/>'
-__version__ = (0, 1)
-__all__ = ["guess_mimetype"]
+__version__ = (0, 2)
+__all__ = ["guess_mimetype", "load_table", "build_table", "regenerate_table", "EPUB_CORE_MEDIA_TYPES"]
 
 # Reference:
 # https://www.iana.org/assignments/media-types/media-types.xhtml
@@ -39,20 +39,136 @@ __all__ = ["guess_mimetype"]
 # https://www.filedesc.com
 # https://www.file-extension.org
 
-from . import _001_http_common_mime_types
-from . import _002_mime_file_extension
-from . import _003_mime_all_types
+from os import fsdecode, PathLike
+from os.path import splitext
+from typing import Final, Optional, Union
 
-import mimetypes
 
-if not mimetypes.inited:
-    mimetypes.init()
+# The file (in the package `src`) of the precomputed table, see `regenerate_table()`
+TABLE_FILE: Final[str] = "mime-ext-table.tsv"
 
-from mimetypes import guess_type
-from os import fsdecode, PathLike
-from typing import Optional, Union
+# See: https://www.w3.org/TR/epub-33/#sec-core-media-types
+EPUB_CORE_MEDIA_TYPES: Final[dict[str, str]] = {
+    # Package and navigation documents
+    ".opf": "application/oebps-package+xml", 
+    ".ncx": "application/x-dtbncx+xml", 
+    ".smil": "application/smil+xml", 
+    ".pls": "application/pls+xml", 
+    ".xml": "application/xml", 
+    # Content documents, style sheets and scripts
+    ".xhtml": "application/xhtml+xml", 
+    ".html": "text/html", 
+    ".htm": "text/html", 
+    ".css": "text/css", 
+    ".js": "text/javascript", 
+    ".txt": "text/plain", 
+    ".vtt": "text/vtt", 
+    # Images
+    ".gif": "image/gif", 
+    ".jpg": "image/jpeg", 
+    ".jpeg": "image/jpeg", 
+    ".png": "image/png", 
+    ".svg": "image/svg+xml", 
+    ".webp": "image/webp", 
+    # Audio
+    ".mp3": "audio/mpeg", 
+    ".m4a": "audio/mp4", 
+    ".opus": "audio/ogg", 
+    # Fonts
+    ".ttf": "font/ttf", 
+    ".otf": "font/otf", 
+    ".woff": "font/woff", 
+    ".woff2": "font/woff2", 
+}
 
+# {extension in lowercase: media type}, the EPUB core media types, and the 
+# precomputed table, which is loaded at the first miss
+_ext_to_mime: dict[str, str] = dict(EPUB_CORE_MEDIA_TYPES)
+_table_loaded: bool = False
 
-def guess_mimetype(path: Union[bytes, str, PathLike]) -> Optional[str]:
-    return guess_type(fsdecode(path))[0] or "application/octet-stream"
 
+def load_table() -> dict[str, str]:
+    """Load the precomputed table {extension: media type} from `TABLE_FILE`, 
+    each line is a media type and its extensions (without the dots), separated 
+    by whitespaces."""
+    from pkgutil import get_data
+    data = get_data("src", TABLE_FILE)
+    if data is None:
+        return {}
+    table: dict[str, str] = {}
+    for line in data.decode("utf-8").splitlines():
+        mime, *exts = line.split()
+        for ext in exts:
+            table["." + ext] = mime
+    return table
+
+
+def build_table() -> dict[str, str]:
+    """Build the table {extension: media type} from the sources. The default types 
+    of `mimetypes` (without the system mime files) take precedence, then in the 
+    other sources, the registered types (whose subtypes do not start with "x-", 
+    except the generic "application/octet-stream") are preferred, and the earlier 
+    sources take precedence: 
+    `_001_http_common_mime_types`, `_002_mime_file_extension`, `_003_mime_all_types`."""
+    from mimetypes import MimeTypes
+    from . import _001_http_common_mime_types, _002_mime_file_extension, _003_mime_all_types
+
+    table: dict[str, str] = {}
+    def update(items, registered_only=False):
+        for ext, mime in items:
+            ext = ext.strip().lower()
+            mime = mime.strip()
+            if registered_only and (mime.partition("/")[2].startswith("x-") 
+                    or mime == "application/octet-stream"):
+                continue
+            if ext.startswith(".") and len(ext) > 1 and mime and \
+                    not any(c.isspace() for c in ext + mime):
+                table.setdefault(ext, mime)
+    update(MimeTypes().types_map[True].items())
+    sources = (
+        _001_http_common_mime_types.ext_to_mime.items(), 
+        [(ext, mimes[0]) for ext, mimes in _002_mime_file_extension.ext_to_mimes.items() if mimes], 
+        _003_mime_all_types.ext_to_mime.items(), 
+    )
+    for registered_only in (True, False):
+        for items in sources:
+            update(items, registered_only)
+    return table
+
+
+def regenerate_table(path: Union[None, str, PathLike] = None):
+    """Rebuild the precomputed table (see `build_table()`), after the sources 
+    are updated, and write it into `path` (default to `TABLE_FILE` in the package `src`).
+    Run `python -m util.mimetype` in the directory of `watch_epub`."""
+    if path is None:
+        from pathlib import Path
+        path = Path(__file__).parents[2] / "src" / TABLE_FILE
+    mime_to_exts: dict[str, list[str]] = {}
+    for ext, mime in build_table().items():
+        mime_to_exts.setdefault(mime, []).append(ext[1:])
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for mime in sorted(mime_to_exts):
+            f.write("%s\t%s\n" % (mime, " ".join(sorted(mime_to_exts[mime]))))
+
+
+def guess_mimetype(path: Union[bytes, str, PathLike]) -> Optional[str]:
+    """Guess the media type by the extension of `path`: from the EPUB core media 
+    types, then the precomputed table (loaded at the first miss), at last 
+    `mimetypes.guess_type` (which reads the system mime files)."""
+    global _table_loaded
+    path_: str = fsdecode(path)
+    ext = splitext(path_)[1].lower()
+    try:
+        return _ext_to_mime[ext]
+    except KeyError:
+        pass
+    if not _table_loaded:
+        for ext_, mime in load_table().items():
+            _ext_to_mime.setdefault(ext_, mime)
+        _table_loaded = True
+        try:
+            return _ext_to_mime[ext]
+        except KeyError:
+            pass
+    from mimetypes import guess_type
+    return guess_type(path_)[0] or "application/octet-stream"
@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"Regenerate the precomputed table of the media types, see `util.mimetype.regenerate_table`"
+
+from util.mimetype import regenerate_table, TABLE_FILE
+
+regenerate_table()
+print("Regenerated:", TABLE_FILE)
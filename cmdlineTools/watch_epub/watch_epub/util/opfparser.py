@@ -2,7 +2,7 @@
 # coding: utf-8
 
 __author__  = "ChenyangGao <https://chenyanggao.github.io/>"
-__version__ = (0, 1, 2)
+__version__ = (0, 1, 3)
 __all__ = ["get_opf_bookpath", "OpfParser"]
 
 # Reference:
@@ -12,7 +12,8 @@ __all__ = ["get_opf_bookpath", "OpfParser"]
 import os.path as syspath
 import posixpath
 
-from os import fsdecode, PathLike
+from functools import lru_cache
+from os import fsdecode, fspath, PathLike
 from typing import AnyStr, Optional, Union
 from urllib.parse import quote, unquote
 
@@ -40,9 +41,19 @@ def get_opf_bookpath(ebook_root: AnyStr | PathLike[AnyStr] = "") -> str:
 
 
 class OpfParser:
+    """The conversions between paths, bookpaths and hrefs are memoized in LRU caches 
+    (at most `maxsize` entries each, None means unbounded), see `cache_clear()`."""
 
-    def __init__(self, ebook_root: AnyStr | PathLike[AnyStr] = ""):
+    def __init__(
+        self, 
+        ebook_root: AnyStr | PathLike[AnyStr] = "", 
+        maxsize: Optional[int] = 4096, 
+    ):
         self.ebook_root: str = fsdecode(syspath.realpath(ebook_root))
+        # The paths under `ebook_root` start with it
+        self._root_prefix: str = syspath.join(self.ebook_root, "")
+        self._cached_path_to_bookpath = lru_cache(maxsize)(self._path_to_bookpath)
+        self._cached_bookpath_to_href = lru_cache(maxsize)(self._bookpath_to_href)
         self.opf_bookpath: str = get_opf_bookpath(ebook_root)
         self.opf_path: str = self.bookpath_to_path(self.opf_bookpath)
         self.opf_dir: str
@@ -132,8 +143,26 @@ class OpfParser:
     def version(self) -> str:
         return self.package.attrib["version"]
 
+    def cache_clear(self):
+        """Clear the caches of the conversions. They are pure functions of their inputs, 
+        so it's not needed when the files are moved, but only to free the memory."""
+        self._cached_path_to_bookpath.cache_clear()
+        self._cached_bookpath_to_href.cache_clear()
+
+    def _bookpath_to_href(self, bookpath: str) -> str:
+        opf_dir = self.opf_dir
+        # Fast path: a normalized bookpath in the directory of the OPF file
+        if bookpath.startswith(opf_dir):
+            href = bookpath[len(opf_dir):]
+            if (
+                href and href[0] != "/" and href[-1] not in "/." 
+                and "./" not in href and "//" not in href
+            ):
+                return href
+        return posixpath.relpath(bookpath, opf_dir)
+
     def bookpath_to_href(self, bookpath: str) -> str:
-        return posixpath.relpath(bookpath, self.opf_dir)
+        return self._cached_bookpath_to_href(bookpath)
 
     def bookpath_to_path(self, bookpath: str) -> str:
         return syspath.join(
@@ -148,12 +177,24 @@ class OpfParser:
         bookpath = self.href_to_bookpath(href)
         return self.bookpath_to_path(bookpath)
 
-    def path_to_bookpath(self, path: Union[AnyStr, PathLike[AnyStr]]) -> str:
+    def _path_to_bookpath(self, path: AnyStr) -> str:
         path_: str = fsdecode(syspath.realpath(path))
+        # Fast path: `realpath` is normalized, so is the remaining part
+        if path_.startswith(self._root_prefix):
+            return path_to_posix(path_[len(self._root_prefix):])
         if not path_.startswith(self.ebook_root):
             raise ValueError(f"{path!r} is not in the directory {self.ebook_root!r}")
         return path_to_posix(syspath.relpath(path_, self.ebook_root))
 
+    def path_to_bookpath(self, path: Union[AnyStr, PathLike[AnyStr]]) -> str:
+        """Memoized for the absolute paths (such as those of the watcher events), 
+        the cache is looked up first, `realpath` is only called at a miss. A relative 
+        path depends on the working directory, which may change, so it's not cached."""
+        path = fspath(path)
+        if syspath.isabs(path):
+            return self._cached_path_to_bookpath(path)
+        return self._path_to_bookpath(path)
+
     def path_to_href(self, path: Union[AnyStr, PathLike[AnyStr]]) -> str:
         bookpath = self.path_to_bookpath(path)
         return self.bookpath_to_href(bookpath)
@@ -2,9 +2,10 @@
 # coding: utf-8
 
 __author__  = "ChenyangGao <https://chenyanggao.github.io/>"
-__version__ = (0, 1, 1)
+__version__ = (0, 1, 2)
 __all__ = ["OpfWrapper", "ManifestItem", "SpineItemref"]
 
+from collections import defaultdict
 from os import PathLike
 from typing import AnyStr, Iterator, NamedTuple, Optional, Union
 from urllib.parse import quote, unquote
@@ -15,6 +16,8 @@ from util.mapper import Mapper
 from util.mimetype import guess_mimetype
 from util.makeid import makeid
 from util.opfparser import OpfParser
+from util.pathtrie import PathTrie
+from util.undefined import undefined, UndefinedType
 
 
 SPINE_CONCERNED_MIMES = ["text/html", "application/xhtml+xml"]
@@ -39,13 +42,88 @@ class SpineItemref(NamedTuple):
 
 class OpfWrapper(OpfParser):
 
-    def __init__(self, ebook_root: AnyStr | PathLike[AnyStr] = ""):
-        super().__init__(ebook_root)
+    def __init__(
+        self, 
+        ebook_root: AnyStr | PathLike[AnyStr] = "", 
+        maxsize: Optional[int] = 4096, 
+    ):
+        super().__init__(ebook_root, maxsize)
+
+        # Increase by 1 whenever the manifest is changed
+        self.revision: int = 0
 
         # Invert key dictionaries to allow for reverse access
         self.id_to_bookpath = Mapper((id, self.id_to_bookpath(id)) for id in self.manifest_map)
         self.href_to_id = Mapper((self.id_to_href(id), id) for id in self.manifest_map)
         self.bookpath_to_id = Mapper((self.id_to_bookpath(id), id) for id in self.manifest_map)
+        # Index of the bookpaths by directories
+        self.bookpath_trie = PathTrie(self.bookpath_to_id)
+        # Indexes of the manifest items by media-type and by property, 
+        # each maps to the ids (as an ordered set) in the order of addition
+        self.media_type_to_ids: defaultdict[str, dict[str, None]] = defaultdict(dict)
+        self.property_to_ids: defaultdict[str, dict[str, None]] = defaultdict(dict)
+        for id, item in self.manifest_map.items():
+            self._index(id, item.get("media-type"), item.get("properties"))
+
+    def _index(self, id: str, media_type: Optional[str], properties: Optional[str]):
+        if media_type:
+            self.media_type_to_ids[media_type][id] = None
+        if properties:
+            property_to_ids = self.property_to_ids
+            for prop in properties.split():
+                property_to_ids[prop][id] = None
+
+    def _unindex(self, id: str, media_type: Optional[str], properties: Optional[str]):
+        def discard(index, key):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(id, None)
+                if not ids:
+                    del index[key]
+        if media_type:
+            discard(self.media_type_to_ids, media_type)
+        if properties:
+            for prop in properties.split():
+                discard(self.property_to_ids, prop)
+
+    def id_to_media_type(
+        self, 
+        id: str, 
+        value: Union[UndefinedType, str] = undefined, 
+    ) -> str:
+        if value is not undefined:
+            self._unindex(id, self.manifest_map[id].get("media-type"), None)
+            self._index(id, value, None)
+            self.revision += 1
+        return super().id_to_media_type(id, value)
+
+    def id_to_properties(
+        self, 
+        id: str, 
+        value: Union[UndefinedType, None, str] = undefined, 
+    ) -> Optional[str]:
+        if value is not undefined:
+            self._unindex(id, None, self.manifest_map[id].get("properties"))
+            self._index(id, None, value)
+            self.revision += 1
+        return super().id_to_properties(id, value)
+
+    def bookpath_to_media_type(self, bookpath: str) -> Optional[str]:
+        """The media-type of the manifest item at `bookpath`, or None if it's not in the manifest.
+        It's read from the index `bookpath_to_id`, which is always up to date, so no cache is needed."""
+        try:
+            id = self.bookpath_to_id(bookpath)
+        except KeyError:
+            return None
+        return self.manifest_map[id].get("media-type")
+
+    def ids_of_media_type(self, media_type: str) -> Iterator[str]:
+        "Iterate over the ids of the manifest items with the `media_type`."
+        return iter(self.media_type_to_ids.get(media_type, ()))
+
+    def ids_of_property(self, prop: str) -> Iterator[str]:
+        "Iterate over the ids of the manifest items with the property `prop`."
+        return iter(self.property_to_ids.get(prop, ()))
 
     def has(
         self, 
@@ -150,6 +228,9 @@ class OpfWrapper(OpfParser):
         self.id_to_bookpath[id] = bookpath
         self.href_to_id[href] = id
         self.bookpath_to_id[bookpath] = id
+        self.bookpath_trie.add(bookpath)
+        self._index(id, media_type, properties)
+        self.revision += 1
 
         if media_type in SPINE_CONCERNED_MIMES:
             el = Element("itemref", {"idref": id})
@@ -167,41 +248,73 @@ class OpfWrapper(OpfParser):
         item = self.get(id, href, bookpath)
 
         el = self.manifest_map.pop(item.id)
-        self.manifest.remove(el)
+        el.getparent().remove(el)
 
         del self.id_to_bookpath[item.id]
         del self.href_to_id[item.href]
         del self.bookpath_to_id[item.bookpath]
+        self.bookpath_trie.discard(item.bookpath)
+        self._unindex(item.id, item.media_type, item.properties)
+        self.revision += 1
 
         if item.id in self.spine_map:
             el = self.spine_map.pop(item.id)
-            self.spine.remove(el)
+            el.getparent().remove(el)
 
         return item
 
+    def _move(self, src_bookpath: str, dest_bookpath: str) -> str:
+        id = self.bookpath_to_id(src_bookpath)
+        src_href = self.id_to_href(id)
+        dest_href = self.bookpath_to_href(dest_bookpath)
+        del self.bookpath_to_id[src_bookpath]
+        self.bookpath_to_id[dest_bookpath] = id
+        del self.href_to_id[src_href]
+        self.href_to_id[dest_href] = id
+        self.id_to_bookpath[id] = dest_bookpath
+        self.id_to_href(id, dest_href)
+        self.revision += 1
+        return id
+
+    def move(self, src_bookpath: str, dest_bookpath: str) -> str:
+        "Change the bookpath of a manifest item (the id is kept), and return its id."
+        id = self._move(src_bookpath, dest_bookpath)
+        self.bookpath_trie.discard(src_bookpath)
+        self.bookpath_trie.add(dest_bookpath)
+        return id
+
+    def iter_dir(self, dir_bookpath: str) -> Iterator[str]:
+        "Iterate over the bookpaths of all manifest items under the directory `dir_bookpath`."
+        return self.bookpath_trie.iter_dir(dir_bookpath)
+
+    def move_dir(self, src_dir: str, dest_dir: str) -> list[tuple[str, str]]:
+        """Move all manifest items under the directory `src_dir` into the directory `dest_dir`.
+
+        :return: A list of the moved (src_bookpath, dest_bookpath).
+        """
+        moved = self.bookpath_trie.move_dir(src_dir, dest_dir)
+        for src_bookpath, dest_bookpath in moved:
+            self._move(src_bookpath, dest_bookpath)
+        return moved
+
+    def delete_dir(self, dir_bookpath: str) -> list[ManifestItem]:
+        "Delete all manifest items under the directory `dir_bookpath`, and return them."
+        return [self.delete(bookpath=bookpath) for bookpath in tuple(self.iter_dir(dir_bookpath))]
+
     def gettocid(self):
         # To find the manifest id of toc.ncx
-        return next((
-            id for id, item in self.manifest_map.items()
-            if item.get("media-type") == "application/x-dtbncx+xml"
-        ), None)
+        return next(self.ids_of_media_type("application/x-dtbncx+xml"), None)
 
     def getpagemapid(self):
         # To find the manifest id of page-map.xml
-        return next((
-            id for id, item in self.manifest_map.items()
-            if item.get("media-type") == "application/oebs-page-map+xml"
-        ), None)
+        return next(self.ids_of_media_type("application/oebs-page-map+xml"), None)
 
     def getnavid(self):
         # To find the manifest id of nav.xhtml
-        if self.epub < "3.0":
+        if self.version < "3.0":
             return None
-        return next((
-            id for id, item in self.manifest_map.items()
-            if item.get("media-type") == "application/xhtml+xml"
-                and "nav" in item.get("properties", "")
-        ), None)
+        xhtml_ids = self.media_type_to_ids.get("application/xhtml+xml", ())
+        return next((id for id in self.ids_of_property("nav") if id in xhtml_ids), None)
 
     def manifest_iter(self) -> Iterator[ManifestItem]:
         yield from map(self.get, self.manifest_map)
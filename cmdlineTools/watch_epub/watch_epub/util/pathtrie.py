@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+__all__ = ["PathTrie"]
+
+from typing import Iterable, Iterator, Optional
+
+
+class _Node:
+    __slots__ = ("children", "is_file")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.is_file: bool = False
+
+
+class PathTrie:
+    """A set of posix paths (e.g. bookpaths), organized as a trie of path parts,
+    so that the paths under a directory can be enumerated, moved or deleted in
+    time proportional to the size of the directory (instead of all paths).
+
+    Examples::
+        >>> trie = PathTrie(["a/b.txt", "a/c/d.txt", "e.txt"])
+        >>> sorted(trie.iter_dir("a"))
+        ['a/b.txt', 'a/c/d.txt']
+        >>> trie.move_dir("a/c", "f")
+        [('a/c/d.txt', 'f/d.txt')]
+        >>> sorted(trie)
+        ['a/b.txt', 'e.txt', 'f/d.txt']
+        >>> trie.pop_dir("a")
+        ['a/b.txt']
+        >>> len(trie)
+        2
+    """
+    def __init__(self, paths: Iterable[str] = ()):
+        self._root = _Node()
+        self._size = 0
+        for path in paths:
+            self.add(path)
+
+    def __contains__(self, path: str) -> bool:
+        node = self._find(path)
+        return node is not None and node.is_file
+
+    def __iter__(self) -> Iterator[str]:
+        return self._iter_node(self._root, "")
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return "%s(%r)" % (type(self).__qualname__, list(self))
+
+    @staticmethod
+    def _split(path: str) -> list[str]:
+        return [part for part in path.split("/") if part]
+
+    def _find(self, path: str) -> Optional[_Node]:
+        node = self._root
+        for part in self._split(path):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def _iter_node(self, node: _Node, prefix: str) -> Iterator[str]:
+        stack = [(node, prefix)]
+        while stack:
+            node, prefix = stack.pop()
+            if node.is_file and prefix:
+                yield prefix[:-1]
+            for part, child in node.children.items():
+                stack.append((child, prefix + part + "/"))
+
+    def _detach(self, path: str) -> Optional[_Node]:
+        # Remove the node of `path` from its parent, and prune the empty ancestors
+        parts = self._split(path)
+        if not parts:
+            return None
+        ancestors = []
+        node = self._root
+        for part in parts:
+            child = node.children.get(part)
+            if child is None:
+                return None
+            ancestors.append((node, part))
+            node = child
+        parent, part = ancestors.pop()
+        del parent.children[part]
+        while ancestors and not parent.children and not parent.is_file:
+            parent, part = ancestors.pop()
+            del parent.children[part]
+        return node
+
+    def add(self, path: str):
+        node = self._root
+        for part in self._split(path):
+            children = node.children
+            try:
+                node = children[part]
+            except KeyError:
+                node = children[part] = _Node()
+        if not node.is_file:
+            node.is_file = True
+            self._size += 1
+
+    def discard(self, path: str):
+        node = self._find(path)
+        if node is None or not node.is_file:
+            return
+        node.is_file = False
+        self._size -= 1
+        if not node.children:
+            self._detach(path)
+
+    def iter_dir(self, dir_path: str) -> Iterator[str]:
+        "Iterate over the paths under the directory `dir_path`."
+        node = self._find(dir_path)
+        if node is None:
+            return iter(())
+        prefix = "/".join(self._split(dir_path)) + "/"
+        return (path for path in self._iter_node(node, prefix) if path != prefix[:-1])
+
+    def _detach_dir(self, dir_path: str) -> Optional[_Node]:
+        # Detach the subtree under `dir_path` (but `dir_path` itself stays if it's a path)
+        node = self._detach(dir_path)
+        if node is not None and node.is_file:
+            sub = _Node()
+            sub.children, node.children = node.children, {}
+            self._graft(self._root, "/".join(self._split(dir_path)))
+            return sub
+        return node
+
+    def pop_dir(self, dir_path: str) -> list[str]:
+        "Remove the directory `dir_path`, and return the removed paths under it."
+        paths = list(self.iter_dir(dir_path))
+        if paths:
+            self._detach_dir(dir_path)
+            self._size -= len(paths)
+        return paths
+
+    def move_dir(self, src_dir: str, dest_dir: str) -> list[tuple[str, str]]:
+        """Move the directory `src_dir` to `dest_dir` (be merged if it exists).
+
+        :return: A list of the moved (src_path, dest_path).
+        """
+        src_prefix = "/".join(self._split(src_dir)) + "/"
+        dest_prefix = "/".join(self._split(dest_dir)) + "/"
+        if dest_prefix.startswith(src_prefix):
+            raise ValueError("Cannot move the directory %r into itself: %r" % (src_dir, dest_dir))
+        moved = [(path, dest_prefix + path[len(src_prefix):]) for path in self.iter_dir(src_dir)]
+        if not moved:
+            return moved
+        sub = self._detach_dir(src_dir)
+        parent = self._root
+        *parts, name = self._split(dest_dir)
+        for part in parts:
+            children = parent.children
+            try:
+                parent = children[part]
+            except KeyError:
+                parent = children[part] = _Node()
+        node = parent.children.get(name)
+        if node is None:
+            # Graft the whole subtree at once
+            parent.children[name] = sub
+        else:
+            self._size -= len(moved)
+            for _, dest_path in moved:
+                self.add(dest_path)
+        return moved
+
+    def _graft(self, node: _Node, relpath: str):
+        for part in relpath.split("/"):
+            children = node.children
+            try:
+                node = children[part]
+            except KeyError:
+                node = children[part] = _Node()
+        node.is_file = True
@@ -25,6 +25,7 @@ import os.path as syspath
 import ntpath
 import posixpath
 
+from functools import lru_cache
 from nturl2path import pathname2url as path_nt_to_url, url2pathname as path_url_to_nt
 from os import fspath, PathLike
 from re import compile as re_compile, Pattern
@@ -317,6 +318,31 @@ def clean_parts(parts: list[AnyStr]) -> list[AnyStr]:
     return parts
 
 
+@lru_cache(maxsize=None)
+def _markers(sep: AnyStr) -> tuple[AnyStr, AnyStr, AnyStr, AnyStr, AnyStr]:
+    # The substrings for `_is_clean()` and `_reference_path()`
+    dot: AnyStr = "." if isinstance(sep, str) else b"." # type: ignore
+    return sep + sep, sep + dot + sep, sep + dot + dot + sep, dot + sep, dot + dot + sep
+
+
+def _is_clean(path: AnyStr, sep: AnyStr) -> bool:
+    # Whether `sep.join(clean_parts(path.split(sep)))` is `path` itself, i.e. 
+    # no part is '' (except the first and the last), '.' or '..'
+    sepsep, sepdotsep, sepdotdotsep, _, _ = _markers(sep)
+    if sepsep in path:
+        return False
+    path = sep + path + sep
+    return sepdotsep not in path and sepdotdotsep not in path
+
+
+def _normalize(path: AnyStr, sep: AnyStr) -> AnyStr:
+    # Same as `sep.join(clean_parts(path.split(sep)))`, but without the 
+    # intermediate lists if `path` is already clean
+    if _is_clean(path, sep):
+        return path
+    return sep.join(clean_parts(path.split(sep)))
+
+
 def normalize_ntpath(path: AnyStr | PathLike[AnyStr]) -> AnyStr:
     ""
     path_: AnyStr = fspath(path)
@@ -367,6 +393,13 @@ def relative_path(
     :param sep:    The path separator.
 
     :return: The relative path from `path` to `pathto`.
+
+        >>> relative_path("OEBPS/Text/c1.xhtml", "OEBPS/Images/a.png", "/")
+        '../Images/a.png'
+        >>> relative_path("OEBPS/Text/c1.xhtml", "OEBPS/Text/./c2.xhtml", "/")
+        'c2.xhtml'
+        >>> relative_path("OEBPS/Text/", "OEBPS/Text/sub/c2.xhtml", "/")
+        'sub/c2.xhtml'
     """
     path1: AnyStr = fspath(path)
     path2: AnyStr = fspath(pathto)
@@ -388,9 +421,23 @@ def relative_path(
             return ""
         else:
             return b""
+    return _relative_path(path1, path2, realsep)
 
-    parts_org: list[AnyStr] = clean_parts(split(path1, realsep))
-    parts_dst: list[AnyStr] = clean_parts(split(path2, realsep))
+
+@lru_cache(maxsize=4096)
+def _relative_path(path1: AnyStr, path2: AnyStr, sep: AnyStr) -> AnyStr:
+    path1 = _normalize(path1, sep)
+    path2 = _normalize(path2, sep)
+
+    # Fast path: `path2` is under the starting directory of `path1`
+    start_dir: AnyStr = path1[:path1.rfind(sep)+1]
+    if path2.startswith(start_dir):
+        rest: AnyStr = path2[len(start_dir):]
+        head, _, tail = rest.partition(sep)
+        return tail if head == path1[len(start_dir):] else rest
+
+    parts_org: list[AnyStr] = path1.split(sep)
+    parts_dst: list[AnyStr] = path2.split(sep)
 
     i: int = 0
     for p1, p2 in zip(parts_org, parts_dst):
@@ -408,7 +455,7 @@ def relative_path(
         *((pardir,) * (len(parts_org)-i-1)), 
         *parts_dst[i:]
     )
-    return realsep.join(parts)
+    return sep.join(parts)
 
 
 def reference_path(
@@ -432,6 +479,23 @@ def reference_path(
     :param sep:    The path separator.
 
     :return: The reference path from `path` to `pathto`.
+
+    The results are memoized by (the starting directory of `path`, `pathto`).
+
+        >>> reference_path("OEBPS/Text/c1.xhtml", "../Images/a.png", "/")
+        'OEBPS/Images/a.png'
+        >>> reference_path("OEBPS/Text/c1.xhtml", "./c2.xhtml", "/")
+        'OEBPS/Text/c2.xhtml'
+        >>> reference_path("OEBPS/Text/c1.xhtml", "sub//./c2.xhtml", "/")
+        'OEBPS/Text/sub/c2.xhtml'
+        >>> reference_path("OEBPS/c1.xhtml", "../../a.png", "/")
+        '../a.png'
+        >>> reference_path("c1.xhtml", "..", "/")
+        '../'
+        >>> reference_path("/OEBPS/c1.xhtml", "../../a.png", "/")
+        Traceback (most recent call last):
+            ...
+        ValueError: Exceeded the root directory!
     """
     path1: AnyStr = fspath(path)
     path2: AnyStr = fspath(pathto)
@@ -445,10 +509,29 @@ def reference_path(
     else:
         realsep = sep
 
-    parts = path1.split(realsep)
-    parts[-1:] = path2.split(realsep)
-
-    return realsep.join(clean_parts(parts))
+    return _reference_path(path1[:path1.rfind(realsep)+1], path2, realsep)
+
+
+@lru_cache(maxsize=4096)
+def _reference_path(start_dir: AnyStr, path: AnyStr, sep: AnyStr) -> AnyStr:
+    # The same as `sep.join(clean_parts((start_dir + path).split(sep)))`, 
+    # `start_dir` is empty or ends with `sep`
+    _, _, _, dotsep, dotdotsep = _markers(sep)
+    if start_dir and _is_clean(start_dir, sep):
+        # Reduce the leading './' and '../' of `path` by string slicing, but 
+        # `start_dir` never becomes empty, or `path` might become the root
+        while True:
+            if path.startswith(dotsep):
+                path = path[len(dotsep):]
+            elif path.startswith(dotdotsep):
+                index = start_dir.rfind(sep, 0, -1)
+                if index < 0:
+                    break
+                start_dir = start_dir[:index+1]
+                path = path[len(dotdotsep):]
+            else:
+                break
+    return _normalize(start_dir + path, sep)
 
 
 def path_posix_to_nt(path: AnyStr | PathLike[AnyStr]) -> AnyStr:
@@ -529,3 +612,7 @@ def path_posix_to_sys(path: AnyStr | PathLike[AnyStr]) -> AnyStr:
     else:
         raise NotImplementedError
 
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+__all__ = ["ReferenceCache", "CacheEntry", "epub_digest", "sidecar_path"]
+
+import os.path as syspath
+import sqlite3
+
+from collections import Counter
+from contextlib import closing
+from hashlib import md5
+from json import dumps, loads
+from os import fsdecode, PathLike
+from typing import AnyStr, Final, NamedTuple, Optional
+from zipfile import ZipFile
+
+
+# Increase it when the layout of the cache file changes
+CACHE_FORMAT: Final[int] = 1
+
+
+class CacheEntry(NamedTuple):
+    size: int
+    digest: bytes
+    result: dict[str, Counter]
+
+
+def epub_digest(path: AnyStr | PathLike[AnyStr]) -> str:
+    """Digest of the content of an EPUB file. It only reads the central directory
+    of the zip file, which records the CRC-32 and the size of each member."""
+    h = md5()
+    with ZipFile(path) as zf:
+        for zinfo in sorted(zf.infolist(), key=lambda zi: zi.filename):
+            h.update(b"%s\0%d\0%d\0" % (
+                zinfo.filename.encode("utf-8"), zinfo.CRC, zinfo.file_size))
+    return h.hexdigest()
+
+
+def sidecar_path(path: AnyStr | PathLike[AnyStr]) -> str:
+    "The path of the cache file next to the EPUB file."
+    return fsdecode(path) + ".refcache"
+
+
+class ReferenceCache:
+    """The analyzed references of the files in an EPUB, persisted in a SQLite
+    file next to the EPUB file.
+
+    If the EPUB file has not been changed since the cache was saved (compared
+    by `epub_digest`), the entries are `trusted`, that is, a file only needs to
+    have the same size. Otherwise, a file also needs to have the same content
+    digest to reuse its entry.
+    """
+    def __init__(self, version: str = ""):
+        # Should be changed whenever the analysis gives different results
+        self.version: str = "%d:%s" % (CACHE_FORMAT, version)
+        self.entries: dict[str, CacheEntry] = {}
+        self.trusted: bool = False
+        self._staged: Optional[dict[str, CacheEntry]] = None
+
+    def load(self, path: AnyStr | PathLike[AnyStr]) -> bool:
+        "Load the cache of the EPUB file `path`. Return False if there is no usable cache."
+        cache_path = sidecar_path(path)
+        if not syspath.isfile(cache_path):
+            return False
+        try:
+            digest = epub_digest(path)
+            with closing(sqlite3.connect(cache_path)) as con:
+                meta = dict(con.execute("SELECT key, value FROM meta"))
+                if meta.get("version") != self.version:
+                    return False
+                self.entries = {
+                    bookpath: CacheEntry(size, file_digest, {
+                        key: Counter(val) for key, val in loads(result).items()})
+                    for bookpath, size, file_digest, result in con.execute(
+                        "SELECT bookpath, size, digest, result FROM refs")
+                }
+        except (OSError, sqlite3.Error, ValueError):
+            return False
+        self.trusted = meta.get("epub_digest") == digest
+        return True
+
+    def stage(self, entries: dict[str, CacheEntry]):
+        "Keep the entries to be saved, when the EPUB file has been generated."
+        self._staged = entries
+
+    def save(
+        self, 
+        path: AnyStr | PathLike[AnyStr], 
+        entries: Optional[dict[str, CacheEntry]] = None, 
+    ):
+        "Save the staged entries (or `entries` if given) as the cache of the EPUB file `path`."
+        if entries is None:
+            entries = self._staged
+        if entries is None:
+            return
+        digest = epub_digest(path)
+        with closing(sqlite3.connect(sidecar_path(path))) as con:
+            with con:
+                con.execute("DROP TABLE IF EXISTS meta")
+                con.execute("DROP TABLE IF EXISTS refs")
+                con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+                con.execute(
+                    "CREATE TABLE refs (bookpath TEXT PRIMARY KEY, "
+                    "size INTEGER, digest BLOB, result TEXT)")
+                con.executemany("INSERT INTO meta VALUES (?, ?)", (
+                    ("version", self.version), ("epub_digest", digest)))
+                con.executemany("INSERT INTO refs VALUES (?, ?, ?, ?)", (
+                    (bookpath, entry.size, entry.digest, dumps(entry.result))
+                    for bookpath, entry in entries.items()
+                ))
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+__all__ = ["INCREMENTAL_THRESHOLD", "ReferenceGraph", "content_digest", "diff_span"]
+
+from collections import defaultdict, Counter
+from hashlib import md5
+from typing import Callable, Collection, Final, Optional
+
+
+# Only files larger than this (number of characters) keep their text in memory,
+# so that the next analysis can be restricted to the changed region.
+INCREMENTAL_THRESHOLD: Final[int] = 1 << 16
+# Block size used to compare the old and new texts
+_DIFF_BLOCK: Final[int] = 1 << 14
+
+
+def content_digest(data: bytes) -> bytes:
+    "Digest of the file content, used to tell whether a file has actually changed."
+    return md5(data).digest()
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    # Compare block by block, string comparison is fast
+    while i < n:
+        j = min(i + _DIFF_BLOCK, n)
+        if a[i:j] != b[i:j]:
+            break
+        i = j
+    else:
+        return n
+    lo, hi = i, min(i + _DIFF_BLOCK, n)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[i:mid] == b[i:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_length(a: str, b: str, limit: int) -> int:
+    n = min(len(a), len(b), limit)
+    la, lb = len(a), len(b)
+    i = 0
+    while i < n:
+        j = min(i + _DIFF_BLOCK, n)
+        if a[la-j:la-i] != b[lb-j:lb-i]:
+            break
+        i = j
+    else:
+        return n
+    lo, hi = i, min(i + _DIFF_BLOCK, n)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la-mid:la-i] == b[lb-mid:lb-i]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def diff_span(old: str, new: str) -> tuple[int, int, int]:
+    """Find the changed region between two texts.
+
+    :return: A tuple `(start, old_stop, new_stop)`, such that
+        `old[:start] == new[:start]` and `old[old_stop:] == new[new_stop:]`.
+
+    Examples::
+        >>> diff_span("abcdef", "abXYef")
+        (2, 4, 4)
+        >>> diff_span("abc", "abc")
+        (3, 3, 3)
+        >>> diff_span("aaa", "aaaa")
+        (3, 3, 4)
+    """
+    start = _common_prefix_length(old, new)
+    suffix = _common_suffix_length(old, new, min(len(old), len(new)) - start)
+    return start, len(old) - suffix, len(new) - suffix
+
+
+def _style_element_around(text: str, pos: int) -> Optional[tuple[int, int]]:
+    """If `pos` may lie inside a <style> element of `text`, return the span of 
+    this element, otherwise return None. It errs on the side of caution."""
+    i = text.rfind("<style", 0, pos)
+    if i < 0:
+        return None
+    c = text.find(">", i)
+    if c < 0:
+        return None
+    # NOTE: The content of a <style> element is not empty
+    j = text.find("</style>", c + 2)
+    if j < 0:
+        return i, len(text)
+    if j + 8 > pos:
+        return i, j + 8
+    return None
+
+
+def _style_attr_around(text: str, pos: int) -> Optional[tuple[int, int]]:
+    """If `pos` may lie inside a style attribute (whose value may contain ">") of 
+    `text`, return the span from the "<" of the tag to the end of the attribute,
+    otherwise return None. It errs on the side of caution."""
+    q0 = text.rfind('"', 0, pos)
+    i = q0 - 6
+    if i < 0 or not text.startswith('style="', i):
+        return None
+    q1 = text.find('"', q0 + 1)
+    if q1 < pos or q1 == q0 + 1:
+        return None
+    # NOTE: The tag may contain other style attributes before, whose values contain ">"
+    return max(text.rfind("<", 0, i), 0), q1 + 1
+
+
+def _is_gap(text: str, pos: int) -> bool:
+    # NOTE: After a ">" character, no reference of a tag can span across it,
+    #       except for <style> elements and style attributes.
+    return text[pos-1] == ">"
+
+
+def _widen_start(text: str, start: int) -> int:
+    while start > 0:
+        span = _style_element_around(text, start) or _style_attr_around(text, start)
+        if span is None:
+            if _is_gap(text, start):
+                return start
+            i = start - 1
+        else:
+            i = span[0]
+        start = text.rfind(">", 0, i) + 1
+    return 0
+
+
+def _widen_stop(text: str, stop: int) -> int:
+    size = len(text)
+    while 0 < stop < size:
+        span = _style_element_around(text, stop) or _style_attr_around(text, stop)
+        if span is None:
+            if _is_gap(text, stop):
+                return stop
+            k = text.find(">", stop)
+            if k < 0:
+                return size
+            stop = k + 1
+        else:
+            stop = span[1]
+    if stop <= 0:
+        k = text.find(">")
+        return size if k < 0 else _widen_stop(text, k + 1)
+    return size
+
+
+def _widen_span(old: str, new: str, start: int, old_stop: int, new_stop: int):
+    "Widen the changed region to the boundaries that no reference can span across."
+    while True:
+        start_ = min(_widen_start(old, start), _widen_start(new, start))
+        # The suffixes are the same, so measure the stops from the end of the texts
+        suffix = min(
+            len(old) - _widen_stop(old, old_stop), 
+            len(new) - _widen_stop(new, new_stop), 
+        )
+        span = start_, len(old) - suffix, len(new) - suffix
+        if span == (start, old_stop, new_stop):
+            return span
+        start, old_stop, new_stop = span
+
+
+def _iter_refs(result: dict[str, Counter]):
+    for refset in result.values():
+        yield from refset
+
+
+class ReferenceGraph:
+    """The reference relationship between files (in bookpaths).
+
+    - `ref_to_refby` maps a file to the references it makes,
+      which is a dict of {reference type: Counter of referenced files};
+    - `refby_to_ref` maps a file to the set of files that reference it.
+
+    Updates are applied as deltas, so only the changed edges touch the
+    reverse index. A file whose content digest is unchanged is skipped, and
+    for large files (of `incremental_mimes`) only the changed region of the
+    text is re-analyzed.
+    """
+    def __init__(
+        self, 
+        analyze: Callable[[str, str, str], dict[str, Counter]], 
+        incremental_mimes: Collection[str] = (), 
+    ):
+        self.analyze = analyze
+        self.incremental_mimes = incremental_mimes
+        self.ref_to_refby: dict[str, dict[str, Counter]] = {}
+        self.refby_to_ref: defaultdict[str, set[str]] = defaultdict(set)
+        self.digests: dict[str, bytes] = {}
+        self.texts: dict[str, str] = {}
+        # Increase by 1 whenever the graph is changed
+        self.version: int = 0
+
+    def __contains__(self, bookpath: str) -> bool:
+        return bookpath in self.ref_to_refby
+
+    def _link(self, bookpath: str, refs):
+        refby_to_ref = self.refby_to_ref
+        for ref in refs:
+            refby_to_ref[ref].add(bookpath)
+
+    def _unlink(self, bookpath: str, refs):
+        refby_to_ref = self.refby_to_ref
+        for ref in refs:
+            refset = refby_to_ref.get(ref)
+            if refset is not None:
+                refset.discard(bookpath)
+                if not refset:
+                    del refby_to_ref[ref]
+
+    def _still_refers(self, result: dict[str, Counter], ref: str) -> bool:
+        return any(ref in refset for refset in result.values())
+
+    def set(
+        self, 
+        bookpath: str, 
+        result: dict[str, Counter], 
+        digest: Optional[bytes] = None, 
+        text: Optional[str] = None, 
+    ):
+        """Replace the references made by `bookpath`, only the changed edges are updated.
+        If `text` (which `result` comes from) is given, keep it for the next incremental update."""
+        old = self.ref_to_refby.get(bookpath)
+        self.ref_to_refby[bookpath] = result
+        if digest is not None:
+            self.digests[bookpath] = digest
+        if text is not None:
+            self.texts[bookpath] = text
+        if old is None:
+            self._link(bookpath, _iter_refs(result))
+        else:
+            old_refs = set(_iter_refs(old))
+            new_refs = set(_iter_refs(result))
+            self._unlink(bookpath, old_refs - new_refs)
+            self._link(bookpath, new_refs - old_refs)
+        self.version += 1
+
+    def apply_delta(
+        self, 
+        bookpath: str, 
+        removed: dict[str, Counter], 
+        added: dict[str, Counter], 
+    ):
+        "Apply the changes of references made by `bookpath`."
+        result = self.ref_to_refby.setdefault(bookpath, {})
+        unlinked = []
+        for key, refset in removed.items():
+            counter = result.get(key)
+            if counter is None:
+                continue
+            for ref, n in refset.items():
+                if counter[ref] <= n:
+                    del counter[ref]
+                    unlinked.append(ref)
+                else:
+                    counter[ref] -= n
+        linked = []
+        for key, refset in added.items():
+            counter = result.setdefault(key, Counter())
+            for ref, n in refset.items():
+                if ref not in counter:
+                    linked.append(ref)
+                counter[ref] += n
+        self._unlink(bookpath, (
+            ref for ref in unlinked if not self._still_refers(result, ref)))
+        self._link(bookpath, linked)
+        self.version += 1
+
+    def update(
+        self, 
+        bookpath: str, 
+        text: str, 
+        mime: str, 
+        digest: Optional[bytes] = None, 
+    ) -> bool:
+        """Analyze the (new) `text` of `bookpath` and update the graph.
+
+        :return: False if the content is not changed (by `digest`), else True.
+        """
+        if digest is not None and self.digests.get(bookpath) == digest \
+                and bookpath in self.ref_to_refby:
+            return False
+        old_text = self.texts.pop(bookpath, None)
+        if len(text) >= INCREMENTAL_THRESHOLD and mime in self.incremental_mimes:
+            self.texts[bookpath] = text
+            if old_text is not None and bookpath in self.ref_to_refby:
+                start, old_stop, new_stop = _widen_span(
+                    old_text, text, *diff_span(old_text, text))
+                analyze = self.analyze
+                old_part = analyze(bookpath, old_text[start:old_stop], mime)
+                new_part = analyze(bookpath, text[start:new_stop], mime)
+                removed = {}
+                added = {}
+                for key in old_part.keys() | new_part.keys():
+                    old_refs = old_part.get(key, Counter())
+                    new_refs = new_part.get(key, Counter())
+                    removed[key] = old_refs - new_refs
+                    added[key] = new_refs - old_refs
+                self.apply_delta(bookpath, removed, added)
+                if digest is not None:
+                    self.digests[bookpath] = digest
+                return True
+        self.set(bookpath, self.analyze(bookpath, text, mime), digest)
+        return True
+
+    def discard(self, bookpath: str):
+        "Remove all the references made by `bookpath`."
+        result = self.ref_to_refby.pop(bookpath, None)
+        self.digests.pop(bookpath, None)
+        self.texts.pop(bookpath, None)
+        if result:
+            self._unlink(bookpath, set(_iter_refs(result)))
+            self.version += 1
+
+    def move(self, src_bookpath: str, dest_bookpath: str):
+        """Rename a node of the graph, with all its edges. If `dest_bookpath` is 
+        already a node (the file is overwritten), its own references are discarded, 
+        and the references to it are merged with those to `src_bookpath`."""
+        if src_bookpath == dest_bookpath:
+            return
+        ref_to_refby, refby_to_ref = self.ref_to_refby, self.refby_to_ref
+        self.discard(dest_bookpath)
+
+        result = ref_to_refby.pop(src_bookpath, None)
+        if result is not None:
+            for ref in set(_iter_refs(result)):
+                refset = refby_to_ref[ref]
+                refset.discard(src_bookpath)
+                refset.add(dest_bookpath)
+            ref_to_refby[dest_bookpath] = result
+        for d in (self.digests, self.texts):
+            if src_bookpath in d:
+                d[dest_bookpath] = d.pop(src_bookpath)
+
+        # NOTE: If `src_bookpath` references itself, it has already been renamed above.
+        refset = refby_to_ref.pop(src_bookpath, None)
+        if refset is not None:
+            for ref in refset:
+                for d in ref_to_refby[ref].values():
+                    if src_bookpath in d:
+                        d[dest_bookpath] += d.pop(src_bookpath)
+            refby_to_ref[dest_bookpath] |= refset
+        self.version += 1
+
+    def get_refby(self, bookpath: str) -> dict[str, list[tuple[str, int]]]:
+        """Get the files that reference `bookpath`.
+
+        :return: A dict of {referencing file: [(reference type, count), ...]}.
+        """
+        refby = {}
+        refset = self.refby_to_ref.get(bookpath)
+        if refset:
+            ref_to_refby = self.ref_to_refby
+            for ref in refset:
+                result = ref_to_refby[ref]
+                refby[ref] = [
+                    (key, val[bookpath])
+                    for key, val in result.items() if bookpath in val
+                ]
+        return refby
@@ -2,10 +2,9 @@
 # coding: utf-8
 
 __author__  = "ChenyangGao <https://chenyanggao.github.io/>"
-__version__ = (0, 1, 3)
+__version__ = (0, 1, 4)
 __all__ = ["watch"]
 
-# TODO: 移动文件到其他文件夹，那么这个文件所引用的那些文件，相对位置也会改变
 # TODO: 在 windows 下文件被占用时，因为 PermissionError 不可打开，是否需要等会再去尝试打开，以及尝试多少次？
 # TODO: 新增多线程或协程处理机制，加快效率，以及防止主线程崩溃
 # TODO: 对于某些需要同步的文件，由于它们是不规范的，导致崩溃，这时就要跳过
@@ -15,15 +14,18 @@ __all__ = ["watch"]
 import logging
 import os.path as syspath
 import posixpath
+import sys
 
-from collections import defaultdict, Counter
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from functools import partial
 from html import escape, unescape
-from os import stat, fsdecode
-from os.path import realpath
+from os import cpu_count, stat, fsdecode
 from re import compile as re_compile, Pattern
-from time import sleep
-from typing import Callable, Final, Optional
+from threading import RLock
+from time import perf_counter, sleep
+from typing import Any, Callable, Final, Optional
 from urllib.parse import quote, unquote, urlparse, urlunparse
 
 from watchdog.events import ( # type: ignore
@@ -31,9 +33,14 @@ from watchdog.events import ( # type: ignore
 )
 from watchdog.observers import Observer # type: ignore
 
+from util.checkpoint import OpfCheckpointer
+from util.coalesce import CoalescingEventHandler
 from util.mimetype import guess_mimetype
 from util.pathutils import reference_path, path_posix_to_sys
 from util.opfwrapper import OpfWrapper
+from util.refcache import CacheEntry, ReferenceCache
+from util.refgraph import content_digest, ReferenceGraph, INCREMENTAL_THRESHOLD
+from util.workspace import LazyWorkspace
 
 
 # Match src or href attribute in xml/html/xhtml
@@ -47,10 +54,27 @@ CRE_URL: Final[Pattern] = re_compile(
 CRE_EL_STYLE: Final[Pattern] = re_compile(r"<style\b[^>]*>(?P<text>[\s\S]+?)</style>")
 # Match style attribute in html/xhtml
 CRE_INLINE_STYLE: Final[Pattern] = re_compile(r'<[^/>][^>]*?\sstyle="(?P<attr>[^"]+)"')
+# Match <style> element or start tag in html/xhtml/xml, 
+# only the value of a style attribute in a tag may contain ">"
+CRE_HTML_TOKEN: Final[Pattern] = re_compile(
+    r'<style\b(?P<style_tag>[^>]*)>(?P<style_text>[\s\S]+?)</style>|'
+    r'<(?P<tag>[^/>](?:[^>"]+|(?<=\sstyle=)"[^"]+"|")*)')
+# Match the scheme of a url
+CRE_SCHEME: Final[Pattern] = re_compile(r"[a-zA-Z][a-zA-Z0-9+.-]*:")
+# Match src, href or style attribute in a tag (matched by `CRE_HTML_TOKEN`)
+CRE_TAG_ATTR: Final[Pattern] = re_compile(
+    r'[\s:](?:href|src)="(?P<link>[^>"]+)|\sstyle="(?P<style>[^"]+)"')
 
 
 MIME_REGISTRY = {}
 UPDATE_REGISTRY = {}
+# The media types whose analysis can be restricted to the changed region of a file, 
+# because their references never span across a ">" character (except in <style>)
+INCREMENTAL_MIMES: Final = frozenset(("text/html", "application/xhtml+xml", "application/x-dtbncx+xml"))
+# Change it whenever the analysis gives different results, to invalidate the cached references
+ANALYZER_VERSION: Final[str] = "2"
+# Do not start a process pool to scan the references, if there are fewer files than this
+PARALLEL_SCAN_THRESHOLD: Final[int] = 64
 
 
 def mime_register(*media_types):
@@ -62,11 +86,11 @@ def mime_register(*media_types):
     return register
 
 
-def updater_register(*op_types):
+def updater_register(*media_types):
     """"""
     def register(fn):
-        for op in op_types:
-            UPDATE_REGISTRY[op] = fn
+        for mime in media_types:
+            UPDATE_REGISTRY[mime] = fn
         return fn
     return register
 
@@ -79,12 +103,48 @@ def analyze(bookpath, text, mime=None):
     return handler(bookpath, text)
 
 
-def update(text, src_bookpath, dest_bookpath, refby_bookpath, typelist):
-    """"""
-    for type_, *_ in typelist:
-        text = UPDATE_REGISTRY[type_](
-            text, src_bookpath, dest_bookpath, refby_bookpath)
-    return text
+def update(text, rebase, mime):
+    """Rewrite the references in `text` (of media type `mime`) by `rebase`, 
+    see `make_rebaser`."""
+    return UPDATE_REGISTRY[mime](text, rebase)
+
+
+def scan_file(task):
+    """Read and analyze a file, which can be run in a worker process.
+
+    :param task: A tuple of (bookpath, path, media_type).
+
+    :return: A tuple of (bookpath, result, digest, text, exception), the text is 
+        only returned for a large file (for the next incremental analysis).
+    """
+    bookpath, path, mime = task
+    try:
+        data = open(path, "rb").read()
+        text = data.decode("utf-8")
+        result = analyze(bookpath, text, mime)
+    except Exception as exc:
+        return bookpath, None, None, None, exc
+    if len(text) < INCREMENTAL_THRESHOLD or mime not in INCREMENTAL_MIMES:
+        text = None
+    return bookpath, result, content_digest(data), text, None
+
+
+_last_progress_time: float = 0.
+
+
+def show_progress(done: int, total: int, end: bool = False):
+    "Show a progress indicator on the stderr (if it is a terminal)."
+    global _last_progress_time
+    if not total or not sys.stderr.isatty():
+        return
+    now = perf_counter()
+    if not end and now - _last_progress_time < 0.1:
+        return
+    _last_progress_time = now
+    sys.stderr.write("\r⏳ Scanning references: %d/%d (%.0f%%)" % (done, total, done * 100 / total))
+    if end:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
 
 
 def fileter_localpath(bookpath, hrefs):
@@ -96,155 +156,209 @@ def fileter_localpath(bookpath, hrefs):
         yield reference_path(bookpath, phref.path, "/")
 
 
+def make_resolver(bookpath: str) -> Callable[[str], Optional[str]]:
+    """Make a function to resolve a href (in `bookpath`) to the referenced bookpath, 
+    or None if it doesn't refer to a local file. Results are memoized (the fragment 
+    is irrelevant), since the same file is often referenced many times in a file."""
+    cache: dict[str, Optional[str]] = {}
+    def resolve(href: str) -> Optional[str]:
+        href = href.partition("#")[0]
+        try:
+            return cache[href]
+        except KeyError:
+            pass
+        if CRE_SCHEME.match(href):
+            ref = None
+        else:
+            phref = urlparse(href)
+            if phref.scheme or phref.path in ("", "."):
+                ref = None
+            else:
+                ref = reference_path(bookpath, phref.path, "/")
+        cache[href] = ref
+        return ref
+    return resolve
+
+
+def _count_css_urls(counter: Counter, resolve: Callable, text: str, unquote_link: bool = True):
+    for m in CRE_URL.finditer(text):
+        href = m[m.lastgroup]
+        if unquote_link:
+            href = unquote(href)
+        ref = resolve(href)
+        if ref is not None:
+            counter[ref] += 1
+
+
+def extract_refs(bookpath: str, text: str, with_style: bool = True) -> dict[str, Counter]:
+    """Extract all references of a html/xhtml/xml document in a single scan.
+
+    :param bookpath: The bookpath of the document.
+    :param text: The text of the document.
+    :param with_style: If False, only the href and src attributes are scanned.
+
+    :return: A dict of {reference type: Counter of referenced bookpaths}.
+    """
+    resolve = make_resolver(bookpath)
+    hrefs: Counter = Counter()
+    attr_styles: Counter = Counter()
+    el_styles: Counter = Counter()
+    finditer_attrs = CRE_TAG_ATTR.finditer
+    for m in CRE_HTML_TOKEN.finditer(text):
+        tag = m["tag"]
+        if tag is None:
+            tag = m["style_tag"]
+            if with_style:
+                _count_css_urls(el_styles, resolve, unescape(m["style_text"]))
+        if '="' not in tag:
+            continue
+        for m_attr in finditer_attrs(tag):
+            link = m_attr["link"]
+            if link is not None:
+                ref = resolve(unquote(link))
+                if ref is not None:
+                    hrefs[ref] += 1
+            elif with_style:
+                _count_css_urls(attr_styles, resolve, unquote(m_attr["style"]), unquote_link=False)
+    if not with_style:
+        return {"attr_href_src": hrefs}
+    return {"attr_href_src": hrefs, "attr_style": attr_styles, "el_style": el_styles}
+
+
 @mime_register("text/css")
 def analyze_css(bookpath, text):
     """"""
-    return {
-        "css": Counter(fileter_localpath(
-            bookpath, (
-                unquote(m[m.lastgroup])
-                for m in CRE_URL.finditer(text)
-            )
-        )), 
-    }
+    counter: Counter = Counter()
+    _count_css_urls(counter, make_resolver(bookpath), text)
+    return {"css": counter}
 
 
 @mime_register("text/html", "application/xhtml+xml")
 def analyze_html(bookpath, text):
     """"""
-    return {
-        "attr_href_src": Counter(fileter_localpath(
-            bookpath, (
-                unquote(m["link"])
-                for m in CRE_REF.finditer(text)
-            )
-        )), 
-        "attr_style": Counter(fileter_localpath(
-            bookpath, (
-                m[m.lastgroup]
-                for m0 in CRE_INLINE_STYLE.finditer(text)
-                for m in CRE_URL.finditer(unquote(m0["attr"]))
-            )
-        )), 
-        "el_style": Counter(fileter_localpath(
-            bookpath, (
-                unquote(m[m.lastgroup])
-                for m0 in CRE_EL_STYLE.finditer(text)
-                for m in CRE_URL.finditer(unescape(m0["text"]))
-            )
-        )), 
-    }
+    return extract_refs(bookpath, text)
 
 
 @mime_register("application/x-dtbncx+xml")
 def analyze_ncx(bookpath, text):
     """"""
-    return {
-        "attr_href_src": Counter(fileter_localpath(
-            bookpath, (
-                unquote(m["link"])
-                for m in CRE_REF.finditer(text)
-            )
-        )), 
-    }
+    return extract_refs(bookpath, text, with_style=False)
+
+
+def make_rebaser(
+    old_bookpath: str, 
+    new_bookpath: str, 
+    mapping: dict[str, str], 
+) -> tuple[Callable[[str, str], Optional[str]], dict[str, Counter]]:
+    """Make a function to rewrite the hrefs in a file, which was moved from 
+    `old_bookpath` to `new_bookpath`, and the referenced files were moved 
+    according to `mapping` (a dict of {old bookpath: new bookpath}).
+
+    :return: A tuple of (rebase, result).
+        - rebase(href, type) returns the new href, or None if it doesn't change;
+        - result collects the references after rewriting, in the same form as `analyze`.
+    """
+    resolve = make_resolver(old_bookpath)
+    new_dir = posixpath.dirname(new_bookpath) or "."
+    same_dir = new_dir == (posixpath.dirname(old_bookpath) or ".")
+    result: dict[str, Counter] = {}
+    cache: dict[str, tuple[Optional[str], Optional[str]]] = {}
+    def rebase(href: str, type_: str) -> Optional[str]:
+        try:
+            ref, href_new = cache[href]
+        except KeyError:
+            ref = resolve(href)
+            href_new = None
+            if ref is not None:
+                ref_new = mapping.get(ref, ref)
+                if ref_new != ref or not same_dir:
+                    href_new = urlunparse(urlparse(href)._replace(
+                        path=posixpath.relpath(ref_new, new_dir)))
+                ref = ref_new
+            cache[href] = ref, href_new
+        if ref is not None:
+            try:
+                result[type_][ref] += 1
+            except KeyError:
+                result[type_] = Counter((ref,))
+        return href_new
+    return rebase, result
 
 
-@updater_register("css")
-def update_css(text, src_bookpath, dest_bookpath, refby_bookpath):
+def _rebase_css_urls(text: str, rebase: Callable, type_: str, unquote_link: bool = True) -> str:
     def repl(m):
-        href = unquote(m[m.lastgroup])
-        phref = urlparse(href)
-        if phref.scheme or phref.path in ("", "."):
-            return m[0]
-        if reference_path(src_bookpath, phref.path, "/") == src_bookpath:
-            return "url('%s')" % quote(
-                urlunparse(phref._replace(path=relpath)), ":/#")
-        else:
+        href = m[m.lastgroup]
+        if unquote_link:
+            href = unquote(href)
+        href_new = rebase(href, type_)
+        if href_new is None:
             return m[0]
-
-    relpath = posixpath.relpath(dest_bookpath, posixpath.dirname(refby_bookpath))
+        return "url('%s')" % quote(href_new, ":/#")
     return CRE_URL.sub(repl, text)
 
 
-@updater_register("attr_href_src")
-def update_attr_href_src(text, src_bookpath, dest_bookpath, refby_bookpath):
+def _rebase_tag(tag: str, rebase: Callable, with_style: bool = True) -> str:
     def repl(m):
-        text = m[0]
-        href = unquote(m["link"])
-        phref = urlparse(href)
-        if phref.scheme or phref.path in ("", "."):
-            return text
-        if reference_path(src_bookpath, phref.path, "/") == src_bookpath:
-            start = m.start()
-            begin = m.start("link")
-            return text[:begin-start] + quote(urlunparse(phref._replace(path=relpath)), ":/#")
-        else:
-            return text
+        link = m["link"]
+        if link is not None:
+            href_new = rebase(unquote(link), "attr_href_src")
+            if href_new is None:
+                return m[0]
+            return m[0][:m.start("link")-m.start()] + quote(href_new, ":/#")
+        if not with_style:
+            return m[0]
+        # NOTE: The analysis unquotes the whole attribute value, but quoting it back 
+        #       would also escape the css syntax, so only the urls are unquoted here.
+        style = m["style"]
+        style_new = _rebase_css_urls(style, rebase, "attr_style")
+        if style_new == style:
+            return m[0]
+        return m[0][:m.start("style")-m.start()] + style_new + '"'
+    if '="' not in tag:
+        return tag
+    return CRE_TAG_ATTR.sub(repl, tag)
 
-    relpath = posixpath.relpath(dest_bookpath, posixpath.dirname(refby_bookpath))
-    return CRE_REF.sub(repl, text)
 
+def _rebase_style_text(text: str, rebase: Callable) -> str:
+    if "&" not in text:
+        return _rebase_css_urls(text, rebase, "el_style")
+    text_el = unescape(text)
+    text_el_new = _rebase_css_urls(text_el, rebase, "el_style")
+    if text_el_new == text_el:
+        return text
+    return escape(text_el_new, quote=False)
 
-@updater_register("attr_style")
-def update_attr_style(text, src_bookpath, dest_bookpath, refby_bookpath):
+
+def rebase_refs(text: str, rebase: Callable, with_style: bool = True) -> str:
+    """Rewrite all references of a html/xhtml/xml document, it recognizes 
+    exactly the same references as `extract_refs`."""
     def repl(m):
-        text = m[0]
-        text_attr = m["attr"]
-        text_attr_new = quote(CRE_URL.sub(sub_repl, unquote(text_attr)), ":/#")
-        if text_attr == text_attr_new:
-            return text
-        else:
-            start, stop = m.span()
-            begin, end = m.span("attr")
-            text_new = text[:begin-start] + text_attr_new
-            if end < stop:
-                text_new += text[end-stop:]
-            return text_new
-
-    def sub_repl(m):
-        href = m[m.lastgroup]
-        phref = urlparse(href)
-        if phref.scheme or phref.path in ("", "."):
-            return m[0]
-        if reference_path(src_bookpath, phref.path, "/") == src_bookpath:
-            return "url('%s')" % quote(
-                urlunparse(phref._replace(path=relpath)), ":/#")
-        else:
-            return m[0]
+        tag = m["tag"]
+        if tag is not None:
+            return "<" + _rebase_tag(tag, rebase, with_style)
+        style_text = m["style_text"]
+        if with_style:
+            style_text = _rebase_style_text(style_text, rebase)
+        return "<style%s>%s</style>" % (_rebase_tag(m["style_tag"], rebase, with_style), style_text)
+    return CRE_HTML_TOKEN.sub(repl, text)
+
+
+@updater_register("text/css")
+def update_css(text, rebase):
+    """"""
+    return _rebase_css_urls(text, rebase, "css")
 
-    relpath = posixpath.relpath(dest_bookpath, posixpath.dirname(refby_bookpath))
-    return CRE_INLINE_STYLE.sub(repl, text)
 
+@updater_register("text/html", "application/xhtml+xml")
+def update_html(text, rebase):
+    """"""
+    return rebase_refs(text, rebase)
 
-@updater_register("el_style")
-def update_el_style(text, src_bookpath, dest_bookpath, refby_bookpath):
-    def repl(m):
-        text = m[0]
-        text_el = unescape(m["text"])
-        text_el_new = CRE_URL.sub(sub_repl, text_el)
-        if text_attr == text_attr_new:
-            return text
-        else:
-            start, stop = m.span()
-            begin, end = m.span("text")
-            text_new = text[:begin-start] + escape(text_el_new)
-            if end < stop:
-                text_new += text[end-stop:]
-            return text_new
-
-    def sub_repl(m):
-        href = unquote(m[m.lastgroup])
-        phref = urlparse(href)
-        if phref.scheme or phref.path in ("", "."):
-            return m[0]
-        if reference_path(src_bookpath, phref.path, "/") == src_bookpath:
-            return 'url("%s")' % quote(
-                urlunparse(phref._replace(path=relpath)), ":/#")
-        else:
-            return m[0]
 
-    relpath = posixpath.relpath(dest_bookpath, posixpath.dirname(refby_bookpath))
-    return CRE_EL_STYLE.sub(repl, text)
+@updater_register("application/x-dtbncx+xml")
+def update_ncx(text, rebase):
+    """"""
+    return rebase_refs(text, rebase, with_style=False)
 
 
 class EpubFileEventHandler(FileSystemEventHandler):
@@ -254,11 +368,14 @@ class EpubFileEventHandler(FileSystemEventHandler):
         opfwrapper: OpfWrapper, /, 
         logger: logging.Logger = logging.getLogger(), 
         ignore: Optional[Callable[[str], bool]] = None, 
+        workspace: Optional[LazyWorkspace] = None, 
     ):
         super().__init__()
 
         self._opfwrapper: OpfWrapper = opfwrapper
         self.logger: logging.Logger = logger 
+        # The files which have not been extracted, see `util.workspace.LazyWorkspace`
+        self.workspace: Optional[LazyWorkspace] = workspace
         self.ignore: Callable[[str], bool]
         if ignore is None:
             self.ignore = lambda bookpath: False
@@ -269,17 +386,41 @@ class EpubFileEventHandler(FileSystemEventHandler):
                 else:
                     return ignore(bookpath)
             self.ignore = ignore_fn
+        # The files moved by the last directory moved event, {src_bookpath: dest_bookpath}
+        self._moved_with_dir: dict[str, str] = {}
+        # Held while processing an event, others must hold it to read the manifest consistently
+        self.lock = RLock()
+
+    def dispatch(self, event):
+        with self.lock:
+            super().dispatch(event)
 
     @property
     def opfwrapper(self) -> OpfWrapper:
         return self._opfwrapper
 
+    def is_materialized(self, bookpath: str) -> bool:
+        "Whether the file `bookpath` has just been extracted by the workspace (not by the user)."
+        return self.workspace is not None and self.workspace.owns(bookpath)
+
+    def _move_dir(self, src_bookpath: str, dest_bookpath: str) -> list[tuple[str, str]]:
+        """Move all the files under the directory `src_bookpath` in the manifest at once.
+        Return a list of the moved (src_bookpath, dest_bookpath)."""
+        opfwrapper = self._opfwrapper
+        if self.workspace is not None:
+            self.workspace.move_dir(src_bookpath, dest_bookpath)
+        src_prefix = src_bookpath.rstrip("/") + "/"
+        dest_prefix = dest_bookpath.rstrip("/") + "/"
+        for bookpath in tuple(opfwrapper.iter_dir(src_prefix)):
+            if self.ignore(dest_prefix + bookpath[len(src_prefix):]):
+                self.on_deleted(FileDeletedEvent(opfwrapper.bookpath_to_path(bookpath)))
+        return opfwrapper.move_dir(src_prefix, dest_prefix)
+
     def get_media_type(self, bookpath: str) -> str:
-        try:
-            id = self._opfwrapper.bookpath_to_id(bookpath)
-            return self._opfwrapper.id_to_media_type(id)
-        except KeyError:
+        media_type = self._opfwrapper.bookpath_to_media_type(bookpath)
+        if media_type is None:
             return guess_mimetype(bookpath) or "application/octet-stream"
+        return media_type
 
     def on_created(self, event):
         if event.is_directory:
@@ -288,12 +429,17 @@ class EpubFileEventHandler(FileSystemEventHandler):
             return
 
         opfwrapper = self._opfwrapper
-        path = realpath(event.src_path)
+        path = event.src_path
         bookpath = opfwrapper.path_to_bookpath(path)
 
         if bookpath in opfwrapper.bookpath_to_id:
             return
 
+        if self.is_materialized(bookpath):
+            self.logger.debug(
+                "Ignored created event, because it was extracted lazily: %r" % path)
+            return
+
         if self.ignore(bookpath):
             self.logger.debug(
                 "Ignored created event, because it is specified to be ignored: %r" % path)
@@ -304,7 +450,7 @@ class EpubFileEventHandler(FileSystemEventHandler):
 
     def on_deleted(self, event):
         opfwrapper = self._opfwrapper
-        path = realpath(event.src_path)
+        path = event.src_path
         bookpath = opfwrapper.path_to_bookpath(path)
         logger = self.logger
 
@@ -313,25 +459,34 @@ class EpubFileEventHandler(FileSystemEventHandler):
             logger.info("Deleted file: %r" % opfwrapper.bookpath_to_path(bookpath))
 
         if event.is_directory:
-            bookpath = bookpath.rstrip("/") + "/"
-            for subbookpath in tuple(opfwrapper.bookpath_to_id):
-                if subbookpath.startswith(bookpath):
-                    delete(subbookpath)
+            if self.workspace is not None:
+                self.workspace.discard_dir(bookpath)
+            for subbookpath in tuple(opfwrapper.iter_dir(bookpath)):
+                delete(subbookpath)
         elif bookpath in opfwrapper.bookpath_to_id:
             delete(bookpath)
 
     def on_moved(self, event):
-        if event.is_directory:
-            self.logger.debug(
-                "Ignored moved event, because it is a directory: %r -> %r" 
-                % (event.src_path, event.dest_path))
-            return
-
         opfwrapper = self._opfwrapper
-        src_path, dest_path = realpath(event.src_path), realpath(event.dest_path)
+        src_path, dest_path = event.src_path, event.dest_path
         src_bookpath = opfwrapper.path_to_bookpath(src_path)
         dest_bookpath = opfwrapper.path_to_bookpath(dest_path)
 
+        if event.is_directory:
+            moved = self._move_dir(src_bookpath, dest_bookpath)
+            if moved:
+                # NOTE: The watchdog may also emit (synthetic) moved events for the 
+                #       files in the directory, which have already been moved.
+                self._moved_with_dir = dict(moved)
+                self.logger.info("Moved directory: from %r to %r (with %d files)" 
+                                 % (src_path, dest_path, len(moved)))
+            return
+        elif self._moved_with_dir.pop(src_bookpath, None) == dest_bookpath:
+            self.logger.debug(
+                "Ignored moved event, because it was moved with the directory: %r -> %r" 
+                % (src_path, dest_path))
+            return
+
         if dest_bookpath in opfwrapper.bookpath_to_id:
             self.on_deleted(FileDeletedEvent(dest_path))
 
@@ -353,15 +508,7 @@ class EpubFileEventHandler(FileSystemEventHandler):
         src_media_type = self.get_media_type(src_bookpath)
         dest_media_type = self.get_media_type(dest_bookpath)
         if src_ext == dest_ext or src_media_type == dest_media_type:
-            id = opfwrapper.bookpath_to_id(src_bookpath)
-            src_href = opfwrapper.id_to_href(id)
-            dest_href = opfwrapper.bookpath_to_href(dest_bookpath)
-            del opfwrapper.bookpath_to_id[src_bookpath]
-            opfwrapper.bookpath_to_id[dest_bookpath] = id
-            del opfwrapper.href_to_id[src_href]
-            opfwrapper.href_to_id[dest_href] = id
-            opfwrapper.id_to_bookpath[id] = dest_bookpath
-            opfwrapper.id_to_href(id, dest_href)
+            opfwrapper.move(src_bookpath, dest_bookpath)
             dest_media_type = src_media_type
         else:
             opfwrapper.delete(bookpath=src_bookpath)
@@ -377,18 +524,109 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
         opfwrapper: OpfWrapper, /, 
         logger: logging.Logger = logging.getLogger(), 
         ignore: Optional[Callable[[str], bool]] = None, 
+        jobs: Optional[int] = None, 
+        refcache: Optional[ReferenceCache] = None, 
+        workspace: Optional[LazyWorkspace] = None, 
     ):
-        super().__init__(opfwrapper, logger, ignore)
+        super().__init__(opfwrapper, logger, ignore, workspace)
 
+        # NOTE: The pending files of the workspace have no stat until being extracted
         self._bookpath_to_stat: dict[str, int] = {
             bookpath: stat(opfwrapper.bookpath_to_path(bookpath))
             for bookpath in opfwrapper.bookpath_to_id
+            if workspace is None or not workspace.is_pending(bookpath)
         }
 
-        self._ref_to_refby = {}
-        self._refby_to_ref = defaultdict(set)
-        for bookpath in opfwrapper.bookpath_to_id:
-            self._add_ref(bookpath)
+        self._refgraph = ReferenceGraph(analyze, INCREMENTAL_MIMES)
+        self._scan_refs(jobs, refcache)
+
+        # The files moved within the current batch, see `batch`
+        self._moves: Optional[dict[str, str]] = None
+        self._move_origins: Optional[dict[str, str]] = None
+
+    def _scan_refs(
+        self, 
+        jobs: Optional[int] = None, 
+        refcache: Optional[ReferenceCache] = None, 
+    ):
+        """Analyze the references of all files in the manifest. If there are 
+        many files, the analysis is run in a process pool of `jobs` processes.
+        The files that have not changed since `refcache` was saved are skipped."""
+        start_t = perf_counter()
+        to_path = self._opfwrapper.bookpath_to_path
+        tasks = []
+        cached = 0
+        for bookpath in self._opfwrapper.bookpath_to_id:
+            mime = self.get_media_type(bookpath)
+            if mime not in MIME_REGISTRY:
+                continue
+            path = to_path(bookpath)
+            if refcache is not None and self._load_cached_ref(bookpath, path, refcache):
+                cached += 1
+            else:
+                tasks.append((bookpath, path, mime))
+        total = len(tasks)
+        if jobs is None:
+            jobs = cpu_count() or 1
+        jobs = min(jobs, total // PARALLEL_SCAN_THRESHOLD or 1)
+
+        done: set[str] = set()
+        def merge(outcome):
+            bookpath, result, digest, text, exc = outcome
+            done.add(bookpath)
+            if exc is None:
+                self._refgraph.set(bookpath, result, digest, text)
+            else:
+                self.logger.error(
+                    "Failed to analyze the references of %r, because of %r" % (bookpath, exc))
+            show_progress(len(done), total)
+
+        if jobs > 1:
+            try:
+                with ProcessPoolExecutor(jobs) as executor:
+                    chunksize = max(1, total // (jobs * 8))
+                    for outcome in executor.map(scan_file, tasks, chunksize=chunksize):
+                        merge(outcome)
+            except Exception as exc:
+                self.logger.warning(
+                    "Failed to scan the references in a process pool, because of %r, "
+                    "fall back to scanning in the current process" % exc)
+                jobs = 1
+        for task in tasks:
+            if task[0] not in done:
+                merge(scan_file(task))
+        show_progress(total, total, end=True)
+
+        self.logger.info(
+            "Scanned the references of %d files in %.3f seconds (with %d %s, %d files from the cache)" % (
+                total + cached, perf_counter() - start_t, jobs, 
+                "processes" if jobs > 1 else "process", cached))
+
+    def _load_cached_ref(self, bookpath: str, path: str, refcache: ReferenceCache) -> bool:
+        "Use the cached references of `bookpath`, if the file has not changed."
+        entry = refcache.entries.get(bookpath)
+        if entry is None or entry.size != self._bookpath_to_stat[bookpath].st_size:
+            return False
+        digest = entry.digest
+        if not refcache.trusted:
+            try:
+                digest = content_digest(open(path, "rb").read())
+            except OSError:
+                return False
+            if digest != entry.digest:
+                return False
+        self._refgraph.set(bookpath, entry.result, digest)
+        return True
+
+    def cache_entries(self) -> dict[str, CacheEntry]:
+        "The current references of all files, to be saved into a `ReferenceCache`."
+        graph = self._refgraph
+        bookpath_to_stat = self._bookpath_to_stat
+        return {
+            bookpath: CacheEntry(bookpath_to_stat[bookpath].st_size, digest, graph.ref_to_refby[bookpath])
+            for bookpath, digest in graph.digests.items()
+            if bookpath in bookpath_to_stat and bookpath in graph.ref_to_refby
+        }
 
     def is_reffile(self, bookpath):
         media_type = self.get_media_type(bookpath)
@@ -405,14 +643,16 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
             last_stat = cur_stat
         return data, last_stat
 
-    def _add_ref(self, bookpath, mime=None):
+    def _add_ref(self, bookpath, mime=None) -> bool:
+        """Analyze the references of `bookpath`, and update the reference graph 
+        (only the changed part). Return False if the content did not change."""
         if mime is None:
             mime = self.get_media_type(bookpath)
         if mime not in MIME_REGISTRY:
-            return
+            return False
         path = self._opfwrapper.bookpath_to_path(bookpath)
         try:
-            text = open(path, encoding="utf-8").read()
+            data = open(path, "rb").read()
         except FileNotFoundError:
             self.logger.error(
                 "The add_ref(bookpath=%r, mime=%r) was skipped, "
@@ -420,7 +660,7 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
                     bookpath, mime, path
                 )
             )
-            return
+            return False
         except PermissionError:
             # TODO: 在 Windows 下，新增文件过快时，文件还没复制好，就已经去读了，就会报错 PermissionError
             self.logger.error(
@@ -429,95 +669,128 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
                     bookpath, mime, path
                 )
             )
-            return
-        result = analyze(bookpath, text, mime)
-        self._ref_to_refby[bookpath] = result
-        refby_to_ref = self._refby_to_ref
-        for refset in result.values():
-            if not refset:
-                continue
-            for ref_bookpath in refset:
-                refby_to_ref[ref_bookpath].add(bookpath)
+            return False
+        text = data.decode("utf-8")
+        return self._refgraph.update(bookpath, text, mime, content_digest(data))
 
     def _delete_ref(self, bookpath, mime=None):
         if mime is None:
             mime = self.get_media_type(bookpath)
         if mime not in MIME_REGISTRY:
             return
-        result = self._ref_to_refby.pop(bookpath, None)
-        if result:
-            refby_to_ref = self._refby_to_ref
-            for refset in result.values():
-                for ref_bookpath in refset:
-                    refby_to_ref[ref_bookpath].discard(bookpath)
+        self._refgraph.discard(bookpath)
 
     def _transfer_ref(self, src_bookpath, dest_bookpath):
-        ref_to_refby, refby_to_ref = self._ref_to_refby, self._refby_to_ref
-
-        d_refby = ref_to_refby.get(src_bookpath)
-        if d_refby is not None:
-            for refset in d_refby.values():
-                for ref in refset:
-                    refby_to_ref[ref].discard(src_bookpath)
-                    refby_to_ref[ref].add(dest_bookpath)
-            ref_to_refby[dest_bookpath] = ref_to_refby.pop(src_bookpath)
-
-        refset = refby_to_ref.get(src_bookpath)
-        if refset is not None:
-            for ref in refset:
-                for d in ref_to_refby[ref].values():
-                    if src_bookpath in d:
-                        d[dest_bookpath] = d.pop(src_bookpath)
-            refby_to_ref[dest_bookpath] = refby_to_ref.pop(src_bookpath)
+        self._refgraph.move(src_bookpath, dest_bookpath)
 
     def _get_refby(self, bookpath):
-        refby = {}
-        refset = self._refby_to_ref.get(bookpath)
-        if refset:
-            ref_to_refby = self._ref_to_refby
-            for ref in refset:
-                result = ref_to_refby[ref]
-                refby[ref] = [
-                    (key, val[bookpath]) 
-                    for key, val in result.items() if bookpath in val
-                ]
-        return refby
-
-    def _update_refby(self, src_bookpath, dest_bookpath, refby):
-        if not refby:
+        return self._refgraph.get_refby(bookpath)
+
+    @contextmanager
+    def batch(self):
+        """Defer rewriting the references until all the events in this block have 
+        been processed, so that each referencing file is rewritten only once."""
+        if self._moves is not None:
+            yield
             return
+        self._moves = {}
+        self._move_origins = {}
+        try:
+            yield
+        finally:
+            moves = self._moves
+            self._moves = self._move_origins = None
+            if moves:
+                self._update_refs(moves)
+
+    def _move_dir(self, src_bookpath, dest_bookpath):
+        with self.batch():
+            moved = super()._move_dir(src_bookpath, dest_bookpath)
+            bookpath_to_stat = self._bookpath_to_stat
+            for src, dest in moved:
+                self._transfer_ref(src, dest)
+                if src in bookpath_to_stat:
+                    bookpath_to_stat[dest] = bookpath_to_stat.pop(src)
+                self._record_move(src, dest)
+        return moved
+
+    def _record_move(self, src_bookpath, dest_bookpath):
+        moves, origins = self._moves, self._move_origins
+        if moves is None:
+            self._update_refs({src_bookpath: dest_bookpath})
+            return
+        origin = origins.pop(src_bookpath, src_bookpath)
+        if origin == dest_bookpath:
+            moves.pop(origin, None)
+        else:
+            moves[origin] = dest_bookpath
+            origins[dest_bookpath] = origin
 
-        to_path = self._opfwrapper.bookpath_to_path
-
-        for refby_bookpath, typelist in refby.items():
-            if refby_bookpath == src_bookpath:
-                refby_bookpath = dest_bookpath
+    def _update_refs(self, moves: dict[str, str]):
+        """Rewrite the references in all the files affected by `moves` (a dict of 
+        {old bookpath: new bookpath}), each file is rewritten at most once. The 
+        references after rewriting are known, so the files are not re-analyzed."""
+        opfwrapper = self._opfwrapper
+        graph = self._refgraph
+        refby_to_ref = graph.refby_to_ref
+        origins = {dest: src for src, dest in moves.items()}
+
+        # NOTE: A file, which was analyzed after the referenced file was moved (but 
+        #       before the references were rewritten), still refers to the old bookpath.
+        candidates = {
+            refby_bookpath
+            for src, dest in moves.items()
+            for refby_bookpath in (*refby_to_ref.get(dest, ()), *refby_to_ref.get(src, ()))
+        }
+        candidates.update(origins)
+        to_path = opfwrapper.bookpath_to_path
+        count = 0
+        for refby_bookpath in candidates:
+            if refby_bookpath not in opfwrapper.bookpath_to_id:
+                continue
+            mime = self.get_media_type(refby_bookpath)
+            if mime not in UPDATE_REGISTRY:
+                continue
 
             refby_path = to_path(refby_bookpath)
-
             try:
                 refby_stat = stat(refby_path)
-                if refby_stat.st_mtime_ns != self._bookpath_to_stat[refby_bookpath].st_mtime_ns:
+                last_stat = self._bookpath_to_stat.get(refby_bookpath)
+                if last_stat is None or refby_stat.st_mtime_ns != last_stat.st_mtime_ns:
                     self.logger.error(
-                        "Automatic update reference %r -> %r was skipped, "
-                        "because the file %r was deleted or moved" % (
-                            src_bookpath, dest_bookpath, refby_path
-                        )
-                    )
+                        "Automatic update references in %r was skipped, "
+                        "because the file was changed by others" % refby_path)
                     continue
                 text = open(refby_path, encoding="utf-8").read()
             except FileNotFoundError:
                 self.logger.error(
-                    "Automatic update reference %r -> %r was skipped, "
-                    "because the file %r have been deleted or moved" % (
-                        src_bookpath, dest_bookpath, refby_path
-                    )
-                )
-            else:
-                text_new = update(text, src_bookpath, dest_bookpath, refby_bookpath, typelist)
-                if text != text_new:
-                    open(refby_path, "w", encoding="utf-8").write(text_new)
-                    self.on_modified(FileModifiedEvent(refby_path))
+                    "Automatic update references in %r was skipped, "
+                    "because the file have been deleted or moved" % refby_path)
+                continue
+            except UnicodeDecodeError:
+                self.logger.error(
+                    "Automatic update references in %r was skipped, "
+                    "because the file cannot be decoded" % refby_path)
+                continue
+
+            rebase, result = make_rebaser(
+                origins.get(refby_bookpath, refby_bookpath), refby_bookpath, moves)
+            text_new = update(text, rebase, mime)
+            if text_new == text:
+                graph.set(refby_bookpath, result)
+                continue
+            data = text_new.encode("utf-8")
+            open(refby_path, "wb").write(data)
+            self._bookpath_to_stat[refby_bookpath] = stat(refby_path)
+            graph.set(
+                refby_bookpath, result, content_digest(data), 
+                text_new if refby_bookpath in graph.texts else None, 
+            )
+            count += 1
+            self.logger.info("Updated references in file: %r" % refby_path)
+        if count > 1:
+            self.logger.info(
+                "Updated references in %d files, for %d moved files" % (count, len(moves)))
 
     def on_created(self, event):
         if event.is_directory:
@@ -527,7 +800,7 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
 
         opfwrapper = self._opfwrapper
         bookpath_to_stat = self._bookpath_to_stat
-        path = realpath(event.src_path)
+        path = event.src_path
         bookpath = opfwrapper.path_to_bookpath(path)
 
         try:
@@ -536,13 +809,28 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
             if self.ignore(bookpath):
                 self.logger.debug(
                     "Ignored created event, because it is specified to be ignored: %r" % path)
+            elif self.workspace is not None and bookpath in self.workspace.snapshot:
+                self.logger.debug(
+                    "Ignored created event, because it was extracted lazily and then moved: %r" % path)
             else:
                 self.logger.error(
                     "Ignored created event, maybe it was deleted or moved: %r" % path)
             return
 
+        if self.is_materialized(bookpath):
+            if bookpath in opfwrapper.bookpath_to_id:
+                bookpath_to_stat[bookpath] = bookpath_stat
+            self.logger.debug(
+                "Ignored created event, because it was extracted lazily: %r" % path)
+            return
+
         if bookpath in opfwrapper.bookpath_to_id:
-            if bookpath_stat.st_mtime_ns == bookpath_to_stat[bookpath].st_mtime_ns:
+            last_stat = bookpath_to_stat.get(bookpath)
+            if last_stat is None:
+                # Extracted lazily, but changed by the user before this event
+                self.on_modified(FileModifiedEvent(path))
+                return
+            if bookpath_stat.st_mtime_ns == last_stat.st_mtime_ns:
                 self.logger.debug(
                     "Ignored created event, because it was already created: %r" % event.src_path)
                 return
@@ -574,7 +862,7 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
 
     def on_deleted(self, event):
         opfwrapper = self._opfwrapper
-        path = realpath(event.src_path)
+        path = event.src_path
         bookpath = opfwrapper.path_to_bookpath(path)
         logger = self.logger
 
@@ -585,10 +873,10 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
             logger.info("Deleted file: %r" % opfwrapper.bookpath_to_path(bookpath))
 
         if event.is_directory:
-            bookpath = bookpath.rstrip("/") + "/"
-            for subbookpath in tuple(opfwrapper.bookpath_to_id):
-                if subbookpath.startswith(bookpath):
-                    delete(subbookpath)
+            if self.workspace is not None:
+                self.workspace.discard_dir(bookpath)
+            for subbookpath in tuple(opfwrapper.iter_dir(bookpath)):
+                delete(subbookpath)
         elif bookpath in opfwrapper.bookpath_to_id:
             delete(bookpath)
 
@@ -602,7 +890,7 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
             return
 
         opfwrapper = self._opfwrapper
-        path = realpath(event.src_path)
+        path = event.src_path
         bookpath = opfwrapper.path_to_bookpath(path)
 
         if bookpath not in opfwrapper.bookpath_to_id:
@@ -631,22 +919,33 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
                 return
             self._bookpath_to_stat[bookpath] = bookpath_stat
 
-        self._delete_ref(bookpath)
-        self._add_ref(bookpath)
-        self.logger.info("Modified file: %r" % path)
-
-    def on_moved(self, event):
-        if event.is_directory:
+        if self._add_ref(bookpath):
+            self.logger.info("Modified file: %r" % path)
+        else:
             self.logger.debug(
-                "Ignored moved event, because it is a directory: %r -> %r" 
-                % (event.src_path, event.dest_path))
-            return
+                "Ignored modified event, because its content did not change: %r" % path)
 
+    def on_moved(self, event):
         opfwrapper = self._opfwrapper
-        src_path, dest_path = realpath(event.src_path), realpath(event.dest_path)
+        src_path, dest_path = event.src_path, event.dest_path
         src_bookpath = opfwrapper.path_to_bookpath(src_path)
         dest_bookpath = opfwrapper.path_to_bookpath(dest_path)
 
+        if event.is_directory:
+            moved = self._move_dir(src_bookpath, dest_bookpath)
+            if moved:
+                # NOTE: The watchdog may also emit (synthetic) moved events for the 
+                #       files in the directory, which have already been moved.
+                self._moved_with_dir = dict(moved)
+                self.logger.info("Moved directory: from %r to %r (with %d files)" 
+                                 % (src_path, dest_path, len(moved)))
+            return
+        elif self._moved_with_dir.pop(src_bookpath, None) == dest_bookpath:
+            self.logger.debug(
+                "Ignored moved event, because it was moved with the directory: %r -> %r" 
+                % (src_path, dest_path))
+            return
+
         if dest_bookpath in opfwrapper.bookpath_to_id:
             self.on_deleted(FileDeletedEvent(dest_path))
 
@@ -668,28 +967,18 @@ class TrackingEpubFileEventHandler(EpubFileEventHandler):
         src_media_type = self.get_media_type(src_bookpath)
         dest_media_type = self.get_media_type(dest_bookpath)
         if src_ext == dest_ext or src_media_type == dest_media_type:
-            id = opfwrapper.bookpath_to_id(src_bookpath)
-            src_href = opfwrapper.id_to_href(id)
-            dest_href = opfwrapper.bookpath_to_href(dest_bookpath)
-            del opfwrapper.bookpath_to_id[src_bookpath]
-            opfwrapper.bookpath_to_id[dest_bookpath] = id
-            del opfwrapper.href_to_id[src_href]
-            opfwrapper.href_to_id[dest_href] = id
-            opfwrapper.id_to_bookpath[id] = dest_bookpath
-            opfwrapper.id_to_href(id, dest_href)
+            opfwrapper.move(src_bookpath, dest_bookpath)
             dest_media_type = src_media_type
         else:
             opfwrapper.delete(bookpath=src_bookpath)
             opfwrapper.add(bookpath=dest_bookpath, media_type=dest_media_type)
 
         self._transfer_ref(src_bookpath, dest_bookpath)
-        self._bookpath_to_stat[dest_bookpath] = self._bookpath_to_stat.pop(src_bookpath)
-        refby = self._get_refby(dest_bookpath)
-        if dest_media_type not in MIME_REGISTRY:
-            refby.pop(dest_bookpath, None)
+        if src_bookpath in self._bookpath_to_stat:
+            self._bookpath_to_stat[dest_bookpath] = self._bookpath_to_stat.pop(src_bookpath)
 
         self.logger.info("Moved file: from %r to %r" % (src_path, dest_path))
-        self._update_refby(src_bookpath, dest_bookpath, refby)
+        self._record_move(src_bookpath, dest_bookpath)
 
 
 def watch(
@@ -697,15 +986,69 @@ def watch(
     logger: logging.Logger = logging.getLogger(), 
     ignore: Optional[Callable[[str], bool]] = None,
     update_reference: bool = True, 
+    debounce: float = 0.5, 
+    jobs: Optional[int] = None, 
+    refcache: Optional[ReferenceCache] = None, 
+    checkpoint: float = 2, 
+    workspace: Optional[LazyWorkspace] = None, 
+    on_scanned: Optional[Callable[[dict[str, CacheEntry]], Any]] = None, 
 ):
-    """Monitor all events of an epub editing directory, and maintain opf continuously."""
+    """Monitor all events of an epub editing directory, and maintain opf continuously.
+
+    :param debounce: The quiet window (in seconds), the events happened within 
+        it will be merged per file before processing. If it is 0, every event 
+        will be processed immediately.
+    :param jobs: The number of processes to scan the references at startup, 
+        defaults to the number of CPUs.
+    :param refcache: The cached references (see `util.refcache.ReferenceCache`) 
+        to reuse at startup. When watching is done, the current references 
+        are staged into it.
+    :param checkpoint: The OPF file will be written in the background, after 
+        the manifest has not been changed for this many seconds. If it is 0, 
+        the OPF file is only written when watching is done.
+    :param workspace: If the files were extracted lazily (see `util.workspace.LazyWorkspace`), 
+        the pending files are extracted in the background while watching.
+    :param on_scanned: If `update_reference` is True, it will be called with 
+        the references scanned at startup (see `TrackingEpubFileEventHandler.cache_entries`), 
+        before watching.
+    """
     watchdir = opfwrapper.ebook_root
     observer = Observer()
-    handler_class = TrackingEpubFileEventHandler if update_reference else EpubFileEventHandler
-    event_handler = handler_class(opfwrapper, logger=logger, ignore=ignore)
-    observer.schedule(event_handler, watchdir, recursive=True)
+    if update_reference:
+        event_handler = TrackingEpubFileEventHandler(
+            opfwrapper, logger=logger, ignore=ignore, jobs=jobs, refcache=refcache, 
+            workspace=workspace)
+        if on_scanned is not None:
+            try:
+                on_scanned(event_handler.cache_entries())
+            except Exception as exc:
+                logger.warning("Failed to process the scanned references, because of: %r" % exc)
+    else:
+        event_handler = EpubFileEventHandler(
+            opfwrapper, logger=logger, ignore=ignore, workspace=workspace)
+    coalescer: Optional[CoalescingEventHandler] = None
+    if debounce > 0:
+        coalescer = CoalescingEventHandler(event_handler, delay=debounce, logger=logger)
+        coalescer.start()
+        observer.schedule(coalescer, watchdir, recursive=True)
+    else:
+        observer.schedule(event_handler, watchdir, recursive=True)
+    checkpointer: Optional[OpfCheckpointer] = None
+    if checkpoint > 0:
+        # NOTE: The temporary file is put in the META-INF directory, which is ignored
+        checkpointer = OpfCheckpointer(
+            opfwrapper, 
+            delay=checkpoint, 
+            lock=event_handler.lock, 
+            tempdir=opfwrapper.bookpath_to_path("META-INF"), 
+            logger=logger, 
+        )
+        checkpointer.start()
     logger.info("Watching directory: %r" % watchdir)
     observer.start()
+    if workspace is not None:
+        # NOTE: The temporary files are put in the META-INF directory, which is ignored
+        workspace.start(lock=event_handler.lock, tempdir=opfwrapper.bookpath_to_path("META-INF"))
     try:
         while True:
             sleep(0.1)
@@ -714,6 +1057,13 @@ def watch(
     finally:
         observer.stop()
         observer.join()
+        if coalescer is not None:
+            coalescer.stop()
+        if workspace is not None:
+            workspace.stop()
+        if checkpointer is not None:
+            checkpointer.stop()
+    if refcache is not None and isinstance(event_handler, TrackingEpubFileEventHandler):
+        refcache.stage(event_handler.cache_entries())
     opfwrapper.dump()
     logger.info("Done!")
-
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__  = "ChenyangGao <https://chenyanggao.github.io/>"
+__version__ = (0, 0, 1)
+__all__ = ["LazyWorkspace", "is_eager"]
+
+import logging
+import os.path as syspath
+
+from collections import OrderedDict
+from contextlib import nullcontext
+from os import link, makedirs, remove, replace, stat, PathLike
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile
+from threading import Event, Thread
+from typing import AnyStr, Callable, ContextManager, Optional
+from zipfile import ZipFile, ZipInfo
+
+from util.mimetype import guess_mimetype
+
+
+LAZY_MAIN_TYPES = ("image", "audio", "video", "font")
+LAZY_MIMES = frozenset((
+    "application/font-sfnt", "application/font-woff", "application/vnd.ms-opentype", 
+    "application/x-font-otf", "application/x-font-ttf", 
+))
+
+
+def is_eager(zinfo: ZipInfo) -> bool:
+    """Whether a member should be extracted before watching. Binary files (images,
+    fonts, audio and video) can be extracted later, others (the OPF file, the
+    container.xml, text, CSS, and any unknown files) are extracted at once."""
+    mime = guess_mimetype(zinfo.filename)
+    if not mime or mime.endswith("+xml"):
+        return True
+    return mime.partition("/")[0] not in LAZY_MAIN_TYPES and mime not in LAZY_MIMES
+
+
+class LazyWorkspace:
+    """The working directory of an EPUB file, only some members are extracted at
+    first (see `is_eager`), the others are pending, and are materialized (extracted)
+    one by one in a background thread.
+
+    The zip file is the source of truth of the pending members, if a pending member
+    is never materialized, it will be copied from the zip file when repacking (see
+    `util.ziputils.repack`). The event handlers should keep the pending members in
+    sync (see `move_dir` and `discard_dir`), and ignore the events caused by
+    materialization (see `owns`).
+
+    A member is materialized by writing it into a temporary file in `tempdir` (which
+    should be ignored by the watcher), and then hard linking it into place, so that
+    it appears completely at once, and an existing file is never overwritten.
+    """
+    def __init__(
+        self, 
+        path: AnyStr | PathLike[AnyStr], /, 
+        eager: Callable[[ZipInfo], bool] = is_eager, 
+        logger: logging.Logger = logging.getLogger(), 
+    ):
+        self.path = path
+        self.eager = eager
+        self.logger = logger
+        self.root: str = ""
+        self.tempdir: Optional[str] = None
+        # The members to be materialized, {bookpath: the zipinfo in the original zip file}
+        self.pending: OrderedDict[str, ZipInfo] = OrderedDict()
+        # The (size, mtime_ns, ino) of the extracted files, when they were extracted
+        self.snapshot: dict[str, tuple[int, int, int]] = {}
+        self.lock: ContextManager = nullcontext()
+        self._zf: Optional[ZipFile] = None
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def open(self, root: str):
+        "Extract the eager members into the directory `root`, and create all the directories."
+        self.root = root
+        zf = self._zf = ZipFile(self.path)
+        for zinfo in zf.infolist():
+            if zinfo.is_dir():
+                makedirs(self._path(zinfo.filename), exist_ok=True)
+            elif self.eager(zinfo):
+                self._record(zinfo.filename, zf.extract(zinfo, root))
+            else:
+                makedirs(syspath.dirname(self._path(zinfo.filename)), exist_ok=True)
+                self.pending[zinfo.filename] = zinfo
+        self.logger.debug("Extracted %d files, %d files are pending"
+                          % (len(self.snapshot), len(self.pending)))
+
+    def _path(self, bookpath: str) -> str:
+        return syspath.join(self.root, *bookpath.split("/"))
+
+    def _record(self, bookpath: str, path: str):
+        st = stat(path)
+        self.snapshot[bookpath] = (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def is_pending(self, bookpath: str) -> bool:
+        return bookpath in self.pending
+
+    def owns(self, bookpath: str) -> bool:
+        """Whether the file `bookpath` was materialized by this workspace, and
+        has not been changed since."""
+        snap = self.snapshot.get(bookpath)
+        if snap is None:
+            return False
+        try:
+            st = stat(self._path(bookpath))
+        except OSError:
+            return False
+        return snap == (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def move_dir(self, src_dir: str, dest_dir: str):
+        "The directory `src_dir` was moved to `dest_dir`, so do its pending members."
+        src_prefix = src_dir.rstrip("/") + "/"
+        dest_prefix = dest_dir.rstrip("/") + "/"
+        pending = self.pending
+        for bookpath in [b for b in pending if b.startswith(src_prefix)]:
+            pending[dest_prefix + bookpath[len(src_prefix):]] = pending.pop(bookpath)
+
+    def discard_dir(self, dir_: str):
+        "The directory `dir_` was deleted, so do its pending members."
+        prefix = dir_.rstrip("/") + "/"
+        pending = self.pending
+        for bookpath in [b for b in pending if b.startswith(prefix)]:
+            del pending[bookpath]
+
+    def materialize(self, bookpath: str) -> bool:
+        """Extract the pending member `bookpath`. Return False if it cannot be
+        extracted for now (e.g. its directory was moved but the watcher does not
+        know yet), it is still pending."""
+        zf = self._zf
+        zinfo = self.pending.get(bookpath)
+        if zf is None or zinfo is None:
+            return False
+        with NamedTemporaryFile(dir=self.tempdir, prefix=".materialize-", delete=False) as f:
+            try:
+                with zf.open(zinfo) as src:
+                    copyfileobj(src, f, 1 << 20)
+            except BaseException:
+                f.close()
+                remove(f.name)
+                raise
+        try:
+            with self.lock:
+                if self.pending.get(bookpath) is not zinfo:
+                    # Moved or deleted during extracting
+                    return False
+                path = self._path(bookpath)
+                try:
+                    link(f.name, path)
+                except FileExistsError:
+                    # Replaced by the user, whose file wins
+                    self.logger.debug("Skip materializing, because the file exists: %r" % path)
+                except FileNotFoundError:
+                    return False
+                except OSError:
+                    # Hard links are not supported
+                    if syspath.lexists(path):
+                        self.logger.debug("Skip materializing, because the file exists: %r" % path)
+                    else:
+                        replace(f.name, path)
+                        self._record(bookpath, path)
+                else:
+                    self._record(bookpath, path)
+                del self.pending[bookpath]
+                return True
+        finally:
+            if syspath.lexists(f.name):
+                remove(f.name)
+
+    def _run(self):
+        failed: set[str] = set()
+        while not self._stop.is_set():
+            with self.lock:
+                todo = [bookpath for bookpath in self.pending if bookpath not in failed]
+            if not todo:
+                self.logger.debug("All files have been materialized")
+                return
+            progressed = False
+            for bookpath in todo:
+                if self._stop.is_set():
+                    return
+                try:
+                    progressed = self.materialize(bookpath) or progressed
+                except Exception:
+                    # It is still pending, and will be copied when repacking
+                    self.logger.exception("Failed to materialize file: %r" % bookpath)
+                    failed.add(bookpath)
+            if not progressed:
+                self._stop.wait(0.5)
+
+    def start(self, lock: Optional[ContextManager] = None, tempdir: Optional[str] = None):
+        """Start materializing the pending members in the background.
+
+        :param lock: Held when a member is put into place, the event handlers
+            should hold it when they process events.
+        :param tempdir: Where to put the temporary files, it must be on the same
+            file system with the workspace, and should be ignored by the watcher.
+        """
+        if self._thread is not None:
+            return
+        if lock is not None:
+            self.lock = lock
+        self.tempdir = tempdir
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="LazyWorkspace", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        "Stop materializing, the remaining members are still pending."
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        if self._zf is not None:
+            self._zf.close()
+            self._zf = None
@@ -2,22 +2,220 @@
 # coding: utf-8
 
 __author__  = "ChenyangGao <https://chenyanggao.github.io/>"
-__version__ = (0, 0, 1)
-__all__ = ["zip", "unzip", "filter_zip_file"]
+__version__ = (0, 0, 2)
+__all__ = [
+    "zip", "unzip", "filter_zip_file", "snapshot", "copy_member", "repack", 
+    "ParallelZipWriter", 
+]
 
 
 import os
 import os.path as syspath
 
-from os import makedirs, walk
-from zipfile import ZipFile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from copy import copy
+from os import fsync, makedirs, remove, replace, stat, walk
+from struct import unpack, unpack_from
+from typing import Callable, Final, Iterable, Optional
+from zipfile import (
+    ZipFile, ZipInfo, BadZipFile, ZIP_DEFLATED, ZIP_STORED, ZIP64_LIMIT, 
+    sizeFileHeader, stringFileHeader, structFileHeader, 
+    _FH_SIGNATURE, _FH_FILENAME_LENGTH, _FH_EXTRA_FIELD_LENGTH, 
+)
+from zlib import compressobj, crc32, DEFLATED, Z_DEFAULT_COMPRESSION
 
 from util.pathutils import path_to_posix
 
+
+# The total size of the files being read and compressed at the same time
+MEMORY_LIMIT: Final[int] = 64 * 1024 * 1024
+
+
+def _write_member(target: ZipFile, zinfo: ZipInfo, chunks: Iterable[bytes]):
+    # Write a member whose CRC and sizes are known, `chunks` are the compressed data
+    zip64 = zinfo.file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT
+    with target._lock:
+        out = target.fp
+        zinfo.header_offset = out.tell()
+        out.write(zinfo.FileHeader(zip64))
+        for data in chunks:
+            out.write(data)
+        target.filelist.append(zinfo)
+        target.NameToInfo[zinfo.filename] = zinfo
+        target.start_dir = out.tell()
+        target._didModify = True
+
+
+def _read_compress(
+    src: str, 
+    arcname: str, 
+    compress_type: int, 
+    compresslevel: Optional[int], 
+    strict_timestamps: bool = True, 
+) -> tuple[ZipInfo, bytes]:
+    # Run in the worker threads, zlib releases the GIL when compressing
+    zinfo = ZipInfo.from_file(src, arcname, strict_timestamps=strict_timestamps)
+    with open(src, "rb") as f:
+        data = f.read()
+    zinfo.file_size = len(data)
+    zinfo.CRC = crc32(data)
+    zinfo.compress_type = compress_type
+    if compress_type == ZIP_DEFLATED:
+        zinfo._compresslevel = compresslevel
+        co = compressobj(
+            Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel, 
+            DEFLATED, 
+            -15, 
+        )
+        data = co.compress(data) + co.flush()
+    zinfo.compress_size = len(data)
+    return zinfo, data
+
+
+class ParallelZipWriter:
+    """Add files into a `ZipFile` (opened for writing), the files are read and 
+    compressed in a thread pool, and written into the archive in the order they 
+    were added, by the thread that adds them.
+
+    At most `memory_limit` bytes (by the sizes of the files) are read and 
+    compressed at the same time, a file larger than it is compressed by 
+    `ZipFile.write` (which streams), so as files in compression methods other 
+    than ZIP_STORED and ZIP_DEFLATED.
+
+    Examples::
+        with ZipFile(path, "w", ZIP_DEFLATED) as zf, ParallelZipWriter(zf) as writer:
+            writer.write("mimetype", "mimetype", ZIP_STORED)
+            writer.write("OEBPS/content.opf", "OEBPS/content.opf")
+    """
+    def __init__(
+        self, 
+        zf: ZipFile, 
+        /, 
+        workers: Optional[int] = None, 
+        memory_limit: int = MEMORY_LIMIT, 
+    ):
+        self.zf = zf
+        self.memory_limit = memory_limit
+        self._executor = ThreadPoolExecutor(workers or os.cpu_count() or 1)
+        # Items are (future, size) or a callable to be called in turn
+        self._pending: deque = deque()
+        self._inflight = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            for item in self._pending:
+                if type(item) is tuple:
+                    item[0].cancel()
+            self._pending.clear()
+            self._executor.shutdown()
+
+    def _write_next(self):
+        item = self._pending.popleft()
+        if type(item) is tuple:
+            future, size = item
+            zinfo, data = future.result()
+            self._inflight -= size
+            _write_member(self.zf, zinfo, (data,))
+        else:
+            item()
+
+    def _write_ready(self):
+        pending = self._pending
+        while pending:
+            item = pending[0]
+            if type(item) is tuple and not item[0].done():
+                break
+            self._write_next()
+
+    def _enqueue(self, item, size: int = 0):
+        pending = self._pending
+        while pending and self._inflight + size > self.memory_limit:
+            self._write_next()
+        if type(item) is tuple:
+            self._inflight += size
+        pending.append(item)
+        self._write_ready()
+
+    def write(
+        self, 
+        src: str, 
+        arcname: Optional[str] = None, 
+        compress_type: Optional[int] = None, 
+        compresslevel: Optional[int] = None, 
+    ):
+        "Add the file `src` as `arcname` (just like `ZipFile.write`)."
+        zf = self.zf
+        if arcname is None:
+            arcname = src
+        if compress_type is None:
+            compress_type = zf.compression
+        if compresslevel is None:
+            compresslevel = zf.compresslevel
+        size = stat(src).st_size
+        if compress_type in (ZIP_STORED, ZIP_DEFLATED) and size <= self.memory_limit:
+            future: Future = self._executor.submit(
+                _read_compress, src, arcname, compress_type, compresslevel, 
+                zf._strict_timestamps)
+            self._enqueue((future, size), size)
+        else:
+            self._enqueue(lambda: zf.write(src, arcname, compress_type, compresslevel))
+
+    def copy(self, source: ZipFile, zinfo: ZipInfo, arcname: Optional[str] = None):
+        "Copy the member `zinfo` of the `source` archive (see `copy_member`)."
+        self._enqueue(lambda: copy_member(source, zinfo, self.zf, arcname))
+
+    def flush(self):
+        "Write all the added files."
+        while self._pending:
+            self._write_next()
+
+
+def _walk(
+    path, 
+    ignore_dir: Optional[Callable[[str], bool]] = None, 
+    rel_index: Optional[int] = None, 
+):
+    """Like `os.walk(path)`, but do not descend into the directories for which 
+    `ignore_dir` returns True, it is called with the posix path of the directory 
+    relative to `path` (or `path[:rel_index]`), without the leading and trailing slashes."""
+    if ignore_dir is None:
+        yield from walk(path)
+        return
+    if rel_index is None:
+        rel_index = len(path)
+    for dirpath, dirnames, filenames in walk(path):
+        reldir = path_to_posix(dirpath[rel_index:]).strip("/")
+        prefix = reldir + "/" if reldir else ""
+        dirnames[:] = [d for d in dirnames if not ignore_dir(prefix + d)]
+        yield dirpath, dirnames, filenames
+
+
+def _sort_files(files: list[tuple[str, str]]):
+    # The "mimetype" file of EPUB must be the first
+    files.sort(key=lambda t: t[1] != "mimetype")
+
+
 # OR you can use shutil.make_archive
 # shutil.get_archive_formats() 可以查看支持的格式
 # shutil.make_archive(target_path, 'zip', source_path)
-def zip(path, destpath=None, makerootdir=False, ignore=None, **zipfilekwds):
+def zip(
+    path, 
+    destpath=None, 
+    makerootdir=False, 
+    ignore=None, 
+    workers: Optional[int] = None, 
+    memory_limit: int = MEMORY_LIMIT, 
+    ignore_dir: Optional[Callable[[str], bool]] = None, 
+    **zipfilekwds, 
+):
     if not syspath.exists(path):
         raise FileNotFoundError(
             f"No such file or directory: path={path!r}")
@@ -28,20 +226,27 @@ def zip(path, destpath=None, makerootdir=False, ignore=None, **zipfilekwds):
     if syspath.exists(destpath):
         raise FileExistsError(f"File exists: destpath={destpath!r}")
     path, destpath = syspath.realpath(path), syspath.realpath(destpath)
-    # TODO: 先获取文件列表，然后多线程读取本地文件，先读好的再写入zip（ZipFile.writestr），写入加锁
     with ZipFile(destpath, "w", **zipfilekwds) as zf:
         if syspath.isdir(path):
             if makerootdir:
                 rel_index = len(syspath.dirname(path))
             else:
                 rel_index = len(path)
-            for dirpath, _, filenames in walk(path):
+            files: list[tuple[str, str]] = []
+            for dirpath, _, filenames in _walk(path, ignore_dir, rel_index):
                 fpath = dirpath[rel_index:]
                 for filename in filenames:
                     src = syspath.join(dirpath, filename)
                     tgt = path_to_posix(syspath.join(fpath, filename))
                     if not ignore or ignore(tgt):
-                        zf.write(src, tgt)
+                        files.append((src, tgt.lstrip("/")))
+            _sort_files(files)
+            with ParallelZipWriter(zf, workers, memory_limit) as writer:
+                for src, arcname in files:
+                    if arcname == "mimetype":
+                        writer.write(src, arcname, ZIP_STORED)
+                    else:
+                        writer.write(src, arcname)
         else:
             zf.write(path, syspath.basename(path))
 
@@ -68,3 +273,188 @@ def filter_zip_file(source, target, predicate):
             if predicate(fileinfo):
                 target.writestr(fileinfo, source.read(fileinfo))
 
+
+
+def snapshot(
+    path, 
+    ignore_dir: Optional[Callable[[str], bool]] = None, 
+) -> dict[str, tuple[int, int, int]]:
+    """Record (size, mtime_ns, ino) of each file under the directory `path`, 
+    keyed by its posix path relative to `path`. The directories for which 
+    `ignore_dir` returns True are skipped (see `_walk()`)."""
+    path = syspath.realpath(path)
+    rel_index = len(path) + 1
+    snap = {}
+    for dirpath, _, filenames in _walk(path, ignore_dir):
+        for filename in filenames:
+            src = syspath.join(dirpath, filename)
+            try:
+                st = stat(src)
+            except OSError:
+                continue
+            snap[path_to_posix(src[rel_index:])] = (st.st_size, st.st_mtime_ns, st.st_ino)
+    return snap
+
+
+def _strip_zip64_extra(extra: bytes) -> bytes:
+    # The zip64 extra field will be regenerated if needed
+    parts = []
+    i, n = 0, len(extra)
+    while i + 4 <= n:
+        tp, ln = unpack_from("<HH", extra, i)
+        if tp != 0x0001:
+            parts.append(extra[i:i+4+ln])
+        i += 4 + ln
+    return b"".join(parts)
+
+
+def copy_member(
+    source: ZipFile, 
+    zinfo: ZipInfo, 
+    target: ZipFile, 
+    arcname: Optional[str] = None, 
+    bufsize: int = 1 << 20, 
+):
+    """Copy the member `zinfo` of the `source` archive into the `target` archive 
+    (opened for writing), as `arcname` if given, the compressed bytes are copied 
+    as is, without being decompressed and compressed again."""
+    fp = source.fp
+    fp.seek(zinfo.header_offset)
+    fheader = fp.read(sizeFileHeader)
+    if len(fheader) != sizeFileHeader:
+        raise BadZipFile("Truncated file header")
+    fheader = unpack(structFileHeader, fheader)
+    if fheader[_FH_SIGNATURE] != stringFileHeader:
+        raise BadZipFile("Bad magic number for file header")
+    fp.seek(fheader[_FH_FILENAME_LENGTH] + fheader[_FH_EXTRA_FIELD_LENGTH], 1)
+    zinfo_new = copy(zinfo)
+    # The sizes and CRC are known, so they are written in the local header, 
+    # instead of a data descriptor after the data
+    zinfo_new.flag_bits &= ~0x08
+    zinfo_new.extra = _strip_zip64_extra(zinfo.extra)
+    if arcname is not None:
+        zinfo_new.filename = zinfo_new.orig_filename = arcname
+
+    def iter_chunks():
+        remaining = zinfo.compress_size
+        while remaining:
+            data = fp.read(min(remaining, bufsize))
+            if not data:
+                raise BadZipFile("Truncated file data of member %r" % zinfo.filename)
+            yield data
+            remaining -= len(data)
+
+    _write_member(target, zinfo_new, iter_chunks())
+
+
+def _file_crc32(path, bufsize: int = 1 << 20) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while data := f.read(bufsize):
+            crc = crc32(data, crc)
+    return crc
+
+
+def repack(
+    path, 
+    destpath, 
+    source=None, 
+    snapshot: Optional[dict[str, tuple[int, int, int]]] = None, 
+    pending: Optional[dict[str, ZipInfo]] = None, 
+    ignore: Optional[Callable[[str], bool]] = None, 
+    ignore_dir: Optional[Callable[[str], bool]] = None, 
+    overwrite: bool = False, 
+    compression: int = ZIP_DEFLATED, 
+    compresslevel: Optional[int] = None, 
+    workers: Optional[int] = None, 
+    memory_limit: int = MEMORY_LIMIT, 
+) -> tuple[int, int]:
+    """Pack the directory `path` (which was extracted from the archive `source`) 
+    into `destpath`.
+
+    A file is unchanged if its (size, mtime_ns, ino) are the same as recorded in the 
+    `snapshot` (taken right after the extraction, see `snapshot()`), or if its 
+    size and CRC-32 are the same as the member's. The compressed bytes of the 
+    unchanged members are copied from `source` (see `copy_member()`), only the 
+    changed or new files are compressed (in parallel, see `ParallelZipWriter`). 
+    The "mimetype" file (of EPUB) is always the first member, and stored without 
+    compression.
+
+    The members in `pending` ({arcname: zipinfo in `source`}) have not been 
+    extracted (see `util.workspace.LazyWorkspace`), they are copied from `source` 
+    as `arcname`, unless a file at `arcname` exists, so `source` is required then.
+
+    The files for which `ignore` returns False are not packed, and the directories 
+    for which `ignore_dir` returns True are not walked into (see `_walk()`).
+
+    The archive is written into a temporary file and then renamed to `destpath`, 
+    so `destpath` can be the same as `source`, if `overwrite` is True.
+
+    :return: The numbers of the (copied, compressed) members.
+    """
+    if not syspath.isdir(path):
+        raise NotADirectoryError(f"Not a directory: path={path!r}")
+    if not overwrite and syspath.exists(destpath):
+        raise FileExistsError(f"File exists: destpath={destpath!r}")
+    if pending and not source:
+        raise ValueError(f"The pending members are copied from source, but source={source!r}")
+    if snapshot is None:
+        snapshot = {}
+    path, destpath = syspath.realpath(path), syspath.realpath(destpath)
+    rel_index = len(path)
+    files: list[tuple[str, str]] = []
+    for dirpath, _, filenames in _walk(path, ignore_dir, rel_index):
+        fpath = dirpath[rel_index:]
+        for filename in filenames:
+            src = syspath.join(dirpath, filename)
+            tgt = path_to_posix(syspath.join(fpath, filename))
+            if not ignore or ignore(tgt):
+                files.append((src, tgt.lstrip("/")))
+    _sort_files(files)
+
+    temppath = destpath + ".part"
+    copied = compressed = 0
+    try:
+        with open(temppath, "wb") as f:
+            with ExitStack() as stack:
+                if source:
+                    szf = stack.enter_context(ZipFile(source))
+                    name_to_info = szf.NameToInfo
+                else:
+                    name_to_info = {}
+                zf = stack.enter_context(
+                    ZipFile(f, "w", compression, compresslevel=compresslevel))
+                writer = stack.enter_context(ParallelZipWriter(zf, workers, memory_limit))
+                for src, arcname in files:
+                    zinfo = name_to_info.get(arcname)
+                    if zinfo is not None and not zinfo.is_dir():
+                        st = stat(src)
+                        if snapshot.get(arcname) == (st.st_size, st.st_mtime_ns, st.st_ino) or (
+                            st.st_size == zinfo.file_size and _file_crc32(src) == zinfo.CRC
+                        ):
+                            if arcname != "mimetype" or zinfo.compress_type == ZIP_STORED:
+                                writer.copy(szf, zinfo)
+                                copied += 1
+                                continue
+                    if arcname == "mimetype":
+                        writer.write(src, arcname, ZIP_STORED)
+                    else:
+                        writer.write(src, arcname)
+                    compressed += 1
+                if pending:
+                    for arcname, zinfo in pending.items():
+                        if syspath.lexists(syspath.join(path, *arcname.split("/"))):
+                            continue
+                        if not ignore or ignore("/" + arcname):
+                            writer.copy(szf, zinfo, arcname)
+                            copied += 1
+            f.flush()
+            fsync(f.fileno())
+        replace(temppath, destpath)
+    except BaseException:
+        try:
+            remove(temppath)
+        except OSError:
+            pass
+        raise
+    return copied, compressed